@@ -0,0 +1,141 @@
+"""bench_embeddings.py
+Throughput + retrieval-agreement benchmark for the SBERTEmbeddings backends.
+
+Usage:
+  python bench_embeddings.py                          # torch vs onnx-int8 on 2000 synthetic abstracts
+  python bench_embeddings.py --backends torch,onnx,onnx-int8 --docs 5000
+  python bench_embeddings.py --texts abstracts.txt --json bench_embeddings.json
+
+This script will:
+ - Encode the same corpus with every requested backend (disk cache disabled)
+ - Report documents/second for each backend
+ - Compare each backend against the first one (the baseline): mean cosine
+   similarity of the document vectors and overlap@k of the top-k results for
+   a sample of queries, i.e. how often retrieval returns the same passages
+
+The ONNX backends need `optimum[onnxruntime]` (see requirements.txt).
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import time
+from typing import Dict, List
+
+import faiss
+import numpy as np
+
+from rag_pipeline import SBERTEmbeddings
+
+
+VOCAB = (
+    "transformer attention model training dataset benchmark accuracy latency efficient lightweight "
+    "distillation pruning quantization inference sequence classification retrieval embedding gene "
+    "expression clinical cohort patients outcome protein structure graph neural network reinforcement "
+    "policy reward convolution image segmentation language translation summarization evaluation "
+    "baseline ablation parameters memory throughput robustness generalization bias fairness"
+).split()
+
+
+def synthetic_corpus(n: int, seed: int = 13) -> List[str]:
+    """Abstract-like texts of 80-160 words drawn from a fixed vocabulary."""
+    rng = random.Random(seed)
+    return [" ".join(rng.choice(VOCAB) for _ in range(rng.randint(80, 160))) for _ in range(n)]
+
+
+def encode(emb: SBERTEmbeddings, texts: List[str], batch_size: int) -> np.ndarray:
+    vectors = emb.model.encode(texts, show_progress_bar=False, batch_size=batch_size)
+    return np.asarray(vectors, dtype=np.float32)
+
+
+def top_k(corpus: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    index = faiss.IndexFlatL2(corpus.shape[1])
+    index.add(corpus)
+    return index.search(queries, k)[1]
+
+
+def main() -> int:
+    p = argparse.ArgumentParser(description="SBERTEmbeddings backend throughput + agreement benchmark")
+    p.add_argument("--backends", default="torch,onnx-int8",
+                   help="Comma-separated backends; the first is the baseline (default: torch,onnx-int8)")
+    p.add_argument("--model", default="all-MiniLM-L6-v2", help="sentence-transformers model name")
+    p.add_argument("--docs", type=int, default=2000, help="Synthetic corpus size (ignored with --texts)")
+    p.add_argument("--texts", help="Optional file with one document per line")
+    p.add_argument("--queries", type=int, default=100, help="Number of sampled queries for agreement")
+    p.add_argument("--k", type=int, default=10, help="k for overlap@k")
+    p.add_argument("--batch-size", type=int, default=32)
+    p.add_argument("--json", help="Write results to this JSON file")
+    args = p.parse_args()
+
+    if args.texts:
+        with open(args.texts, "r", encoding="utf-8") as f:
+            corpus = [line.strip() for line in f if line.strip()]
+    else:
+        corpus = synthetic_corpus(args.docs)
+    rng = random.Random(7)
+    queries = [" ".join(rng.choice(corpus).split()[:12]) for _ in range(args.queries)]
+    k = min(args.k, len(corpus))
+    print(f"📚 Corpus: {len(corpus)} documents, {len(queries)} queries, k={k}")
+
+    results: List[Dict] = []
+    baseline = None
+    for backend in [b.strip() for b in args.backends.split(",") if b.strip()]:
+        print(f"\n⚙️  Backend: {backend}")
+        try:
+            start = time.perf_counter()
+            emb = SBERTEmbeddings(args.model, cache_dir=None, lazy=False, backend=backend)
+            load_s = time.perf_counter() - start
+        except Exception as e:
+            print(f"❌ Could not load backend '{backend}': {e}")
+            continue
+
+        encode(emb, corpus[:args.batch_size], args.batch_size)  # Warm-up batch
+        start = time.perf_counter()
+        doc_vecs = encode(emb, corpus, args.batch_size)
+        encode_s = time.perf_counter() - start
+        query_vecs = encode(emb, queries, args.batch_size)
+        row = {
+            "backend": backend,
+            "load_seconds": round(load_s, 2),
+            "encode_seconds": round(encode_s, 2),
+            "docs_per_second": round(len(corpus) / encode_s, 1),
+        }
+
+        if baseline is None:
+            baseline = (doc_vecs, top_k(doc_vecs, query_vecs, k))
+            row.update(mean_cosine_vs_baseline=1.0, overlap_at_k_vs_baseline=1.0)
+        else:
+            base_vecs, base_top = baseline
+            cos = (doc_vecs * base_vecs).sum(1) / (
+                np.linalg.norm(doc_vecs, axis=1) * np.linalg.norm(base_vecs, axis=1) + 1e-12)
+            found = top_k(doc_vecs, query_vecs, k)
+            overlap = np.mean([len(set(a) & set(b)) / k for a, b in zip(found, base_top)])
+            row.update(mean_cosine_vs_baseline=round(float(cos.mean()), 4),
+                       overlap_at_k_vs_baseline=round(float(overlap), 4))
+        results.append(row)
+        print(f"   {row['docs_per_second']} docs/s, cosine vs baseline {row['mean_cosine_vs_baseline']}, "
+              f"overlap@{k} {row['overlap_at_k_vs_baseline']}")
+
+    if not results:
+        print("❌ No backend could be benchmarked.")
+        return 1
+
+    print("\n" + "=" * 78)
+    print(f"{'backend':<12}{'load s':>9}{'encode s':>10}{'docs/s':>10}{'cosine':>10}{f'overlap@{k}':>13}")
+    for r in results:
+        print(f"{r['backend']:<12}{r['load_seconds']:>9}{r['encode_seconds']:>10}{r['docs_per_second']:>10}"
+              f"{r['mean_cosine_vs_baseline']:>10}{r['overlap_at_k_vs_baseline']:>13}")
+    print("=" * 78)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"model": args.model, "docs": len(corpus), "queries": len(queries), "k": k,
+                       "results": results}, f, indent=2)
+        print(f"📊 Results written to {args.json}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,351 @@
+"""bench_rag.py
+Ingestion and query scaling benchmark for RAGPipeline.
+
+Usage:
+  python bench_rag.py                                   # 1k, 10k, 100k and 1M chunks x flat/ivf/hnsw
+  python bench_rag.py --sizes 1k,10k --modes flat,hnsw --json bench_rag.json
+  python bench_rag.py --sizes 100k --storage pq --baseline bench_rag.json
+  python bench_rag.py --embedder model --sizes 1k,10k   # real model for every chunk (slow)
+
+This script will:
+ - Generate a synthetic corpus offline: one abstract-sized paper per chunk,
+   so every size is an exact chunk count
+ - Measure embedding throughput of the real model on a sample of chunks;
+   the scaling runs use a synthetic clustered embedder with the model's
+   dimension by default, so the large runs time the pipeline (chunking,
+   dedup, index building, catalog writes) instead of hours of model encoding
+ - For every size and index mode, in a fresh temporary directory and a
+   separate process per phase: ingest with add_papers_stream, save(), then
+   load the saved index and run similarity_search queries
+ - Report add/save/load seconds, chunks/second, query p50/p95/p99, index disk
+   size and RSS: peak while ingesting, and the growth caused by loading the
+   index (rss_load_mb) and by querying it (rss_query_mb, includes pages of
+   a memory-mapped index touched by the queries)
+ - Write everything as JSON (--json) with the git commit and library
+   versions; --baseline compares against an earlier JSON run
+
+Your faiss_index/, catalog and embedding cache are not touched.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional
+
+import faiss
+import numpy as np
+
+from bench_embeddings import VOCAB
+from rag_pipeline import RAGPipeline, SBERTEmbeddings
+
+WORDS_PER_CHUNK = 40  # ~400 chars: one chunk per paper at CHUNK_SIZE = 500
+CLUSTERS = 256        # Topics of the synthetic embedder
+METRICS = ("add_seconds", "save_seconds", "load_seconds", "query_p50_ms", "query_p95_ms", "query_p99_ms",
+           "rss_load_mb", "peak_rss_ingest_mb", "disk_mb")
+
+
+def parse_size(value: str) -> int:
+    value = value.strip().lower()
+    scale = {"k": 1_000, "m": 1_000_000}.get(value[-1:], 1)
+    return int(float(value.rstrip("km")) * scale)
+
+
+def rss_mb() -> Optional[float]:
+    """Current resident set size of this process (Linux), else None."""
+    try:
+        with open("/proc/self/statm") as f:
+            return round(int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20, 1)
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def peak_rss_mb() -> Optional[float]:
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (2 ** 20 if sys.platform == "darwin" else 2 ** 10), 1)
+
+
+def synthetic_papers(n: int, seed: int = 11) -> Iterator[Dict[str, Any]]:
+    """``n`` single-chunk papers, generated lazily in blocks."""
+    vocab = np.array(VOCAB)
+    rng = np.random.default_rng(seed)
+    for start in range(0, n, 10_000):
+        words = vocab[rng.integers(0, len(vocab), size=(min(10_000, n - start), WORDS_PER_CHUNK))]
+        years = rng.integers(2005, 2026, size=len(words))
+        for offset, (row, year) in enumerate(zip(words, years)):
+            i = start + offset
+            yield {"title": f"Benchmark paper {i}", "abstract": " ".join(row), "authors": "Bench Mark",
+                   "year": int(year), "source": "arXiv", "url": f"https://example.org/{i}"}
+
+
+def synthetic_queries(n: int, seed: int = 5) -> List[str]:
+    vocab = np.array(VOCAB)
+    rng = np.random.default_rng(seed)
+    return [f"{' '.join(vocab[rng.integers(0, len(vocab), size=8)])} q{i}" for i in range(n)]
+
+
+class SyntheticEncoder:
+    """Stands in for a SentenceTransformer: clustered unit vectors from text hashes.
+
+    The first three words pick one of `CLUSTERS` topic centres and the full
+    text seeds the noise, so vectors are deterministic and queries land in
+    the same topics as the chunks they share leading words with.
+    """
+
+    def __init__(self, dim: int):
+        self.dim = dim
+        self.centres = np.random.default_rng(0).standard_normal((CLUSTERS, dim)).astype(np.float32)
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dim
+
+    def encode(self, texts: List[str], **_: Any) -> np.ndarray:
+        out = np.empty((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            topic = zlib.crc32(" ".join(text.split()[:3]).encode("utf-8")) % CLUSTERS
+            noise = np.random.default_rng(zlib.crc32(text.encode("utf-8"))).standard_normal(self.dim)
+            out[i] = self.centres[topic] + 0.6 * noise
+        return out / np.linalg.norm(out, axis=1, keepdims=True)
+
+
+class SyntheticEmbeddings(SBERTEmbeddings):
+    def __init__(self, dim: int):
+        super().__init__(cache_dir=None)
+        self.dim = dim
+
+    def load(self) -> None:
+        if self._model is None:
+            self._model = SyntheticEncoder(self.dim)
+
+
+def make_pipeline(case: Dict[str, Any], lazy: bool = True) -> RAGPipeline:
+    rag = RAGPipeline(index_mode=case["mode"], index_params={"storage": case["storage"]}, lazy=True,
+                      hybrid=case["hybrid"], semantic_cache_threshold=None)
+    if case["embedder"] == "synthetic":
+        rag.embeddings = rag.store.embeddings = SyntheticEmbeddings(case["dim"])
+    if not lazy:
+        rag.warmup()
+    return rag
+
+
+def ingest_case(case: Dict[str, Any]) -> Dict[str, Any]:
+    """Worker process: ingest ``case["size"]`` chunks and save the index."""
+    logging.basicConfig(level=logging.WARNING)
+    os.chdir(case["workdir"])
+    RAGPipeline._log_rag_operation = staticmethod(lambda *a, **kw: None)
+    rag = make_pipeline(case, lazy=False)
+    start = time.perf_counter()
+    report = rag.add_papers_stream(synthetic_papers(case["size"]), save_every=None)
+    add_s = time.perf_counter() - start
+    start = time.perf_counter()
+    rag.save()
+    rag.store.wait_for_merge()
+    save_s = time.perf_counter() - start
+    return {
+        "vectors": rag.db.index.ntotal,
+        "chunks_added": report["chunks_added"],
+        "add_seconds": round(add_s, 2),
+        "chunks_per_second": round(report["chunks_added"] / add_s, 1) if add_s else 0.0,
+        "save_seconds": round(save_s, 2),
+        "disk_mb": round(rag.store.disk_bytes() / 2 ** 20, 1),
+        "index_kind": rag.stats()["index_kind"],
+        "index_memory_mb": rag.stats()["index_memory_mb"],
+        "peak_rss_ingest_mb": peak_rss_mb(),
+    }
+
+
+def query_case(case: Dict[str, Any]) -> Dict[str, Any]:
+    """Worker process: load the saved index and time similarity_search."""
+    logging.basicConfig(level=logging.WARNING)
+    os.chdir(case["workdir"])
+    RAGPipeline._log_rag_operation = staticmethod(lambda *a, **kw: None)
+    rss_before = rss_mb()
+    rag = make_pipeline(case)
+    start = time.perf_counter()
+    rag.warmup()
+    load_s = time.perf_counter() - start
+    rss_loaded = rss_mb()
+
+    queries = synthetic_queries(case["queries"] + 1)
+    start = time.perf_counter()
+    rag.similarity_search(queries[0], k=case["k"])  # Builds BM25 / touches mapped pages
+    first_ms = (time.perf_counter() - start) * 1000
+    latencies = []
+    for q in queries[1:]:  # Distinct queries: no result cache hits
+        start = time.perf_counter()
+        rag.similarity_search(q, k=case["k"])
+        latencies.append(time.perf_counter() - start)
+    ms = np.asarray(latencies) * 1000
+    return {
+        "load_seconds": round(load_s, 2),
+        "index_load_seconds": round(rag.startup_timings.get("index_load", 0.0), 3),
+        "first_query_ms": round(first_ms, 2),
+        "query_p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "query_p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "query_p99_ms": round(float(np.percentile(ms, 99)), 3),
+        "queries_per_second": round(len(ms) / (ms.sum() / 1000), 1),
+        "rss_load_mb": round(rss_loaded - rss_before, 1) if rss_loaded and rss_before else None,
+        "rss_query_mb": round(rss_mb() - rss_before, 1) if rss_before else None,
+    }
+
+
+def run_isolated(fn, case: Dict[str, Any]) -> Dict[str, Any]:
+    # A fresh process per phase keeps RSS and page-cache state of one phase out of the next
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+        return pool.submit(fn, case).result()
+
+
+def embed_throughput(model: str, backend: str, sample: int) -> Dict[str, Any]:
+    texts = [p["abstract"] for p in synthetic_papers(sample, seed=23)]
+    try:
+        emb = SBERTEmbeddings(model, cache_dir=None, lazy=False, backend=backend)
+        dim = emb.model.get_sentence_embedding_dimension()
+        emb.embed_documents_array(texts[:32])  # Warm-up batch
+        start = time.perf_counter()
+        emb.embed_documents_array(texts)
+        seconds = time.perf_counter() - start
+    except Exception as e:
+        return {"model": model, "backend": backend, "error": f"{type(e).__name__}: {e}"}
+    return {"model": model, "backend": backend, "dim": dim, "sample_chunks": sample,
+            "chunks_per_second": round(sample / seconds, 1)}
+
+
+def git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=10,
+                             cwd=os.path.dirname(os.path.abspath(__file__)))
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def compare(results: List[Dict[str, Any]], baseline_path: str) -> None:
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = {(r["size"], r["mode"], r["storage"]): r for r in json.load(f)["results"]}
+    print(f"\n📈 Change vs {baseline_path} (negative is faster / smaller)")
+    print(f"{'size':>9} {'mode':<6}" + "".join(f"{m[:13]:>14}" for m in METRICS))
+    for r in results:
+        old = baseline.get((r["size"], r["mode"], r["storage"]))
+        if old is None or "error" in r or "error" in old:
+            continue
+        cells = []
+        for m in METRICS:
+            a, b = old.get(m), r.get(m)
+            cells.append(f"{(b - a) / a * 100:+13.1f}%" if a and b is not None else f"{'-':>14}")
+        print(f"{r['size']:>9} {r['mode']:<6}" + "".join(cells))
+
+
+def main() -> int:
+    p = argparse.ArgumentParser(description="RAGPipeline ingestion / query scaling benchmark")
+    p.add_argument("--sizes", default="1k,10k,100k,1m", help="Comma-separated chunk counts (k/m suffixes)")
+    p.add_argument("--modes", default="flat,ivf,hnsw", help="Comma-separated index modes")
+    p.add_argument("--storage", default="float32", choices=["float32", "float16", "pq"])
+    p.add_argument("--embedder", default="synthetic", choices=["synthetic", "model"],
+                   help="Vectors for the scaling runs (default: synthetic, model dimension)")
+    p.add_argument("--model", default="all-MiniLM-L6-v2", help="sentence-transformers model name")
+    p.add_argument("--backend", default="torch", choices=["torch", "onnx", "onnx-int8"])
+    p.add_argument("--embed-sample", type=int, default=2000, help="Chunks for the embedding throughput run")
+    p.add_argument("--dim", type=int, default=384, help="Synthetic vector dimension if the model cannot load")
+    p.add_argument("--queries", type=int, default=500, help="Timed queries per case")
+    p.add_argument("--k", type=int, default=5)
+    p.add_argument("--no-hybrid", action="store_true", help="Dense search only (skip BM25)")
+    p.add_argument("--workdir", help="Parent directory for case directories (default: a temporary directory)")
+    p.add_argument("--json", help="Write results to this JSON file")
+    p.add_argument("--baseline", help="Earlier --json output to compare against")
+    args = p.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    sizes = [parse_size(s) for s in args.sizes.split(",") if s.strip()]
+    modes = [m.strip() for m in args.modes.split(",") if m.strip()]
+    json_path = os.path.abspath(args.json) if args.json else None
+
+    print(f"⚙️  Embedding throughput: {args.model} ({args.backend}) on {args.embed_sample} chunks...")
+    embedding = embed_throughput(args.model, args.backend, args.embed_sample)
+    if "error" in embedding:
+        print(f"⚠️  Could not load the embedding model: {embedding['error']}")
+        if args.embedder == "model":
+            return 1
+    else:
+        print(f"   {embedding['chunks_per_second']} chunks/s, dim {embedding['dim']}")
+    dim = embedding.get("dim", args.dim)
+
+    parent = args.workdir or tempfile.mkdtemp(prefix="rag_bench_")
+    os.makedirs(parent, exist_ok=True)
+    results: List[Dict[str, Any]] = []
+    try:
+        for size in sizes:
+            for mode in modes:
+                case = {"size": size, "mode": mode, "storage": args.storage, "embedder": args.embedder,
+                        "dim": dim, "queries": args.queries, "k": args.k, "hybrid": not args.no_hybrid,
+                        "workdir": os.path.abspath(os.path.join(parent, f"{mode}_{size}"))}
+                os.makedirs(case["workdir"], exist_ok=True)
+                print(f"\n📚 {size:,} chunks, {mode} ({args.storage})")
+                row = {"size": size, "mode": mode, "storage": args.storage}
+                try:
+                    row.update(run_isolated(ingest_case, case))
+                    print(f"   add {row['add_seconds']}s ({row['chunks_per_second']} chunks/s), "
+                          f"save {row['save_seconds']}s, {row['disk_mb']} MB on disk")
+                    row.update(run_isolated(query_case, case))
+                    print(f"   load {row['load_seconds']}s, query p50/p95/p99 {row['query_p50_ms']}/"
+                          f"{row['query_p95_ms']}/{row['query_p99_ms']} ms, RSS {row['rss_query_mb']} MB")
+                    if "chunks_per_second" in embedding:
+                        row["embed_seconds_estimate"] = round(size / embedding["chunks_per_second"], 1)
+                except Exception as e:
+                    row["error"] = f"{type(e).__name__}: {e}"
+                    print(f"   ❌ {row['error']}")
+                results.append(row)
+                shutil.rmtree(case["workdir"], ignore_errors=True)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(parent, ignore_errors=True)
+
+    print("\n" + "=" * 110)
+    print(f"{'size':>9} {'mode':<6}{'add s':>9}{'chunks/s':>11}{'save s':>9}{'load s':>9}"
+          f"{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'RSS MB':>9}{'peak MB':>9}{'disk MB':>9}")
+    for r in results:
+        if "error" in r:
+            print(f"{r['size']:>9} {r['mode']:<6}  {r['error']}")
+            continue
+        print(f"{r['size']:>9} {r['mode']:<6}{r['add_seconds']:>9}{r['chunks_per_second']:>11}{r['save_seconds']:>9}"
+              f"{r['load_seconds']:>9}{r['query_p50_ms']:>9}{r['query_p95_ms']:>9}{r['query_p99_ms']:>9}"
+              f"{str(r['rss_query_mb']):>9}{str(r['peak_rss_ingest_mb']):>9}{r['disk_mb']:>9}")
+    print("=" * 110)
+
+    if json_path:
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "git_commit": git_commit(),
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "python": platform.python_version(),
+                "faiss": getattr(faiss, "__version__", None),
+                "cpu_count": os.cpu_count(),
+                "embedder": args.embedder,
+                "embedding": embedding,
+                "hybrid": not args.no_hybrid,
+                "queries": args.queries,
+                "k": args.k,
+                "results": results,
+            }, f, indent=2)
+        print(f"📊 Results written to {json_path}")
+    if args.baseline:
+        compare(results, args.baseline)
+    return 1 if any("error" in r for r in results) else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
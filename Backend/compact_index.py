@@ -0,0 +1,59 @@
+"""compact_index.py
+Compact the persistent FAISS index (garbage-collect dead chunks).
+
+Usage:
+  python compact_index.py --dry-run          # report what would be removed
+  python compact_index.py                    # compact faiss_index/ in place
+  python compact_index.py --keep-orphans --json compaction.json
+
+This script will:
+ - Load the index and paper catalog from the current directory
+ - Drop the legacy "Initial document" placeholder, positions without a
+   document, duplicate chunks and chunks of papers missing from the catalog
+ - Rebuild the index with the remaining chunks, write it as a new base and
+   delete the superseded files (see RAGPipeline.compact)
+ - Print vector counts and index memory / disk size before and after
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+
+from rag_pipeline import INDEX_DIR, RAGPipeline
+
+
+def main() -> int:
+    p = argparse.ArgumentParser(description="Compact the RAG FAISS index")
+    p.add_argument("--dry-run", action="store_true", help="Only report what would be removed")
+    p.add_argument("--keep-orphans", action="store_true",
+                   help="Keep chunks whose paper is missing from the catalog")
+    p.add_argument("--json", help="Write the report to this JSON file")
+    args = p.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+    # Checked before loading: RAGPipeline creates an empty index when none exists
+    if not os.path.exists(INDEX_DIR):
+        print("❌ No index found in this directory.")
+        return 1
+    rag = RAGPipeline(lazy=False)
+
+    report = rag.compact(drop_orphans=not args.keep_orphans, dry_run=args.dry_run)
+
+    print("\n" + "=" * 60)
+    print("🧹 Index compaction" + (" (dry run)" if args.dry_run else ""))
+    print("=" * 60)
+    for key, value in report.items():
+        print(f"{key:<32}{value}")
+    print("=" * 60)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"📊 Report written to {args.json}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
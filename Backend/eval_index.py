@@ -0,0 +1,253 @@
+"""eval_index.py
+Recall-versus-latency evaluation of FAISS index configurations on your corpus.
+
+Usage:
+  python eval_index.py                               # sweep flat/ivf/hnsw x float32/float16/pq, k=10
+  python eval_index.py --kinds ivf --nprobe 1,4,16,64 --json eval_index.json
+  python eval_index.py --kinds hnsw,ivf --storage pq --pq-m 16,32,48 --rescore --target-recall 0.98
+
+This script will:
+ - Load the persisted index from the current directory (the papers in your
+   catalog) and take the full-precision vector of every chunk
+ - Load the stored query set (--queries, default eval_queries.json), or
+   create it once from paper titles and chunk openings so later runs and
+   versions are measured on the same queries
+ - Compute the exact top-k of every query by brute force (ground truth)
+ - Build each index layout / storage combination once and sweep its
+   query-time parameters (IVF nprobe, HNSW efSearch; PQ size per build),
+   optionally with exact re-scoring of quantized candidates
+ - Report recall@k, per-query latency (p50/p95), index memory (as in
+   RAGPipeline.stats()) and, with re-scoring, the float32 vectors it
+   reads, for every configuration; mark the Pareto-optimal ones and suggest the fastest
+   configuration reaching --target-recall as ANN_INDEX_PARAMS settings
+
+Your index is only read; candidate indexes are built in memory.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import random
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import faiss
+import numpy as np
+
+from rag_pipeline import ANN_INDEX_PARAMS, INDEX_DIR, RAGPipeline, build_index, configure_search, index_memory_bytes
+
+
+def int_list(value: str) -> List[int]:
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+def load_or_create_queries(path: str, rag: RAGPipeline, n: int, seed: int = 7) -> List[str]:
+    """Read the stored query set, or sample one from the corpus and store it."""
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)["queries"]
+    rng = random.Random(seed)
+    titles = sorted(rag.catalog.titles())
+    queries = rng.sample(titles, min(len(titles), n // 2))
+    ntotal = rag.db.index.ntotal
+    for pos in rng.sample(range(ntotal), min(ntotal, n - len(queries))):
+        queries.append(" ".join(rag._doc_at(pos).page_content.split()[:12]))
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"created": time.strftime("%Y-%m-%dT%H:%M:%S"), "corpus_vectors": ntotal,
+                   "queries": queries}, f, indent=2)
+    print(f"📝 Stored {len(queries)} evaluation queries in {path}")
+    return queries
+
+
+def candidate_builds(args: argparse.Namespace, n: int, d: int) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """``(kind, params)`` for every index build in the sweep that fits the corpus."""
+    for kind in args.kinds:
+        for storage in args.storage:
+            pq_sizes = [m for m in args.pq_m if d % m == 0] if storage == "pq" else [None]
+            if storage == "pq" and n < 2 ** ANN_INDEX_PARAMS["pq_nbits"]:
+                print(f"⚠️  Skipping {kind}/pq: PQ training needs {2 ** ANN_INDEX_PARAMS['pq_nbits']} vectors")
+                continue
+            if kind == "ivf" and n < 39:
+                print("⚠️  Skipping ivf: the corpus is too small to train IVF cells")
+                continue
+            for pq_m in pq_sizes:
+                for hnsw_m in (args.hnsw_m if kind == "hnsw" else [None]):
+                    params = {**ANN_INDEX_PARAMS, "storage": storage}
+                    if pq_m:
+                        params["pq_m"] = pq_m
+                    if hnsw_m:
+                        params["hnsw_m"] = hnsw_m
+                    yield kind, params
+
+
+def search_settings(kind: str, index: "faiss.Index", args: argparse.Namespace) -> List[Dict[str, int]]:
+    if kind == "ivf":
+        nlist = faiss.extract_index_ivf(index).nlist
+        return [{"nprobe": p} for p in args.nprobe if p <= nlist] or [{"nprobe": nlist}]
+    if kind == "hnsw":
+        return [{"ef_search": ef} for ef in args.ef_search]
+    return [{}]
+
+
+def measure(index: "faiss.Index", queries: np.ndarray, truth: np.ndarray, k: int,
+            exact: Optional[np.ndarray] = None, factor: int = 1) -> Dict[str, float]:
+    """Search one query at a time (as the agents do); ``exact`` enables re-scoring."""
+    fetch_k = min(k * factor, index.ntotal)
+    latencies, hits = [], 0
+    for q, t in zip(queries, truth):
+        start = time.perf_counter()
+        _, ids = index.search(q[None, :], fetch_k)
+        ids = ids[0][ids[0] != -1]
+        if exact is not None and len(ids) > k:
+            dist = ((exact[ids] - q) ** 2).sum(axis=1)
+            ids = ids[np.argsort(dist)[:k]]
+        latencies.append(time.perf_counter() - start)
+        hits += len(set(t) & set(ids[:k].tolist()))
+    ms = np.asarray(latencies) * 1000
+    return {
+        "recall": round(hits / float(len(queries) * k), 4),
+        "p50_ms": round(float(np.percentile(ms, 50)), 4),
+        "p95_ms": round(float(np.percentile(ms, 95)), 4),
+    }
+
+
+def total_memory_mb(row: Dict[str, Any]) -> float:
+    return row["memory_mb"] + row["rescore_mb"]
+
+
+def pareto(rows: List[Dict[str, Any]]) -> None:
+    """Mark rows not dominated in (recall up, p50 latency down, memory incl. rescore vectors down)."""
+    for r in rows:
+        r["pareto"] = not any(
+            o["recall"] >= r["recall"] and o["p50_ms"] <= r["p50_ms"] and total_memory_mb(o) <= total_memory_mb(r)
+            and (o["recall"] > r["recall"] or o["p50_ms"] < r["p50_ms"] or total_memory_mb(o) < total_memory_mb(r))
+            for o in rows
+        )
+
+
+def describe(row: Dict[str, Any]) -> str:
+    parts = [row["kind"], row["storage"]]
+    for key in ("pq_m", "hnsw_m", "nlist", "nprobe", "ef_search"):
+        if row.get(key) is not None:
+            parts.append(f"{key}={row[key]}")
+    if row["rescore"]:
+        parts.append("rescore")
+    return " ".join(parts)
+
+
+def main() -> int:
+    p = argparse.ArgumentParser(description="Recall vs latency vs memory sweep over FAISS index configurations")
+    p.add_argument("--queries", default="eval_queries.json", help="Stored query set (created if missing)")
+    p.add_argument("--num-queries", type=int, default=200, help="Size of a newly created query set")
+    p.add_argument("--k", type=int, default=10, help="k for recall@k")
+    p.add_argument("--kinds", default="flat,ivf,hnsw", type=lambda v: [x.strip() for x in v.split(",") if x.strip()])
+    p.add_argument("--storage", default="float32,float16,pq",
+                   type=lambda v: [x.strip() for x in v.split(",") if x.strip()])
+    p.add_argument("--nprobe", default="1,2,4,8,16,32,64,128", type=int_list, help="IVF cells visited per query")
+    p.add_argument("--ef-search", default="16,32,64,128,256", type=int_list, help="HNSW efSearch values")
+    p.add_argument("--hnsw-m", default="16,32", type=int_list, help="HNSW graph degrees to build")
+    p.add_argument("--pq-m", default="8,16,32,48", type=int_list, help="PQ sub-quantizers (bytes per vector)")
+    p.add_argument("--rescore", action="store_true", help="Also evaluate exact re-scoring of quantized candidates")
+    p.add_argument("--target-recall", type=float, default=0.95)
+    p.add_argument("--threads", type=int, default=1, help="FAISS OpenMP threads (1 matches per-query serving)")
+    p.add_argument("--json", help="Write the table to this JSON file")
+    args = p.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    faiss.omp_set_num_threads(args.threads)
+    # Checked before loading: RAGPipeline creates an empty index when none exists
+    if not os.path.exists(INDEX_DIR):
+        print("❌ No index found in this directory.")
+        return 1
+    rag = RAGPipeline(lazy=False)
+    n = rag.db.index.ntotal
+    if not n:
+        print("❌ The index in this directory is empty; ingest papers first.")
+        return 1
+    vectors = np.ascontiguousarray(rag._all_vectors(), dtype=np.float32)
+    d = vectors.shape[1]
+    k = min(args.k, n)
+    queries = load_or_create_queries(args.queries, rag, args.num_queries)
+    query_vecs = np.ascontiguousarray(rag.embeddings.embed_queries(queries), dtype=np.float32)
+    print(f"📚 Corpus: {n} chunks (dim {d}) from {len(rag.catalog)} papers; {len(queries)} queries, k={k}")
+
+    exact_index = faiss.IndexFlatL2(d)
+    exact_index.add(vectors)
+    _, truth = exact_index.search(query_vecs, k)
+    truth = [set(t[t != -1].tolist()) for t in truth]
+
+    rows: List[Dict[str, Any]] = []
+    for kind, params in candidate_builds(args, n, d):
+        start = time.perf_counter()
+        try:
+            index = build_index(kind, vectors, params)
+        except Exception as e:
+            print(f"⚠️  Could not build {kind}/{params['storage']}: {e}")
+            continue
+        build_s = time.perf_counter() - start
+        memory_mb = round(index_memory_bytes(index) / 2 ** 20, 3)
+        base = {
+            "kind": kind,
+            "storage": params["storage"],
+            "pq_m": params["pq_m"] if params["storage"] == "pq" else None,
+            "hnsw_m": params["hnsw_m"] if kind == "hnsw" else None,
+            "nlist": faiss.extract_index_ivf(index).nlist if kind == "ivf" else None,
+            "build_seconds": round(build_s, 3),
+            "memory_mb": memory_mb,  # Index only, as RAGPipeline.stats() reports it
+        }
+        variants = [False, True] if args.rescore and params["storage"] != "float32" else [False]
+        for setting in search_settings(kind, index, args):
+            configure_search(index, {**params, **setting})
+            for rescore in variants:
+                row = {**base, "nprobe": setting.get("nprobe"), "ef_search": setting.get("ef_search"),
+                       "rescore": rescore,
+                       # Exact vectors read for re-ranking, outside the index
+                       "rescore_mb": round(vectors.nbytes / 2 ** 20, 3) if rescore else 0.0}
+                row.update(measure(index, query_vecs, truth, k, exact=vectors if rescore else None,
+                                   factor=params["rescore_k_factor"] if rescore else 1))
+                rows.append(row)
+                print(f"   {describe(row):<48} recall@{k} {row['recall']:.4f}  p50 {row['p50_ms']:.3f} ms")
+
+    if not rows:
+        print("❌ No configuration could be evaluated.")
+        return 1
+    pareto(rows)
+    rows.sort(key=lambda r: (-r["recall"], r["p50_ms"]))
+
+    print("\n" + "=" * 108)
+    print(f"{'':2}{'configuration':<48}{f'recall@{k}':>10}{'p50 ms':>10}{'p95 ms':>10}{'index MB':>11}"
+          f"{'rescore MB':>12}{'build s':>9}")
+    for r in rows:
+        print(f"{'★' if r['pareto'] else '':2}{describe(r):<48}{r['recall']:>10.4f}{r['p50_ms']:>10.3f}"
+              f"{r['p95_ms']:>10.3f}{r['memory_mb']:>11.3f}{r['rescore_mb']:>12.3f}{r['build_seconds']:>9.2f}")
+    print("=" * 108)
+    print("index MB matches RAGPipeline.stats(); rescore MB = float32 vectors read to re-rank candidates")
+    print("★ = Pareto-optimal (no other configuration is at least as good on recall, latency and index + rescore memory)")
+
+    reaching = [r for r in rows if r["recall"] >= args.target_recall]
+    best = min(reaching, key=lambda r: (r["p50_ms"], total_memory_mb(r))) if reaching else None
+    if best is None:
+        print(f"\n⚠️  No configuration reached recall@{k} >= {args.target_recall}")
+    else:
+        settings = {"storage": best["storage"], "rescore": best["rescore"]}
+        for key in ("pq_m", "hnsw_m", "nprobe", "ef_search"):  # nlist is derived from the corpus size
+            if best.get(key) is not None:
+                settings[key] = best[key]
+        print(f"\n✅ Fastest configuration with recall@{k} >= {args.target_recall}: {describe(best)}")
+        print(f'   INDEX_MODE = "{best["kind"]}"')
+        print(f"   ANN_INDEX_PARAMS.update({settings})")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"vectors": n, "dim": d, "papers": len(rag.catalog), "queries": len(queries), "k": k,
+                       "threads": args.threads, "target_recall": args.target_recall,
+                       "recommended": best, "results": rows}, f, indent=2)
+        print(f"📊 Results written to {args.json}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -120,6 +120,14 @@ class MetricsTracker:
             "timestamp": datetime.now().isoformat()
         })
     
+    def log_rag_cache_stats(self, stats: Dict[str, Any]):
+        """Record query-cache counters (hits, misses, evictions, ...) from RAGPipeline."""
+        self.metrics["rag_cache"] = dict(stats)
+    
+    def log_rag_semantic_cache_stats(self, stats: Dict[str, Any]):
+        """Record semantic (paraphrase) query-cache counters from RAGPipeline."""
+        self.metrics["rag_semantic_cache"] = dict(stats)
+    
     def log_timing(self, phase: str, duration: float):
         self.metrics["timing"][phase] = round(duration, 2)
     
@@ -137,6 +145,8 @@ class MetricsTracker:
             "total_llm_calls": len(self.metrics["llm_calls"]),
             "total_estimated_tokens": sum(call.get("estimated_input_tokens", 0) + call.get("estimated_output_tokens", 0) for call in self.metrics["llm_calls"]),
             "rag_cache_hit_rate": round(sum(1 for op in self.metrics["rag_operations"] if op.get("cache_hit", False)) / max(len(self.metrics["rag_operations"]), 1) * 100, 2),
+            "rag_cache_evictions": self.metrics.get("rag_cache", {}).get("evictions", 0),
+            "rag_semantic_cache_hit_rate": self.metrics.get("rag_semantic_cache", {}).get("hit_rate", 0.0),
             "total_errors": len(self.metrics["errors"])
         }
     
@@ -251,10 +261,13 @@ from agents import (
 )
 from tasks import create_tasks
 from tools import rag_tool, rag_tool_instance, citation_verifier_tool
-from rag_pipeline import RAGPipeline
+from rag_pipeline import RAGPipeline, dedupe_papers
+from pdf_ingestion import ingest_pdfs
 
-# Initialize global RAG
-rag_pipeline = RAGPipeline()
+# Initialize global RAG (cheap: model and index load lazily, so importing this
+# module loads nothing). Papers indexed or re-used in this run are tagged with
+# the session id, and the RAG tools search only those by default.
+rag_pipeline = RAGPipeline(session_id=metrics.metrics["session_id"])
 
 def fetch_arxiv_papers(query: str, max_results=5):
     """Fetch papers from arXiv with retry logic and rate limiting."""
@@ -282,7 +295,8 @@ def fetch_arxiv_papers(query: str, max_results=5):
                     "year": r.published.year,
                     "abstract": r.summary,
                     "source": "arXiv",
-                    "url": r.entry_id
+                    "url": r.entry_id,
+                    "doi": r.doi or ""
                 })
             duration = time.time() - start_time
             logger.info(f"Retrieved {len(papers)} papers from arXiv in {duration:.2f}s")
@@ -312,7 +326,7 @@ def fetch_semantic_scholar_papers(query: str, max_results=5):
     start_time = time.time()
     logger.info(f"Fetching papers from Semantic Scholar with query: '{query}' (max_results={max_results})")
     url = "https://api.semanticscholar.org/graph/v1/paper/search"
-    params = {"query": query, "limit": max_results, "fields": "title,authors,year,abstract,url"}
+    params = {"query": query, "limit": max_results, "fields": "title,authors,year,abstract,url,externalIds"}
     start_time = time.time()
     
     for attempt in range(MAX_RETRIES):
@@ -324,13 +338,16 @@ def fetch_semantic_scholar_papers(query: str, max_results=5):
             papers = []
             for p in data.get("data", []):
                 authors = ", ".join([a.get("name", "") for a in p.get("authors", [])])
+                external_ids = p.get("externalIds") or {}
                 papers.append({
                     "title": p.get("title", ""),
                     "authors": authors,
                     "year": p.get("year", ""),
                     "abstract": p.get("abstract", ""),
                     "source": "Semantic Scholar",
-                    "url": p.get("url", "")
+                    "url": p.get("url", ""),
+                    "doi": external_ids.get("DOI") or "",
+                    "arxiv_id": external_ids.get("ArXiv") or ""
                 })
             duration = time.time() - start_time
             logger.info(f"Retrieved {len(papers)} papers from Semantic Scholar in {duration:.2f}s")
@@ -391,13 +408,15 @@ def fetch_pubmed_papers(query: str, max_results=5):
                 abstract = article.find("AbstractText").text if article.find("AbstractText") else ""
                 pmid = article.find("PMID").text if article.find("PMID") else ""
                 url = f"https://pubmed.ncbi.nlm.nih.gov/{pmid}" if pmid else ""
+                doi = article.find("ArticleId", {"IdType": "doi"})
                 papers.append({
                     "title": title,
                     "authors": authors,
                     "year": year,
                     "abstract": abstract,
                     "source": "PubMed",
-                    "url": url
+                    "url": url,
+                    "doi": doi.text if doi else ""
                 })
             duration = time.time() - start_time
             logger.info(f"Retrieved {len(papers)} papers from PubMed in {duration:.2f}s")
@@ -451,14 +470,9 @@ def retrieve_and_index_papers(user_idea: str, domains: list):
             except Exception as e:
                 logger.error(f"Exception fetching from {source}: {e}")
     
-    # Deduplicate by title
+    # Deduplicate across sources (DOI / arXiv ID, normalized title, abstract MinHash)
     logger.info(f"Total papers fetched: {len(papers)}")
-    seen = set()
-    unique_papers = []
-    for p in papers:
-        if p["title"] not in seen:
-            seen.add(p["title"])
-            unique_papers.append(p)
+    unique_papers = dedupe_papers(papers)
     
     logger.info(f"Unique papers after deduplication: {len(unique_papers)}")
     
@@ -471,22 +485,64 @@ def retrieve_and_index_papers(user_idea: str, domains: list):
     logger.info(f"Indexing top {len(top_papers)} papers into RAG pipeline")
     for idx, paper in enumerate(top_papers, 1):
         logger.info(f"  [{idx}] {paper['title']} ({paper['year']}, {paper['source']})")
-    rag_pipeline.add_papers(top_papers)
+    ingest_report = rag_pipeline.add_papers(top_papers)
     rag_pipeline.save()
     logger.info("RAG pipeline saved successfully")
+    metrics.log_output("rag_ingestion", ingest_report)
     
     retrieval_duration = time.time() - retrieval_start
     metrics.log_timing("paper_retrieval_and_indexing", retrieval_duration)
+    for phase, duration in rag_pipeline.startup_timings.items():
+        metrics.log_timing(f"rag_startup_{phase}", duration)
     print(f"✅ Retrieved and indexed {len(top_papers)} papers in {retrieval_duration:.2f}s")
+    if ingest_report["papers_skipped"] or ingest_report["chunks_skipped"]:
+        print(f"   ♻️  {ingest_report['papers_skipped']} papers already indexed "
+              f"({ingest_report['near_duplicates']} from another source), "
+              f"{ingest_report['chunks_skipped']} duplicate chunks skipped")
     return top_papers
 
 
+def _is_pdf_upload(entry) -> bool:
+    # Only entries carrying the file itself; {"name": "x.pdf", "title": ...}
+    # metadata entries keep going through the title/abstract path below.
+    return isinstance(entry, dict) and (
+        isinstance(entry.get("content"), (bytes, bytearray))
+        or str(entry.get("path") or "").lower().endswith(".pdf")
+    )
+
+
+def index_uploaded_pdfs(files: list):
+    """Index uploaded PDFs full text, page by page, into the RAG index.
+
+    ``files`` entries carry the file bytes ({"name": ..., "content": bytes})
+    or, from the PAPER DATA JSON, a path ({"path": "paper.pdf"}).
+    """
+    if not files:
+        return None
+    logger.info(f"Indexing {len(files)} uploaded PDF(s)")
+    start = time.time()
+    report = ingest_pdfs(rag_pipeline, files)
+    duration = time.time() - start
+    metrics.log_output("pdf_ingestion", report)
+    metrics.log_timing("pdf_ingestion", duration)
+    logger.info(f"PDF ingestion: {report['papers_added']} added, {report['papers_skipped']} already indexed, "
+                f"{report['chunks_added']} chunks in {duration:.2f}s")
+    print(f"📄 Indexed {report['papers_added']} uploaded PDF(s) ({report['chunks_added']} passages) "
+          f"in {duration:.2f}s")
+    return report
+
+
 def index_uploaded_paper(paper_data: dict):
     """Index a user-uploaded paper payload of the form:
     {"paper_sections":[{"field":"Title","content":"..."},...], "uploaded_papers": [...]}
     We extract Title and Abstract when present and add to the RAG index.
+    PDF entries in uploaded_papers are indexed full text (see index_uploaded_pdfs).
     """
     logger.info("Processing uploaded paper data")
+    uploaded = paper_data.get("uploaded_papers") or []
+    index_uploaded_pdfs([f for f in uploaded if _is_pdf_upload(f)])
+    uploaded = [f for f in uploaded if not _is_pdf_upload(f)]
+
     title = None
     abstract = None
     for sec in paper_data.get("paper_sections", []):
@@ -495,9 +551,9 @@ def index_uploaded_paper(paper_data: dict):
         if sec.get("field", "").lower() == "abstract":
             abstract = sec.get("content")
 
-    if not title and paper_data.get("uploaded_papers"):
+    if not title and uploaded:
         # If uploaded_papers contains dicts with title/abstract, use first
-        first = paper_data.get("uploaded_papers")[0]
+        first = uploaded[0]
         title = title or first.get("title")
         abstract = abstract or first.get("abstract")
 
@@ -592,6 +648,9 @@ def run_analysis(user_idea: str, selected_domains: list):
     metrics.log_timing("crew_execution", crew_duration)
     metrics.log_output("final_report", str(result)[:1000])  # First 1000 chars
     metrics.log_output("final_report_length", len(str(result)))
+    metrics.log_rag_cache_stats(rag_pipeline.query_cache.stats())
+    if rag_pipeline.semantic_cache is not None:
+        metrics.log_rag_semantic_cache_stats(rag_pipeline.semantic_cache.stats())
     metrics.save_realtime(metrics_filename)
     metrics.log_output("papers_analyzed", len(papers))
     metrics.log_output("success", True)
@@ -602,6 +661,8 @@ def run_analysis(user_idea: str, selected_domains: list):
 # CLI Entry supporting JSON inputs for paper data and optional fields
 if __name__ == "__main__":
     logger.info("Starting CLI interface")
+    # Load the model and index in the background while the user answers the prompts
+    rag_pipeline.warmup(background=True)
     # Built-in defaults (used when user opts in)
     default_paper_json = {
         "paper_sections": [
@@ -0,0 +1,128 @@
+# pdf_ingestion.py
+"""Full-text ingestion of uploaded PDF papers into the RAG pipeline.
+
+Text is extracted page by page and handed to `RAGPipeline.add_papers_stream`
+as a lazily evaluated ``pages`` iterator, so each page is chunked, embedded
+and committed as it is read and every chunk keeps its page number. Large
+PDFs are parsed ahead by a small thread pool, each thread extracting a range
+of pages with its own reader, so text extraction overlaps with embedding.
+
+Threads rather than processes: the caller already runs warmup, merge and
+ingestion threads, and forking it could deadlock the children on a lock
+held by one of them, while spawned children would re-import main.py.
+"""
+import hashlib
+import io
+import logging
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from pypdf import PdfReader
+
+logger = logging.getLogger(__name__)
+
+PDF_PARALLEL_MIN_PAGES = 40   # Smaller PDFs are parsed page by page on demand
+PDF_PAGES_PER_TASK = 8        # Pages per worker task
+PDF_WORKERS = max(1, min(4, (os.cpu_count() or 1) - 1))
+
+
+def _clean_page_text(text: str) -> str:
+    # Re-join words hyphenated across line breaks and collapse layout whitespace
+    text = re.sub(r"(\w)-\n(\w)", r"\1\2", text or "")
+    return re.sub(r"[ \t]+", " ", text).strip()
+
+
+def iter_pdf_pages(data: bytes, workers: int = PDF_WORKERS,
+                   reader: Optional[PdfReader] = None) -> Iterator[Tuple[int, str]]:
+    """Yield ``(page_number, text)`` for every page, in order (1-based).
+
+    PDFs with at least `PDF_PARALLEL_MIN_PAGES` pages are split into
+    ranges of `PDF_PAGES_PER_TASK` pages and extracted ahead by ``workers``
+    threads while the caller consumes earlier pages; pages are still
+    yielded in document order.
+    """
+    reader = reader or PdfReader(io.BytesIO(data))
+    n = len(reader.pages)
+    if workers > 1 and n >= PDF_PARALLEL_MIN_PAGES:
+        local = threading.local()  # PdfReader is not thread-safe: one per thread
+
+        def _extract_range(bounds: Tuple[int, int]) -> List[Tuple[int, str]]:
+            if not hasattr(local, "reader"):
+                local.reader = PdfReader(io.BytesIO(data))
+            return [(i + 1, _clean_page_text(local.reader.pages[i].extract_text())) for i in range(*bounds)]
+
+        ranges = [(s, min(s + PDF_PAGES_PER_TASK, n)) for s in range(0, n, PDF_PAGES_PER_TASK)]
+        logger.info(f"Extracting {n} PDF pages with {workers} threads")
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pdf-extract") as pool:
+            for pages in pool.map(_extract_range, ranges):
+                yield from pages
+        return
+    for i, page in enumerate(reader.pages):
+        yield i + 1, _clean_page_text(page.extract_text())
+
+
+def _info_year(value: Any) -> Optional[int]:
+    match = re.search(r"(19|20)\d{2}", str(value or ""))
+    return int(match.group(0)) if match else None
+
+
+def pdf_paper(data: bytes, name: str = "Uploaded paper.pdf", workers: int = PDF_WORKERS,
+              **metadata: Any) -> Dict[str, Any]:
+    """Build an `add_papers_stream` paper dict for a PDF.
+
+    Title, authors and year come from ``metadata`` when given, then from
+    the PDF document info, then from the file name. The paper id is
+    derived from the file contents, so re-uploading the same PDF is a
+    no-op.
+    """
+    from rag_pipeline import paper_fingerprint  # Keep worker imports light
+
+    reader = PdfReader(io.BytesIO(data))
+    info = reader.metadata or {}
+    title = metadata.pop("title", None) or (info.get("/Title") or "").strip() \
+        or os.path.splitext(os.path.basename(name))[0]
+    return {
+        "title": title,
+        "authors": metadata.pop("authors", None) or (info.get("/Author") or "").strip() or None,
+        "year": metadata.pop("year", None) or _info_year(info.get("/CreationDate")),
+        "source": metadata.pop("source", "UserUploaded"),
+        "url": metadata.pop("url", ""),
+        "file_name": name,
+        "num_pages": len(reader.pages),
+        **metadata,
+        "paper_id": paper_fingerprint(title, hashlib.sha1(data).hexdigest()),
+        "pages": iter_pdf_pages(data, workers=workers, reader=reader),
+    }
+
+
+def ingest_pdfs(rag: Any, files: List[Dict[str, Any]], workers: int = PDF_WORKERS,
+                progress: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, int]:
+    """Index uploaded PDFs, full text, into ``rag``.
+
+    ``files`` entries are ``{"name": ..., "content": <bytes>}``; a
+    ``"path"`` key may be given instead of ``"content"``. Entries with
+    neither, and files that cannot be parsed, are logged and skipped.
+    """
+    def papers() -> Iterator[Dict[str, Any]]:
+        for f in files:
+            path = f.get("path")
+            name = f.get("name") or os.path.basename(path or "") or "Uploaded paper.pdf"
+            data = f.get("content")
+            if data is None and not path:
+                logger.warning(f"Skipping uploaded PDF '{name}': no content or path")
+                continue
+            try:
+                if data is None:
+                    with open(path, "rb") as fh:
+                        data = fh.read()
+                paper = pdf_paper(data, name, workers=workers)
+            except Exception as e:
+                logger.error(f"Could not read PDF '{name}': {e}")
+                continue
+            logger.info(f"Indexing PDF '{name}' ({paper['num_pages']} pages) as '{paper['title']}'")
+            yield paper
+
+    return rag.add_papers_stream(papers(), progress=progress)
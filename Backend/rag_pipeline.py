@@ -1,65 +1,2166 @@
 # rag_pipeline.py
 from langchain_community.vectorstores import FAISS
+from langchain_community.docstore.base import AddableMixin, Docstore
+from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain_core.documents import Document
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 import os
+import queue
+import re
 import json
+import hashlib
 import logging
+import mmap
+import shutil
+import sqlite3
+import threading
 import time
-from typing import List, Dict, Any
+import unicodedata
+import zlib
+from array import array
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from contextlib import contextmanager
+from typing import List, Dict, Any, Optional, Iterable, Iterator, Callable, Tuple, Union
 import numpy as np
+import faiss
 from sentence_transformers import SentenceTransformer
 
+try:
+    import fcntl
+except ImportError:  # Windows: manifest updates are only serialized within one process
+    fcntl = None
+
 logger = logging.getLogger(__name__)
 
+EMBEDDING_CACHE_DIR = "embedding_cache"
+
+# Embedding backend: "torch" (full precision), "onnx", or "onnx-int8"
+# (ONNX Runtime with dynamic int8 quantization). The ONNX backends need
+# `optimum[onnxruntime]`; int8 models are exported once into ONNX_MODEL_DIR.
+EMBEDDING_BACKEND = "torch"
+ONNX_MODEL_DIR = "onnx_models"
+ONNX_QUANTIZATION = "avx2"  # "arm64", "avx2", "avx512" or "avx512_vnni"
+
+
+def load_sentence_transformer(model_name: str, backend: str = EMBEDDING_BACKEND) -> SentenceTransformer:
+    """Load ``model_name`` on the requested inference backend."""
+    if backend == "torch":
+        return SentenceTransformer(model_name)
+    if backend == "onnx":
+        return SentenceTransformer(model_name, backend="onnx")
+    if backend == "onnx-int8":
+        from sentence_transformers import export_dynamic_quantized_onnx_model
+
+        local_dir = os.path.join(ONNX_MODEL_DIR, re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name))
+        file_name = f"onnx/model_qint8_{ONNX_QUANTIZATION}.onnx"
+        if not os.path.exists(os.path.join(local_dir, file_name)):
+            logger.info(f"Exporting int8 ONNX model for '{model_name}' to {local_dir}")
+            model = SentenceTransformer(model_name, backend="onnx")
+            model.save_pretrained(local_dir)
+            export_dynamic_quantized_onnx_model(model, ONNX_QUANTIZATION, local_dir)
+        return SentenceTransformer(local_dir, backend="onnx", model_kwargs={"file_name": file_name})
+    raise ValueError(f"Unknown embedding backend: {backend}")
+
+
+class EmbeddingCache:
+    """Persistent, content-addressed store of embedding vectors.
+
+    Vectors live in a single append-only binary file per model and
+    dimension. Every record is a fixed-size ``(key, vector)`` pair where
+    the key is the SHA-1 of ``model_name + text``, so the file is
+    self-describing: on open we memory-map it and rebuild the small
+    ``key -> row`` index from the key column alone. A torn trailing record
+    (e.g. from a crash mid-append) is truncated away before appending, so
+    later records stay aligned. Keys are raw 20-byte digests (``V20``:
+    an ``S20`` column would strip trailing NUL bytes from them). Several
+    processes may append: an exclusive ``flock`` on the file covers the
+    size check, truncation and write, so each row number is the one the
+    record actually landed at.
+    """
+
+    def __init__(self, model_name: str, dim: int, cache_dir: str = EMBEDDING_CACHE_DIR, dtype: str = "float32"):
+        if dtype not in ("float32", "float16"):
+            raise ValueError(f"Unsupported embedding cache dtype: {dtype}")
+        self.model_name = model_name
+        self.dim = dim
+        self._record = np.dtype([("key", "V20"), ("vec", np.dtype(dtype).newbyteorder("<"), (dim,))])
+        safe_model = re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name)
+        suffix = "f16" if dtype == "float16" else "f32"
+        os.makedirs(cache_dir, exist_ok=True)
+        self.path = os.path.join(cache_dir, f"{safe_model}_{dim}d_{suffix}.bin")
+        self._lock = threading.Lock()
+        self._rows: Dict[bytes, int] = {}
+        self._mmap: Optional[np.ndarray] = None
+        self._stale = False
+        self._load()
+
+    def key(self, text: str) -> bytes:
+        return hashlib.sha1(f"{self.model_name}\x00{text}".encode("utf-8")).digest()
+
+    @staticmethod
+    @contextmanager
+    def _file_locked(f: Any) -> Iterator[None]:
+        if fcntl is None:  # No cross-process lock; single writer assumed
+            yield
+            return
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def _truncate_torn_record(self, f: Any) -> int:
+        """Cut a partial trailing record off the open file; returns the row count."""
+        size = f.seek(0, os.SEEK_END)
+        n = size // self._record.itemsize
+        if size != n * self._record.itemsize:
+            logger.warning(f"Truncating torn record at the end of {self.path}")
+            f.truncate(n * self._record.itemsize)
+            f.seek(0, os.SEEK_END)
+        return n
+
+    def _load(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r+b") as f, self._file_locked(f):
+                n = self._truncate_torn_record(f)
+        except OSError:
+            n = os.path.getsize(self.path) // self._record.itemsize  # Read-only: appends re-check
+        if n == 0:
+            return
+        self._mmap = np.memmap(self.path, dtype=self._record, mode="r", shape=(n,))
+        self._rows = {bytes(k): i for i, k in enumerate(self._mmap["key"])}
+        logger.info(f"Embedding cache loaded - {len(self._rows)} vectors from {self.path}")
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def get_many(self, keys: List[bytes]) -> Dict[bytes, np.ndarray]:
+        """Return float32 vectors for the keys present in the cache."""
+        with self._lock:
+            if self._stale:
+                # Re-map once after appends so new rows become readable
+                n = os.path.getsize(self.path) // self._record.itemsize
+                self._mmap = np.memmap(self.path, dtype=self._record, mode="r", shape=(n,))
+                self._stale = False
+            hits = [(k, self._rows[k]) for k in keys if k in self._rows]
+            if not hits:
+                return {}
+            rows = np.fromiter((r for _, r in hits), dtype=np.int64, count=len(hits))
+            vecs = np.asarray(self._mmap["vec"][rows], dtype=np.float32)
+        return {k: vecs[i] for i, (k, _) in enumerate(hits)}
+
+    def put_many(self, keys: List[bytes], vectors: np.ndarray) -> None:
+        """Append new vectors with a single write; known keys are skipped."""
+        with self._lock:
+            fresh = [i for i, k in enumerate(keys) if k not in self._rows]
+            if not fresh:
+                return
+            records = np.empty(len(fresh), dtype=self._record)
+            records["key"] = np.frombuffer(b"".join(keys[i] for i in fresh), dtype="V20")
+            records["vec"] = vectors[fresh]
+            try:
+                with open(self.path, "ab") as f, self._file_locked(f):
+                    start = self._truncate_torn_record(f)
+                    f.write(records.tobytes())
+                    f.flush()  # Before the lock is released
+            except OSError as e:
+                # Cache persistence failures should not break ingestion
+                logger.warning(f"Could not append to embedding cache: {e}")
+                return
+            for offset, i in enumerate(fresh):
+                self._rows[keys[i]] = start + offset
+            self._stale = True
+
+
+class SBERTEmbeddings:
+    """Optimized embedding adapter using sentence-transformers with caching.
+
+    Implements the methods expected by the FAISS wrapper used in this
+    project: `embed_documents` and `embed_query`. Document vectors are
+    looked up in a persistent `EmbeddingCache` first so that abstracts
+    re-ingested across sessions are only encoded once.
+
+    With ``lazy=True`` the SentenceTransformer (and the disk cache, whose
+    layout depends on the model dimension) is loaded on first use or by
+    an explicit `load()`. ``backend`` selects torch or ONNX Runtime
+    inference (see `load_sentence_transformer`); each backend gets its
+    own disk cache since their vectors differ slightly.
+    """
+
+    def __init__(self, model_name: str = "all-MiniLM-L6-v2", cache_dir: Optional[str] = EMBEDDING_CACHE_DIR,
+                 cache_dtype: str = "float32", lazy: bool = True, backend: str = EMBEDDING_BACKEND):
+        if backend not in ("torch", "onnx", "onnx-int8"):
+            raise ValueError(f"Unknown embedding backend: {backend}")
+        self.model_name = model_name
+        self.backend = backend
+        self._model: Optional[SentenceTransformer] = None
+        self._cache_dir = cache_dir
+        self._cache_dtype = cache_dtype
+        self._load_lock = threading.Lock()
+        self._cache = {}  # Simple in-memory cache for queries
+        self.disk_cache: Optional[EmbeddingCache] = None
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.load_seconds = 0.0
+        if not lazy:
+            self.load()
+
+    @property
+    def model(self) -> SentenceTransformer:
+        if self._model is None:
+            self.load()
+        return self._model
+
+    def load(self) -> None:
+        """Load the model and open the disk cache (idempotent, thread-safe)."""
+        with self._load_lock:
+            if self._model is not None:
+                return
+            start = time.time()
+            model = load_sentence_transformer(self.model_name, self.backend)
+            if self._cache_dir:
+                try:
+                    dim = model.get_sentence_embedding_dimension()
+                    cache_name = self.model_name if self.backend == "torch" else f"{self.model_name}@{self.backend}"
+                    self.disk_cache = EmbeddingCache(cache_name, dim, cache_dir=self._cache_dir,
+                                                     dtype=self._cache_dtype)
+                except Exception as e:
+                    logger.warning(f"Persistent embedding cache disabled: {e}")
+            # Publish the model last so other threads never see it without its cache
+            self._model = model
+            self.load_seconds = time.time() - start
+            logger.info(f"Embedding model '{self.model_name}' ({self.backend}) loaded in {self.load_seconds:.2f}s")
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        return self.embed_documents_array(texts).tolist()
+
+    def embed_documents_array(self, texts: List[str]) -> np.ndarray:
+        """Embed texts as a float32 matrix, encoding only cache misses.
+
+        All misses (deduplicated) are encoded in one batched
+        `model.encode` call and appended to the disk cache.
+        """
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        self.load()
+        if self.disk_cache is None:
+            # Batch encoding for efficiency
+            emb = self.model.encode(texts, show_progress_bar=False, batch_size=32)
+            return np.asarray(emb, dtype=np.float32)
+
+        keys = [self.disk_cache.key(t) for t in texts]
+        found = self.disk_cache.get_many(keys)
+        missing: Dict[bytes, str] = {}
+        for k, t in zip(keys, texts):
+            if k not in found and k not in missing:
+                missing[k] = t
+        self.cache_hits += len(texts) - sum(1 for k in keys if k in missing)
+        self.cache_misses += len(missing)
+
+        if missing:
+            miss_keys = list(missing)
+            emb = self.model.encode([missing[k] for k in miss_keys], show_progress_bar=False, batch_size=32)
+            emb = np.asarray(emb, dtype=np.float32)
+            self.disk_cache.put_many(miss_keys, emb)
+            found.update(zip(miss_keys, emb))
+            logger.debug(f"Embedded {len(miss_keys)} new texts ({len(texts) - len(miss_keys)} from cache)")
+
+        return np.stack([found[k] for k in keys]).astype(np.float32, copy=False)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_queries([text])[0].tolist()
+
+    def embed_queries(self, texts: List[str]) -> np.ndarray:
+        """Embed several queries, encoding all in-memory cache misses in one batch."""
+        keys = [hashlib.sha1(t.encode("utf-8")).hexdigest() for t in texts]
+        missing = {k: t for k, t in zip(keys, texts) if k not in self._cache}
+        vectors = {k: self._cache[k] for k in keys if k in self._cache}
+        if missing:
+            emb = self.model.encode(list(missing.values()), show_progress_bar=False, batch_size=32)
+            for k, v in zip(missing, np.asarray(emb, dtype=np.float32)):
+                vectors[k] = v
+                # Cache the result (limit cache size)
+                if len(self._cache) < 1000:
+                    self._cache[k] = v
+        return np.stack([vectors[k] for k in keys]).astype(np.float32, copy=False)
+
+    def __call__(self, texts):
+        """Make the embeddings object callable.
+
+        - If passed a list of strings, return a list of vectors.
+        - If passed a single string, return a single vector.
+        This keeps compatibility with older/newer vectorstore expectations.
+        """
+        if texts is None:
+            return []
+        if isinstance(texts, (list, tuple)):
+            return self.embed_documents(list(texts))
+        return self.embed_query(str(texts))
+
+METADATA_STORE_PATH = "papers_metadata.json"  # Legacy JSON catalog, migrated on first run
+CATALOG_DB_PATH = "papers_catalog.sqlite"
+QUERY_CACHE_MAX_ENTRIES = 512
+QUERY_CACHE_MAX_BYTES = 32 * 2 ** 20
+QUERY_CACHE_TTL: Optional[float] = None  # Seconds; None keeps entries until evicted
+# Reworded queries ("lightweight transformer efficiency" vs "efficient
+# lightweight transformers") reuse a recent result set above this cosine
+# similarity of their embeddings, if both have the same key terms after
+# stemming. Terms in more than SEMANTIC_CACHE_GENERIC_SHARE of the indexed
+# chunks may differ; None disables the cache
+SEMANTIC_CACHE_THRESHOLD: Optional[float] = 0.9
+SEMANTIC_CACHE_MAX_ENTRIES = 256
+SEMANTIC_CACHE_GENERIC_SHARE = 0.2
+
+# Hybrid retrieval: dense FAISS hits and BM25 hits are fused with
+# reciprocal rank fusion, score = sum(1 / (RRF_K + rank)).
+HYBRID_SEARCH = True
+RRF_K = 60
+HYBRID_CANDIDATES = 4  # Candidates per result taken from each ranking
+INDEX_DIR = "faiss_index"
+PLACEHOLDER_TEXT = "Initial document"  # Seeded into new indexes by earlier versions
+SEGMENT_MERGE_THRESHOLD = 8  # Delta segments before a background merge
+# Open base snapshots memory-mapped (index and chunk texts), so processes on
+# one host share the page cache and startup does not read the whole index
+INDEX_MMAP = True
+INDEX_RELOAD_INTERVAL: Optional[float] = 2.0  # Seconds between checks for a newer snapshot; None disables
+
+# Streaming ingestion (`add_papers_stream`)
+STREAM_BATCH_SIZE = 256     # Chunks embedded and committed per batch
+STREAM_QUEUE_BATCHES = 4    # Batches buffered ahead of the embedding worker
+STREAM_SAVE_EVERY = 40      # Batches between incremental saves
+
+# Cross-source duplicate detection: the same paper fetched from arXiv,
+# Semantic Scholar and PubMed is indexed once. Papers match on DOI / arXiv
+# ID, on normalized title (with compatible year and first author) or on
+# MinHash similarity of their abstracts, looked up through LSH bands.
+NEAR_DUPLICATE_THRESHOLD: Optional[float] = 0.7  # Estimated abstract Jaccard; None disables detection
+MINHASH_PERMUTATIONS = 64
+MINHASH_BANDS = 16          # 4 rows per band: pairs above ~0.5 Jaccard become candidates
+MINHASH_MIN_WORDS = 20      # Shorter abstracts are matched on title / IDs only
+MIN_TITLE_KEY_CHARS = 12    # Shorter normalized titles are too generic to match on
+
+# Vector index layout. "flat" is exact search; "ivf" and "hnsw" are
+# approximate; "auto" stays flat until the corpus reaches the promotion
+# threshold and then switches to ``auto_kind``.
+INDEX_MODE = "auto"
+ANN_INDEX_PARAMS: Dict[str, Any] = {
+    "promotion_threshold": 50_000,  # Chunks before "auto" leaves flat search
+    "auto_kind": "ivf",
+    "nlist": None,                  # IVF cells; None derives ~4*sqrt(n)
+    "nprobe": 16,                   # IVF cells visited per query
+    "hnsw_m": 32,                   # HNSW graph degree
+    "ef_construction": 80,
+    "ef_search": 64,
+    # Vector storage: "float32" (exact), "float16" (scalar quantizer, 2x
+    # smaller) or "pq" (product quantization, ``pq_m`` bytes per vector)
+    "storage": "float32",
+    "pq_m": 48,                     # PQ sub-quantizers; must divide the dim
+    "pq_nbits": 8,
+    "rescore": False,               # Re-rank candidates with exact vectors
+    "rescore_k_factor": 4,          # Candidates fetched per result to re-rank
+}
+
+
+def index_kind(index: "faiss.Index") -> str:
+    """Classify a FAISS index as "flat", "ivf" or "hnsw"."""
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    try:
+        faiss.extract_index_ivf(index)
+        return "ivf"
+    except RuntimeError:
+        return "flat"
+
+
+def index_storage(index: "faiss.Index") -> str:
+    """Classify how ``index`` stores vectors: "float32", "float16" or "pq"."""
+    kind = index_kind(index)
+    if kind == "hnsw":
+        inner = faiss.downcast_index(index.storage)
+    elif kind == "ivf":
+        inner = faiss.downcast_index(faiss.extract_index_ivf(index))
+    else:
+        inner = index
+    if isinstance(inner, (faiss.IndexPQ, faiss.IndexIVFPQ)):
+        return "pq"
+    if isinstance(inner, (faiss.IndexScalarQuantizer, faiss.IndexIVFScalarQuantizer)):
+        return "float16"
+    return "float32"
+
+
+def index_memory_bytes(index: "faiss.Index") -> int:
+    """Approximate resident size of ``index`` (codes + ids/graph/centroids)."""
+    n = index.ntotal
+    kind = index_kind(index)
+    if kind == "hnsw":
+        storage = faiss.downcast_index(index.storage)
+        # Level-0 links dominate: 2*M neighbours of 4 bytes per vector
+        return storage.code_size * n + n * index.hnsw.nb_neighbors(0) * 4
+    if kind == "ivf":
+        ivf = faiss.downcast_index(faiss.extract_index_ivf(index))
+        return ivf.code_size * n + 8 * n + ivf.nlist * index.d * 4
+    return faiss.downcast_index(index).code_size * n
+
+
+def _min_train_size(storage: str, params: Dict[str, Any]) -> int:
+    return 2 ** params["pq_nbits"] if storage == "pq" else 1
+
+
+def _ivf_nlist(n: int, params: Dict[str, Any]) -> int:
+    if params.get("nlist"):
+        return int(params["nlist"])
+    # ~4*sqrt(n) cells, but keep >= 39 training points per cell
+    return max(1, min(int(4 * np.sqrt(n)), n // 39))
+
+
+def reconstruct_all(index: "faiss.Index", block: int = 65536) -> np.ndarray:
+    """Return every stored vector of ``index`` in id order.
+
+    Only reads ``index``, so searches may run meanwhile: an IVF index
+    without a direct map is read list by list (IVF-Flat) or through a
+    clone, instead of adding a direct map to the live index.
+    """
+    out = np.empty((index.ntotal, index.d), dtype=np.float32)
+    if index_kind(index) == "ivf" and faiss.extract_index_ivf(index).direct_map.type == faiss.DirectMap.NoMap:
+        if isinstance(faiss.downcast_index(index), faiss.IndexIVFFlat):
+            lists = faiss.extract_index_ivf(index).invlists
+            for cell in range(lists.nlist):
+                n = lists.list_size(cell)
+                if n:
+                    ids = faiss.rev_swig_ptr(lists.get_ids(cell), n)
+                    codes = faiss.rev_swig_ptr(lists.get_codes(cell), n * lists.code_size)
+                    out[ids] = codes.view(np.float32).reshape(n, index.d)
+            return out
+        index = faiss.clone_index(index)
+        faiss.extract_index_ivf(index).make_direct_map()
+    for start in range(0, index.ntotal, block):
+        n = min(block, index.ntotal - start)
+        out[start:start + n] = index.reconstruct_n(start, n)
+    return out
+
+
+def build_index(kind: str, vectors: np.ndarray, params: Dict[str, Any]) -> "faiss.Index":
+    """Build (and train, if needed) an L2 index of ``kind`` over ``vectors``.
+
+    ``params["storage"]`` picks full float32 vectors, float16 scalar
+    quantization or PQ codes for the chosen layout.
+    """
+    d = vectors.shape[1]
+    storage = params["storage"]
+    fp16 = faiss.ScalarQuantizer.QT_fp16
+    if storage not in ("float32", "float16", "pq"):
+        raise ValueError(f"Unknown vector storage: {storage}")
+    if kind == "flat":
+        if storage == "float16":
+            index = faiss.IndexScalarQuantizer(d, fp16, faiss.METRIC_L2)
+        elif storage == "pq":
+            index = faiss.IndexPQ(d, params["pq_m"], params["pq_nbits"], faiss.METRIC_L2)
+        else:
+            index = faiss.IndexFlatL2(d)
+    elif kind == "hnsw":
+        if storage == "float16":
+            index = faiss.IndexHNSWSQ(d, fp16, params["hnsw_m"])
+        elif storage == "pq":
+            index = faiss.IndexHNSWPQ(d, params["pq_m"], params["hnsw_m"], params["pq_nbits"])
+        else:
+            index = faiss.IndexHNSWFlat(d, params["hnsw_m"])
+        index.hnsw.efConstruction = params["ef_construction"]
+    elif kind == "ivf":
+        nlist = _ivf_nlist(len(vectors), params)
+        quantizer = faiss.IndexFlatL2(d)
+        if storage == "float16":
+            index = faiss.IndexIVFScalarQuantizer(quantizer, d, nlist, fp16, faiss.METRIC_L2)
+        elif storage == "pq":
+            index = faiss.IndexIVFPQ(quantizer, d, nlist, params["pq_m"], params["pq_nbits"])
+        else:
+            index = faiss.IndexIVFFlat(quantizer, d, nlist, faiss.METRIC_L2)
+    else:
+        raise ValueError(f"Unknown index kind: {kind}")
+    if not index.is_trained:
+        index.train(vectors)
+    index.add(vectors)
+    configure_search(index, params)
+    return index
+
+
+def configure_search(index: "faiss.Index", params: Dict[str, Any]) -> None:
+    """Apply query-time parameters (nprobe / efSearch) to ``index``."""
+    kind = index_kind(index)
+    if kind == "ivf":
+        faiss.extract_index_ivf(index).nprobe = params["nprobe"]
+    elif kind == "hnsw":
+        index.hnsw.efSearch = params["ef_search"]
+
+
+def filtered_search_params(index: "faiss.Index", params: Dict[str, Any],
+                           selector: "faiss.IDSelector") -> Optional["faiss.SearchParameters"]:
+    """Per-query search parameters restricting ``index`` to ``selector``.
+
+    Returns None for layouts whose search does not accept an ID selector
+    (flat PQ); callers then over-fetch and filter the results instead.
+    """
+    kind = index_kind(index)
+    if kind == "ivf":
+        return faiss.SearchParametersIVF(sel=selector, nprobe=params["nprobe"])
+    if kind == "hnsw":
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=params["ef_search"])
+    if isinstance(index, faiss.IndexPQ):
+        return None
+    return faiss.SearchParameters(sel=selector)
+
+
+def read_index(path: str, use_mmap: bool = False) -> "faiss.Index":
+    """Read a FAISS index file, memory-mapped and read-only with ``use_mmap``.
+
+    A mapped index pages its vectors in on demand and shares them, through
+    the OS page cache, with every other process mapping the same file.
+    Flat and HNSW layouts copy their data into private memory on the first
+    add; the inverted lists of an IVF index stay read-only (see
+    `mapped_invlists`).
+    """
+    if use_mmap:
+        try:
+            return faiss.read_index(path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError as e:
+            logger.warning(f"Could not memory-map {path}, reading it into memory: {e}")
+    return faiss.read_index(path)
+
+
+def mapped_invlists(index: "faiss.Index") -> Optional["faiss.InvertedLists"]:
+    """The read-only, file-backed inverted lists of a mapped IVF index, else None.
+
+    Such an index can be searched but neither added to nor written out;
+    `copy_invlists` makes in-memory lists to replace them with first.
+    """
+    if index_kind(index) != "ivf":
+        return None
+    lists = faiss.downcast_InvertedLists(faiss.extract_index_ivf(index).invlists)
+    return lists if isinstance(lists, faiss.OnDiskInvertedLists) else None
+
+
+def copy_invlists(lists: "faiss.InvertedLists") -> "faiss.ArrayInvertedLists":
+    """In-memory copy of inverted ``lists`` (ids and codes of every cell)."""
+    copy = faiss.ArrayInvertedLists(lists.nlist, lists.code_size)
+    for cell in range(lists.nlist):
+        n = lists.list_size(cell)
+        if n:
+            copy.add_entries(cell, n, lists.get_ids(cell), lists.get_codes(cell))
+    return copy
+
+
+def unmap_invlists(index: "faiss.Index") -> None:
+    """Make a mapped IVF ``index`` writable by loading its lists into memory."""
+    lists = mapped_invlists(index)
+    if lists is not None:
+        copy = copy_invlists(lists)
+        faiss.extract_index_ivf(index).replace_invlists(copy, True)
+        copy.this.disown()  # Now owned by the index
+
+
+class ReadWriteLock:
+    """Many concurrent readers or one writer (not reentrant).
+
+    Writers are preferred: once a writer is waiting, new readers queue
+    behind it, so a steady stream of searches cannot starve ingestion.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._writers_waiting = 0
+
+    @contextmanager
+    def read(self):
+        with self._cond:
+            while self._writer or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._cond:
+            self._writers_waiting += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._writers_waiting -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+
+class QueryResultCache:
+    """Bounded LRU cache of search results, invalidated by corpus version.
+
+    Entries are evicted least-recently-used first once either the entry
+    count or the estimated payload size exceeds its limit, and expire
+    after ``ttl`` seconds when one is set. Every entry is tagged with the
+    corpus version it was computed against; a lookup under a newer
+    version treats it as a miss and drops it, so results never outlive
+    an ingestion.
+    """
+
+    def __init__(self, max_entries: int = QUERY_CACHE_MAX_ENTRIES, max_bytes: int = QUERY_CACHE_MAX_BYTES,
+                 ttl: Optional[float] = QUERY_CACHE_TTL):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Any]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _size(results: List[Dict[str, Any]]) -> int:
+        # Rough payload estimate: string lengths plus per-result overhead
+        return sum(200 + sum(len(str(v)) for v in r.values()) for r in results)
+
+    def get(self, key: str, version: int) -> Optional[List[Dict[str, Any]]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                results, entry_version, created, size = entry
+                expired = self.ttl is not None and time.time() - created > self.ttl
+                if entry_version == version and not expired:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return results
+                del self._entries[key]
+                self._bytes -= size
+                self.invalidations += 1
+            self.misses += 1
+            return None
+
+    def put(self, key: str, results: List[Dict[str, Any]], version: int) -> None:
+        size = self._size(results)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[3]
+            self._entries[key] = (results, version, time.time(), size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted[3]
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "hit_rate": round(self.hits / lookups * 100, 2) if lookups else 0.0,
+        }
+
+
+class ChunkStore:
+    """Compact on-disk store of a base snapshot's chunks, read through mmap.
+
+    Chunk texts are stored back to back in one UTF-8 blob delimited by an
+    offsets array. Metadata shared by the chunks of a paper (title,
+    authors, url, ...) is stored once, as one record of ``papers.jsonl``;
+    a chunk only has its paper row, page and docstore id, kept in
+    fixed-width columns::
+
+        chunks.bin            texts, chunk i = blob[offsets[i]:offsets[i + 1]]
+        chunks_offsets.npy    int64, n + 1
+        chunk_ids.npy         docstore ids (bytes), in index position order
+        chunk_ids_order.npy   argsort of the ids, for id lookups
+        chunk_papers.npy      int32 row in papers.jsonl (-1: document missing)
+        chunk_pages.npy       int32 page number (0: none)
+
+    Only the per-paper records are read into memory; everything else is
+    mapped, and a chunk's text is decoded only when it is looked up.
+    """
+
+    TEXT_FILE = "chunks.bin"
+    OFFSETS_FILE = "chunks_offsets.npy"
+    IDS_FILE = "chunk_ids.npy"
+    ID_ORDER_FILE = "chunk_ids_order.npy"
+    PAPER_ROWS_FILE = "chunk_papers.npy"
+    PAGES_FILE = "chunk_pages.npy"
+    PAPERS_FILE = "papers.jsonl"
+
+    def __init__(self, directory: str):
+        def column(name: str) -> np.ndarray:
+            return np.load(os.path.join(directory, name), mmap_mode="r")
+
+        self.offsets = column(self.OFFSETS_FILE)
+        self.ids = column(self.IDS_FILE)
+        self._id_order = column(self.ID_ORDER_FILE)
+        self._paper_rows = column(self.PAPER_ROWS_FILE)
+        self._pages = column(self.PAGES_FILE)
+        # Per paper: shared metadata and the per-chunk fields its chunks carry
+        self.papers: List[Dict[str, Any]] = []
+        self._fields: List[Tuple[str, ...]] = []
+        with open(os.path.join(directory, self.PAPERS_FILE), "r", encoding="utf-8") as f:
+            for line in f:
+                rec = json.loads(line)
+                self.papers.append(rec["metadata"])
+                self._fields.append(tuple(rec["fields"]))
+        with open(os.path.join(directory, self.TEXT_FILE), "rb") as f:
+            empty = os.fstat(f.fileno()).st_size == 0  # mmap rejects empty files
+            self._blob = b"" if empty else mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def doc_id(self, row: int) -> str:
+        return self.ids[row].decode("utf-8")
+
+    def row(self, doc_id: str) -> Optional[int]:
+        """Row of ``doc_id`` (binary search over the sorted ids), or None."""
+        key = doc_id.encode("utf-8")
+        lo, hi = 0, len(self._id_order)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.ids[self._id_order[mid]] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(self._id_order) and self.ids[self._id_order[lo]] == key:
+            return int(self._id_order[lo])
+        return None
+
+    def text(self, row: int) -> str:
+        return self._blob[int(self.offsets[row]):int(self.offsets[row + 1])].decode("utf-8")
+
+    def metadata(self, row: int) -> Optional[Dict[str, Any]]:
+        """A fresh metadata dict for ``row`` (None if its document is missing)."""
+        paper = int(self._paper_rows[row])
+        if paper < 0:
+            return None
+        meta = dict(self.papers[paper])
+        fields = self._fields[paper]
+        if "chunk_id" in fields:
+            meta["chunk_id"] = self.doc_id(row)
+        if "page" in fields:
+            meta["page"] = int(self._pages[row])
+        return meta
+
+    def document(self, row: int) -> Optional[Document]:
+        meta = self.metadata(row)
+        return None if meta is None else Document(page_content=self.text(row), metadata=meta)
+
+    def chunk_fingerprints(self) -> List[str]:
+        """Fingerprints of all stored chunks, read from the id column.
+
+        Chunks indexed before fingerprinting (their id is not their
+        fingerprint) are hashed from their text.
+        """
+        paper_rows = np.asarray(self._paper_rows)
+        has_id = np.array(["chunk_id" in fields for fields in self._fields] + [False], dtype=bool)
+        fingerprinted = has_id[paper_rows]  # Row -1 (document missing) picks the trailing False
+        found = np.char.decode(np.asarray(self.ids)[fingerprinted], "utf-8").tolist()
+        legacy = np.flatnonzero(~fingerprinted & (paper_rows >= 0))
+        found.extend(chunk_fingerprint(self.text(int(row))) for row in legacy)
+        return found
+
+    def paper_fingerprints(self) -> set:
+        """Paper ids of the stored chunks (one shared record per paper)."""
+        return {meta["paper_id"] for meta in self.papers if meta.get("paper_id")}
+
+    @classmethod
+    def write(cls, directory: str, entries: List[Tuple[str, Optional[Document]]]) -> None:
+        """Write ``(docstore id, document or None)`` pairs, in index position order."""
+        n = len(entries)
+        papers: Dict[str, int] = {}  # Serialized paper record -> row
+        paper_rows = np.full(n, -1, dtype=np.int32)
+        pages = np.zeros(n, dtype=np.int32)
+        offsets = np.zeros(n + 1, dtype=np.int64)
+        with open(os.path.join(directory, cls.TEXT_FILE), "wb") as f:
+            for row, (doc_id, doc) in enumerate(entries):
+                data = doc.page_content.encode("utf-8") if doc is not None else b""
+                f.write(data)
+                offsets[row + 1] = offsets[row] + len(data)
+                if doc is None:
+                    continue
+                shared = dict(doc.metadata or {})
+                fields = []
+                if shared.get("chunk_id") == doc_id:
+                    del shared["chunk_id"]
+                    fields.append("chunk_id")
+                if type(shared.get("page")) is int:
+                    pages[row] = shared.pop("page")
+                    fields.append("page")
+                record = json.dumps({"metadata": shared, "fields": fields}, ensure_ascii=False, sort_keys=True)
+                paper_rows[row] = papers.setdefault(record, len(papers))
+        with open(os.path.join(directory, cls.PAPERS_FILE), "w", encoding="utf-8") as f:
+            for record in papers:  # Insertion order == row order
+                f.write(record + "\n")
+        encoded = [doc_id.encode("utf-8") for doc_id, _ in entries]
+        ids = np.array(encoded, dtype=f"S{max([1] + [len(e) for e in encoded])}")
+        np.save(os.path.join(directory, cls.OFFSETS_FILE), offsets)
+        np.save(os.path.join(directory, cls.IDS_FILE), ids)
+        np.save(os.path.join(directory, cls.ID_ORDER_FILE), np.argsort(ids, kind="stable").astype(np.int64))
+        np.save(os.path.join(directory, cls.PAPER_ROWS_FILE), paper_rows)
+        np.save(os.path.join(directory, cls.PAGES_FILE), pages)
+
+
+class MappedDocstore(Docstore, AddableMixin):
+    """LangChain docstore over a base snapshot's `ChunkStore`.
+
+    Documents are built on lookup; chunks added after loading are held in
+    memory until the next base is written.
+    """
+
+    def __init__(self, chunks: ChunkStore):
+        self.chunks = chunks
+        self._added: Dict[str, Document] = {}
+
+    def add(self, texts: Dict[str, Document]) -> None:
+        overlapping = [doc_id for doc_id in texts if doc_id in self._added or self.chunks.row(doc_id) is not None]
+        if overlapping:
+            raise ValueError(f"Tried to add ids that already exist: {overlapping}")
+        self._added.update(texts)
+
+    def search(self, search: str) -> Union[str, Document]:
+        doc = self._added.get(search)
+        if doc is None:
+            row = self.chunks.row(search)
+            doc = self.chunks.document(row) if row is not None else None
+        return doc if doc is not None else f"ID {search} not found."
+
+    def chunk_fingerprints(self) -> List[str]:
+        """Fingerprints of every chunk, without building per-chunk metadata."""
+        found = self.chunks.chunk_fingerprints()
+        found.extend(doc.metadata.get("chunk_id") or chunk_fingerprint(doc.page_content)
+                     for doc in self._added.values())
+        return found
+
+    def paper_fingerprints(self) -> set:
+        found = self.chunks.paper_fingerprints()
+        found.update(doc.metadata["paper_id"] for doc in self._added.values() if doc.metadata.get("paper_id"))
+        return found
+
+    def metadata_items(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """``(id, metadata)`` of every document, without reading any text."""
+        for row in range(len(self.chunks)):
+            meta = self.chunks.metadata(row)
+            if meta is not None:
+                yield self.chunks.doc_id(row), meta
+        for doc_id, doc in self._added.items():
+            yield doc_id, doc.metadata or {}
+
+
+class PositionIds(MutableMapping):
+    """``index_to_docstore_id`` of a loaded base, backed by its id column.
+
+    Base positions resolve through the mapped `ChunkStore` ids instead of
+    a dict with one string per chunk; positions added later (by
+    ``FAISS.add_embeddings``) are kept in a dict.
+    """
+
+    def __init__(self, chunks: ChunkStore):
+        self.chunks = chunks
+        self._base = len(chunks)
+        self._added: Dict[int, str] = {}
+
+    def base_row(self, position: int) -> Optional[int]:
+        """Chunk store row holding ``position``, or None if it was added later."""
+        if 0 <= position < self._base and position not in self._added:
+            return int(position)
+        return None
+
+    def __getitem__(self, position: int) -> str:
+        if position in self._added:
+            return self._added[position]
+        if isinstance(position, (int, np.integer)) and 0 <= position < self._base:
+            return self.chunks.doc_id(int(position))
+        raise KeyError(position)
+
+    def __setitem__(self, position: int, doc_id: str) -> None:
+        self._added[int(position)] = doc_id
+
+    def __delitem__(self, position: int) -> None:
+        del self._added[position]  # Base positions are immutable
+
+    def __iter__(self) -> Iterator[int]:
+        yield from range(self._base)
+        yield from (p for p in self._added if not 0 <= p < self._base)
+
+    def __len__(self) -> int:
+        return self._base + sum(1 for p in self._added if not 0 <= p < self._base)
+
+
+def document_at(db: FAISS, position: int) -> Optional[Document]:
+    """Document at index ``position`` of ``db`` (None if it is missing).
+
+    Base positions of a loaded snapshot are read straight from its
+    `ChunkStore` row; other positions go through the docstore.
+    """
+    ids, docstore = db.index_to_docstore_id, db.docstore
+    if isinstance(ids, PositionIds) and getattr(docstore, "chunks", None) is ids.chunks:
+        row = ids.base_row(position)
+        if row is not None:
+            return ids.chunks.document(row)
+    doc = docstore.search(ids[position]) if position in ids else None
+    return doc if isinstance(doc, Document) else None
+
+
+def metadata_at(db: FAISS, position: int) -> Optional[Dict[str, Any]]:
+    """Metadata of the chunk at ``position``, without reading a mapped text."""
+    ids, docstore = db.index_to_docstore_id, db.docstore
+    if isinstance(ids, PositionIds) and getattr(docstore, "chunks", None) is ids.chunks:
+        row = ids.base_row(position)
+        if row is not None:
+            return ids.chunks.metadata(row)
+    doc = document_at(db, position)
+    return doc.metadata or {} if doc is not None else None
+
+
+def docstore_metadata(docstore: Docstore) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """``(id, metadata)`` of every document in a mapped or in-memory docstore."""
+    if isinstance(docstore, MappedDocstore):
+        return docstore.metadata_items()
+    return ((doc_id, doc.metadata or {}) for doc_id, doc in docstore._dict.items())
+
+
+class SemanticQueryCache:
+    """Reuses the results of a recent query whose embedding is close enough.
+
+    Keeps the normalized embeddings of the last ``max_entries`` searched
+    queries in one matrix, so a lookup is a single matrix-vector product.
+    Only entries computed with the same ``scope`` (k and filters) and the
+    current corpus version are eligible; the most similar one is returned
+    if its cosine similarity is at least ``threshold`` and its query has
+    the same `key_terms` up to generic ones. Stemming lets "efficient
+    transformers" answer "transformer efficiency", while "sparse attention
+    in BERT" never answers "sparse attention in GPT" however close the
+    embeddings are. ``generic_term`` (optional) marks a term common enough
+    in the corpus to differ, e.g. "neural" in a deep-learning collection.
+    The oldest entry is overwritten first.
+    """
+
+    def __init__(self, threshold: float = 0.9, max_entries: int = SEMANTIC_CACHE_MAX_ENTRIES,
+                 generic_term: Optional[Callable[[str], bool]] = None):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.generic_term = generic_term
+        self._vectors: Optional[np.ndarray] = None  # Allocated on first put
+        self._entries: List[Optional[tuple]] = [None] * max_entries  # (scope, version, terms, query, results)
+        self._next = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._hit_similarity = 0.0
+
+    @staticmethod
+    def _normalize(vector: np.ndarray) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32).ravel()
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm else vector
+
+    def _same_topic(self, terms: Dict[str, List[str]], other: Dict[str, List[str]]) -> bool:
+        if terms.keys() == other.keys():
+            return True
+        if not terms.keys() & other.keys():
+            return False
+        differing = terms.keys() ^ other.keys()
+        return self.generic_term is not None and all(
+            any(self.generic_term(word) for word in terms.get(stem, []) + other.get(stem, []))
+            for stem in differing
+        )
+
+    def get(self, vector: np.ndarray, scope: str, version: int, query: str) -> Optional[tuple]:
+        """Return ``(matched query, results, similarity)`` or None."""
+        terms = key_terms(query)
+        with self._lock:
+            if self._vectors is not None:
+                sims = self._vectors @ self._normalize(vector)
+                for row in np.argsort(-sims):
+                    if sims[row] < self.threshold:
+                        break
+                    entry = self._entries[row]
+                    if entry is not None and entry[:2] == (scope, version) and self._same_topic(terms, entry[2]):
+                        self.hits += 1
+                        self._hit_similarity += float(sims[row])
+                        return entry[3], entry[4], float(sims[row])
+            self.misses += 1
+            return None
+
+    def put(self, vector: np.ndarray, scope: str, version: int, query: str, results: List[Dict[str, Any]]) -> None:
+        vector = self._normalize(vector)
+        terms = key_terms(query)
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.zeros((self.max_entries, len(vector)), dtype=np.float32)
+            self._vectors[self._next] = vector
+            self._entries[self._next] = (scope, version, terms, query, results)
+            self._next = (self._next + 1) % self.max_entries
+
+    def clear(self) -> None:
+        with self._lock:
+            self._vectors = None
+            self._entries = [None] * self.max_entries
+            self._next = 0
+
+    def __len__(self) -> int:
+        return sum(1 for entry in self._entries if entry is not None)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self),
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups * 100, 2) if lookups else 0.0,
+            "mean_hit_similarity": round(self._hit_similarity / self.hits, 4) if self.hits else None,
+        }
+
+
+class SegmentedIndexStore:
+    """Append-only on-disk layout for the FAISS index.
+
+    The folder holds one full *base* snapshot plus a list of small *delta
+    segments*, each containing only the vectors and documents added by
+    one ``save()``::
+
+        faiss_index/
+          manifest.json            {"base": "base_000003", "segments": [...]}
+          base_000003/index.faiss  base_000003/chunks.bin  base_000003/papers.jsonl ...
+          segments/seg_000004.npy  segments/seg_000004.jsonl
+
+    A base stores the raw FAISS index and its chunks in a `ChunkStore`
+    (text blob, per-paper metadata, per-chunk columns). With ``use_mmap``
+    the index is memory-mapped on load (the chunk store always is), so
+    several processes serving the same folder share one copy in the
+    page cache. Bases written by earlier versions (``FAISS.save_local``'s
+    index.faiss + pickled docstore) still load.
+
+    Appending a segment costs O(batch). Once enough segments accumulate,
+    a background thread folds them into a new base, working from the
+    files on disk only, and publishes it by atomically replacing the
+    manifest. A folder without a manifest (the legacy layout) is treated
+    as a base with no segments.
+
+    Bases and segments are immutable and fsynced before the manifest,
+    the single "current" pointer, is replaced to publish them, so a crash
+    or a concurrent reader never sees a torn snapshot. The manifest's
+    ``version`` counts content changes (new segments, new bases written
+    by full saves or compaction; not merges), which lets other processes
+    detect a new snapshot with one ``stat`` (see `version`).
+
+    Several processes may write: every read-modify-write of the manifest
+    runs under `locked`, which also holds an ``flock`` on a lock file in
+    the folder, so segment names and entries never collide. A full base
+    replaces every published segment; `RAGPipeline` first copies chunks
+    other processes published into its index while holding the lock.
+    """
+
+    def __init__(self, embeddings: Any, path: str = INDEX_DIR, merge_threshold: int = SEGMENT_MERGE_THRESHOLD,
+                 use_mmap: bool = INDEX_MMAP):
+        self.embeddings = embeddings
+        self.path = path
+        self.merge_threshold = merge_threshold
+        self.use_mmap = use_mmap
+        self.manifest_path = os.path.join(path, "manifest.json")
+        self.segment_dir = os.path.join(path, "segments")
+        self.lock_path = os.path.join(path, ".manifest.lock")
+        self._lock = threading.RLock()
+        self._lock_file: Optional[Any] = None
+        self._lock_depth = 0
+        self._merge_thread: Optional[threading.Thread] = None
+        self._manifest_stat: Optional[tuple] = None
+        self._manifest_version = 0
+
+    # Manifest
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    @contextmanager
+    def locked(self) -> Iterator[None]:
+        """Exclusive access to the manifest, across threads and processes (reentrant)."""
+        with self._lock:
+            if self._lock_depth == 0 and fcntl is not None:
+                os.makedirs(self.path, exist_ok=True)
+                self._lock_file = open(self.lock_path, "a+b")
+                fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX)
+            self._lock_depth += 1
+            try:
+                yield
+            finally:
+                self._lock_depth -= 1
+                if self._lock_depth == 0 and self._lock_file is not None:
+                    fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
+                    self._lock_file.close()
+                    self._lock_file = None
+
+    def read_manifest(self) -> Dict[str, Any]:
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        # Legacy layout: index.faiss/index.pkl directly in the folder
+        return {"base": ".", "segments": [], "next_seq": 1, "version": 0}
+
+    def version(self) -> int:
+        """Version of the published snapshot.
+
+        Cheap enough to call per query: the manifest is only re-read when
+        ``stat`` shows it was replaced.
+        """
+        try:
+            st = os.stat(self.manifest_path)
+        except FileNotFoundError:
+            return 0
+        key = (st.st_ino, st.st_mtime_ns, st.st_size)
+        if key != self._manifest_stat:
+            self._manifest_version = self.read_manifest().get("version", 0)
+            self._manifest_stat = key
+        return self._manifest_version
+
+    @staticmethod
+    def _publish_version(manifest: Dict[str, Any]) -> None:
+        manifest["version"] = manifest.get("version", 0) + 1
+
+    @staticmethod
+    def _sync(paths: Iterable[str]) -> None:
+        # Make new snapshot files durable before the manifest points at them
+        for fpath in paths:
+            with open(fpath, "rb") as f:
+                os.fsync(f.fileno())
+
+    def _write_manifest(self, manifest: Dict[str, Any]) -> None:
+        tmp = f"{self.manifest_path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.manifest_path)
+
+    def _next_name(self, manifest: Dict[str, Any], prefix: str) -> str:
+        seq = manifest.get("next_seq", 1)
+        manifest["next_seq"] = seq + 1
+        return f"{prefix}_{seq:06d}"
+
+    def disk_bytes(self) -> int:
+        """Total size of the files under the index folder."""
+        total = 0
+        for root, _, files in os.walk(self.path):
+            for fname in files:
+                try:
+                    total += os.path.getsize(os.path.join(root, fname))
+                except OSError:
+                    pass  # Removed by a concurrent merge
+        return total
+
+    # Load / write
+    def load(self) -> FAISS:
+        """Load the base snapshot and replay all delta segments."""
+        return self.load_snapshot()[0]
+
+    def load_snapshot(self, attempts: int = 3) -> Tuple[FAISS, Dict[str, Any]]:
+        """Load the published snapshot; returns the index and its manifest.
+
+        A concurrent merge or compaction may delete the files of the
+        snapshot being loaded once it publishes a newer one; loading then
+        starts over from the new manifest.
+        """
+        for attempt in range(attempts):
+            manifest = self.read_manifest()
+            try:
+                db = self._read_base(manifest["base"], self.use_mmap)
+                if manifest["segments"]:
+                    unmap_invlists(db.index)  # Replaying adds vectors
+                for name in manifest["segments"]:
+                    self._apply_segment(db, name)
+            except (OSError, RuntimeError):
+                if attempt == attempts - 1 or self.read_manifest() == manifest:
+                    raise
+                logger.info("Index snapshot was replaced while loading, retrying")
+                continue
+            if manifest["segments"]:
+                logger.info(f"Replayed {len(manifest['segments'])} delta segments onto base '{manifest['base']}'")
+            return db, manifest
+        raise RuntimeError("unreachable")
+
+    def _read_base(self, name: str, use_mmap: bool) -> FAISS:
+        directory = os.path.join(self.path, name)
+        if not os.path.exists(os.path.join(directory, ChunkStore.PAPERS_FILE)):
+            # Written by FAISS.save_local (earlier versions)
+            io_flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY if use_mmap else 0
+            return FAISS.load_local(directory, self.embeddings, allow_dangerous_deserialization=True,
+                                    io_flags=io_flags)
+        index = read_index(os.path.join(directory, "index.faiss"), use_mmap)
+        chunks = ChunkStore(directory)
+        return FAISS(self.embeddings, index, MappedDocstore(chunks), PositionIds(chunks))
+
+    def _write_base_files(self, db: FAISS, directory: str) -> None:
+        """Write ``db`` as a base; docstore entries no position refers to are dropped."""
+        os.makedirs(directory, exist_ok=True)
+        faiss.write_index(db.index, os.path.join(directory, "index.faiss"))
+        ChunkStore.write(directory, [(db.index_to_docstore_id[pos], document_at(db, pos))
+                                     for pos in range(db.index.ntotal)])
+        self._sync(os.path.join(directory, fname) for fname in os.listdir(directory))
+
+    def read_segment(self, name: str) -> Tuple[np.ndarray, List[Document], List[str]]:
+        """Vectors, documents and docstore ids of delta segment ``name``."""
+        vectors = np.load(os.path.join(self.segment_dir, f"{name}.npy"))
+        docs, ids = [], []
+        with open(os.path.join(self.segment_dir, f"{name}.jsonl"), "r", encoding="utf-8") as f:
+            for line in f:
+                rec = json.loads(line)
+                docs.append(Document(page_content=rec["text"], metadata=rec["metadata"]))
+                ids.append(rec["id"])
+        return vectors, docs, ids
+
+    def _apply_segment(self, db: FAISS, name: str) -> None:
+        vectors, docs, ids = self.read_segment(name)
+        db.add_embeddings(list(zip([d.page_content for d in docs], vectors.tolist())),
+                          metadatas=[d.metadata for d in docs], ids=ids)
+
+    def write_base(self, db: FAISS) -> Dict[str, Any]:
+        """Write a full snapshot of ``db`` and drop all segments (full save).
+
+        ``db`` must already hold every published chunk that should survive
+        (callers take `locked` around catching up and this call). The index
+        must not use mapped IVF lists (see `mapped_invlists`). Returns the
+        published manifest.
+        """
+        with self.locked():
+            os.makedirs(self.path, exist_ok=True)
+            manifest = self.read_manifest()
+            name = self._next_name(manifest, "base")
+            self._write_base_files(db, os.path.join(self.path, name))
+            old_base, old_segments = manifest["base"], manifest["segments"]
+            manifest.update(base=name, segments=[])
+            self._publish_version(manifest)
+            self._write_manifest(manifest)
+        self._remove_files(old_base, old_segments)
+        return manifest
+
+    def append(self, vectors: np.ndarray, docs: List[Document], ids: List[str]) -> Dict[str, Any]:
+        """Persist one batch of new vectors and documents as a delta segment.
+
+        Returns the published manifest.
+        """
+        with self.locked():
+            os.makedirs(self.segment_dir, exist_ok=True)
+            manifest = self.read_manifest()
+            name = self._next_name(manifest, "seg")
+            np.save(os.path.join(self.segment_dir, f"{name}.npy"), np.asarray(vectors, dtype=np.float32))
+            with open(os.path.join(self.segment_dir, f"{name}.jsonl"), "w", encoding="utf-8") as f:
+                for doc_id, doc in zip(ids, docs):
+                    f.write(json.dumps({"id": doc_id, "text": doc.page_content, "metadata": doc.metadata},
+                                       ensure_ascii=False) + "\n")
+            self._sync(os.path.join(self.segment_dir, name + ext) for ext in (".npy", ".jsonl"))
+            manifest["segments"].append(name)
+            self._publish_version(manifest)
+            self._write_manifest(manifest)
+            pending = len(manifest["segments"])
+        logger.debug(f"Wrote delta segment {name} ({len(ids)} chunks, {pending} pending merge)")
+        if pending >= self.merge_threshold:
+            self.merge_async()
+        return manifest
+
+    # Background merge
+    def merge_async(self) -> None:
+        if self._merge_thread is not None and self._merge_thread.is_alive():
+            return
+        self._merge_thread = threading.Thread(target=self._merge, name="faiss-segment-merge", daemon=True)
+        self._merge_thread.start()
+
+    def wait_for_merge(self, timeout: Optional[float] = None) -> None:
+        if self._merge_thread is not None:
+            self._merge_thread.join(timeout)
+
+    def _merge(self) -> None:
+        try:
+            manifest = self.read_manifest()
+            base, merged = manifest["base"], list(manifest["segments"])
+            if not merged:
+                return
+            start = time.time()
+            db = self._read_base(base, use_mmap=False)
+            for name in merged:
+                self._apply_segment(db, name)
+
+            # Reserve the new base name, then write it without holding the
+            # lock so foreground saves keep appending segments meanwhile.
+            with self.locked():
+                current = self.read_manifest()
+                name = self._next_name(current, "base")
+                self._write_manifest(current)
+            self._write_base_files(db, os.path.join(self.path, name))
+
+            with self.locked():
+                current = self.read_manifest()
+                if current["base"] != base:
+                    logger.info("Segment merge superseded by a newer base, discarding")
+                    shutil.rmtree(os.path.join(self.path, name), ignore_errors=True)
+                    return
+                current["base"] = name
+                current["segments"] = [s for s in current["segments"] if s not in merged]
+                self._write_manifest(current)
+            self._remove_files(base, merged)
+            logger.info(f"Merged {len(merged)} delta segments into {name} in {time.time() - start:.2f}s")
+        except Exception as e:
+            # A failed merge leaves the previous base + segments intact
+            logger.error(f"Background segment merge failed: {e}")
+
+    def _remove_files(self, base: str, segments: List[str]) -> None:
+        try:
+            if base == ".":
+                for fname in ("index.faiss", "index.pkl"):
+                    fpath = os.path.join(self.path, fname)
+                    if os.path.exists(fpath):
+                        os.remove(fpath)
+            else:
+                shutil.rmtree(os.path.join(self.path, base), ignore_errors=True)
+            for name in segments:
+                for ext in (".npy", ".jsonl"):
+                    fpath = os.path.join(self.segment_dir, name + ext)
+                    if os.path.exists(fpath):
+                        os.remove(fpath)
+        except OSError as e:
+            logger.warning(f"Could not remove superseded index files: {e}")
+
+
+def _normalize_text(text: str) -> str:
+    return " ".join((text or "").lower().split())
+
+
+def chunk_fingerprint(text: str) -> str:
+    """Stable content hash of a chunk; used as its docstore id."""
+    return hashlib.sha1(_normalize_text(text).encode("utf-8")).hexdigest()
+
+
+def paper_fingerprint(title: str, content: str) -> str:
+    """Stable content hash of a paper (normalized title + body)."""
+    key = f"{_normalize_text(title)}\n{_normalize_text(content)}"
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+
+
+def parse_year(value: Any) -> Optional[int]:
+    try:
+        return int(str(value).strip()[:4])
+    except (TypeError, ValueError):
+        return None
+
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_TITLE_VERSION_RE = re.compile(r"\s*(?:[\[(]\s*v\d+\s*[\])]|\bversion\s+\d+)\s*$")
+_DOI_RE = re.compile(r"\b10\.\d{4,9}/[^\s\"<>]+")
+_ARXIV_RE = re.compile(r"arxiv\.org/(?:abs|pdf)/([a-z\-.]+/\d{7}|\d{4}\.\d{4,5})")
+_ARXIV_ID_RE = re.compile(r"^(?:arxiv:)?([a-z\-.]+/\d{7}|\d{4}\.\d{4,5})(?:v\d+)?$")
+
+
+def normalize_title(title: str) -> str:
+    """Lowercase ASCII words of a title, without markup, accents or a "(v2)" suffix."""
+    text = unicodedata.normalize("NFKD", re.sub(r"<[^>]+>", " ", title or ""))
+    text = "".join(c for c in text if not unicodedata.combining(c)).lower()
+    return " ".join(_TOKEN_RE.findall(_TITLE_VERSION_RE.sub("", text)))
+
+
+def paper_keys(paper: Dict[str, Any]) -> List[str]:
+    """Exact-match dedup keys of a paper: ``doi:``, ``arxiv:`` and ``title:``.
+
+    DOIs and arXiv IDs come from the ``doi`` / ``arxiv_id`` fields or are
+    parsed from the URL; arXiv version suffixes are dropped.
+    """
+    keys = []
+    url = str(paper.get("url") or "").lower()
+    doi = str(paper.get("doi") or "").lower().strip() or next(iter(_DOI_RE.findall(url)), "")
+    if doi:
+        keys.append("doi:" + doi.rstrip(".,;)"))
+    arxiv_id = _ARXIV_ID_RE.match(str(paper.get("arxiv_id") or "").lower().strip()) or _ARXIV_RE.search(url)
+    if arxiv_id:
+        keys.append("arxiv:" + arxiv_id.group(1))
+    title = normalize_title(paper.get("title") or "")
+    if len(title) >= MIN_TITLE_KEY_CHARS:
+        keys.append("title:" + title)
+    return keys
+
+
+def _same_work(a: Dict[str, Any], b: Dict[str, Any]) -> bool:
+    """Whether two papers with the same title are plausibly one work.
+
+    Years may differ by one (preprint vs. publication) and the first
+    authors must share a name token (sources order names differently).
+    """
+    year_a, year_b = parse_year(a.get("year")), parse_year(b.get("year"))
+    if year_a and year_b and abs(year_a - year_b) > 1:
+        return False
+    first = [PaperCatalog._authors(p.get("authors"))[:1] for p in (a, b)]
+    if first[0] and first[1]:
+        return bool(set(_TOKEN_RE.findall(normalize_title(first[0][0])))
+                    & set(_TOKEN_RE.findall(normalize_title(first[1][0]))))
+    return True
+
+
+class PaperCatalog:
+    """Paper-level metadata catalog backed by SQLite.
+
+    Papers are keyed by their stable ``paper_id`` (see `paper_fingerprint`)
+    rather than by title, so two papers sharing a title no longer
+    overwrite each other. Secondary indexes on year, source, title and
+    author keep lookups and filtered listings cheap, and `upsert_many`
+    writes a whole ingestion batch in one transaction. ``paper_sessions``
+    records which research sessions used each paper, so a paper indexed
+    once can belong to any number of sessions.
+    """
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS papers (
+            paper_id   TEXT PRIMARY KEY,
+            title      TEXT NOT NULL,
+            source     TEXT,
+            year       INTEGER,
+            url        TEXT,
+            authors    TEXT,
+            extra      TEXT,
+            updated_at REAL
+        );
+        CREATE TABLE IF NOT EXISTS paper_authors (
+            paper_id TEXT NOT NULL,
+            author   TEXT NOT NULL,
+            PRIMARY KEY (paper_id, author)
+        );
+        CREATE TABLE IF NOT EXISTS paper_sessions (
+            paper_id   TEXT NOT NULL,
+            session_id TEXT NOT NULL,
+            PRIMARY KEY (paper_id, session_id)
+        );
+        CREATE INDEX IF NOT EXISTS idx_papers_year ON papers(year);
+        CREATE INDEX IF NOT EXISTS idx_papers_source ON papers(source);
+        CREATE INDEX IF NOT EXISTS idx_papers_title ON papers(title);
+        CREATE INDEX IF NOT EXISTS idx_paper_authors_author ON paper_authors(author);
+        CREATE INDEX IF NOT EXISTS idx_paper_sessions_session ON paper_sessions(session_id);
+        CREATE TABLE IF NOT EXISTS paper_keys (
+            key      TEXT NOT NULL,
+            paper_id TEXT NOT NULL,
+            PRIMARY KEY (key, paper_id)
+        );
+        CREATE INDEX IF NOT EXISTS idx_paper_keys_paper ON paper_keys(paper_id);
+        CREATE TABLE IF NOT EXISTS paper_minhash (
+            paper_id  TEXT PRIMARY KEY,
+            signature BLOB NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS paper_lsh (
+            band     TEXT NOT NULL,
+            paper_id TEXT NOT NULL,
+            PRIMARY KEY (band, paper_id)
+        );
+    """
+    _COLUMNS = ("title", "source", "year", "url", "authors")
+
+    def __init__(self, path: str = CATALOG_DB_PATH, legacy_json_path: Optional[str] = METADATA_STORE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(self._SCHEMA)
+        if legacy_json_path and len(self) == 0:
+            self._migrate_json(legacy_json_path)
+        self._backfill_keys()
+
+    def _backfill_keys(self) -> None:
+        # Catalogs written before duplicate detection have no paper_keys rows
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM papers p WHERE NOT EXISTS (SELECT 1 FROM paper_keys k WHERE k.paper_id = p.paper_id)"
+            ).fetchall()
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO paper_keys (key, paper_id) VALUES (?, ?)",
+                    [(key, row["paper_id"]) for row in rows for key in paper_keys(self._row_to_meta(row))],
+                )
+
+    def _migrate_json(self, json_path: str) -> None:
+        if not os.path.exists(json_path):
+            return
+        try:
+            with open(json_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception as e:
+            logger.warning(f"Could not read legacy metadata catalog {json_path}: {e}")
+            return
+        if not isinstance(data, dict):
+            return
+        rows = []
+        for title, meta in data.items():
+            meta = dict(meta or {})
+            meta.setdefault("title", title)
+            paper_id = meta.get("paper_id") or paper_fingerprint(meta["title"], meta.get("url") or "")
+            rows.append((paper_id, meta))
+        self.upsert_many(rows)
+        logger.info(f"Migrated {len(rows)} papers from {json_path} to {self.path}")
+
+    @staticmethod
+    def _authors(value: Any) -> List[str]:
+        if not value:
+            return []
+        if isinstance(value, (list, tuple)):
+            return [str(a).strip() for a in value if str(a).strip()]
+        return [a.strip() for a in str(value).split(",") if a.strip()]
+
+    def upsert_many(self, papers: List[Any]) -> None:
+        """Insert or update ``(paper_id, meta)`` pairs in one transaction."""
+        if not papers:
+            return
+        now = time.time()
+        with self._lock, self._conn:
+            for paper_id, meta in papers:
+                extra = {k: v for k, v in meta.items() if k not in self._COLUMNS and k != "paper_id"}
+                authors = meta.get("authors")
+                self._conn.execute(
+                    """
+                    INSERT INTO papers (paper_id, title, source, year, url, authors, extra, updated_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(paper_id) DO UPDATE SET
+                        title=excluded.title, source=excluded.source, year=excluded.year,
+                        url=excluded.url, authors=excluded.authors, extra=excluded.extra,
+                        updated_at=excluded.updated_at
+                    """,
+                    (
+                        paper_id,
+                        meta.get("title") or "Untitled",
+                        meta.get("source"),
+                        parse_year(meta.get("year")),
+                        meta.get("url"),
+                        ", ".join(authors) if isinstance(authors, (list, tuple)) else authors,
+                        json.dumps(extra, ensure_ascii=False, default=str) if extra else None,
+                        now,
+                    ),
+                )
+                self._conn.execute("DELETE FROM paper_authors WHERE paper_id = ?", (paper_id,))
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO paper_authors (paper_id, author) VALUES (?, ?)",
+                    [(paper_id, a) for a in self._authors(authors)],
+                )
+                self._conn.execute("DELETE FROM paper_keys WHERE paper_id = ?", (paper_id,))
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO paper_keys (key, paper_id) VALUES (?, ?)",
+                    [(key, paper_id) for key in paper_keys(meta)],
+                )
+
+    def upsert(self, paper_id: str, meta: Dict[str, Any]) -> None:
+        self.upsert_many([(paper_id, meta)])
+
+    def _row_to_meta(self, row: sqlite3.Row) -> Dict[str, Any]:
+        meta = {"paper_id": row["paper_id"]}
+        meta.update({c: row[c] for c in self._COLUMNS})
+        if row["extra"]:
+            meta.update(json.loads(row["extra"]))
+        return meta
+
+    def get(self, paper_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM papers WHERE paper_id = ?", (paper_id,)).fetchone()
+        return self._row_to_meta(row) if row else None
+
+    def find(self, title: Optional[str] = None, source: Optional[str] = None, author: Optional[str] = None,
+             year_from: Optional[int] = None, year_to: Optional[int] = None,
+             limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """List papers matching all given filters (each served by an index)."""
+        sql = "SELECT p.* FROM papers p"
+        where, args = [], []
+        if author:
+            sql += " JOIN paper_authors a ON a.paper_id = p.paper_id"
+            where.append("a.author = ?")
+            args.append(author)
+        if title:
+            where.append("p.title = ?")
+            args.append(title)
+        if source:
+            where.append("p.source = ?")
+            args.append(source)
+        if year_from is not None:
+            where.append("p.year >= ?")
+            args.append(year_from)
+        if year_to is not None:
+            where.append("p.year <= ?")
+            args.append(year_to)
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        if limit:
+            sql += " LIMIT ?"
+            args.append(limit)
+        with self._lock:
+            rows = self._conn.execute(sql, args).fetchall()
+        return [self._row_to_meta(r) for r in rows]
+
+    def find_by_key(self, key: str) -> List[str]:
+        """Paper IDs registered under a `paper_keys` key."""
+        with self._lock:
+            rows = self._conn.execute("SELECT paper_id FROM paper_keys WHERE key = ?", (key,)).fetchall()
+        return [r[0] for r in rows]
+
+    def add_signatures(self, signatures: List[Any]) -> None:
+        """Store ``(paper_id, minhash, bands)`` for abstract near-duplicate lookups."""
+        if not signatures:
+            return
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO paper_minhash (paper_id, signature) VALUES (?, ?)",
+                [(paper_id, minhash.tobytes()) for paper_id, minhash, _ in signatures],
+            )
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO paper_lsh (band, paper_id) VALUES (?, ?)",
+                [(band, paper_id) for paper_id, _, bands in signatures for band in bands],
+            )
+
+    def lsh_candidates(self, bands: List[str]) -> List[Any]:
+        """``(paper_id, minhash bytes)`` of papers sharing at least one LSH band."""
+        if not bands:
+            return []
+        marks = ",".join("?" * len(bands))
+        with self._lock:
+            return self._conn.execute(
+                f"SELECT DISTINCT m.paper_id, m.signature FROM paper_lsh l "
+                f"JOIN paper_minhash m ON m.paper_id = l.paper_id WHERE l.band IN ({marks})",
+                bands,
+            ).fetchall()
+
+    def add_to_session(self, session_id: str, paper_ids: List[str]) -> int:
+        """Attach papers to a session; returns how many were newly attached."""
+        if not paper_ids:
+            return 0
+        with self._lock, self._conn:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO paper_sessions (paper_id, session_id) VALUES (?, ?)",
+                [(pid, session_id) for pid in paper_ids],
+            )
+            return self._conn.total_changes - before
+
+    def paper_ids(self) -> set:
+        with self._lock:
+            return {r[0] for r in self._conn.execute("SELECT paper_id FROM papers")}
+
+    def titles(self) -> set:
+        with self._lock:
+            return {r[0] for r in self._conn.execute("SELECT title FROM papers")}
+
+    def session_papers(self, session_id: str) -> List[str]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT paper_id FROM paper_sessions WHERE session_id = ?", (session_id,)
+            ).fetchall()
+        return [r[0] for r in rows]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM papers").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+_MINHASH_PRIME = (1 << 31) - 1
+
+
+class PaperDeduplicator:
+    """Finds papers that are already indexed under another paper ID.
+
+    The same work fetched from different sources gets different paper
+    IDs (its title casing, abstract or URL differ). A paper is a duplicate
+    of an indexed one when they share a DOI or arXiv ID, when their
+    normalized titles match and `_same_work` agrees, or when the MinHash
+    estimate of the Jaccard similarity of their abstracts' word 3-grams
+    reaches ``threshold``. Every lookup is an indexed key or LSH band query
+    against the catalog, so checking a paper does not scan the corpus.
+
+    Papers registered by `check` / `register` are matched in memory until
+    `commit` (called once their catalog rows are written) stores their
+    signatures. Without a catalog everything stays in memory, which is
+    how `dedupe_papers` deduplicates one fetched batch. With
+    ``is_indexed``, catalog papers only match if it returns True for
+    their ID: catalog rows are committed on ingest, so they can outlive
+    chunks that were never saved. Methods are thread-safe: `add_papers_stream` checks papers on the producer thread
+    while its embedding worker commits them.
+    """
+
+    def __init__(self, catalog: Optional[PaperCatalog] = None, threshold: float = 0.7,
+                 num_perm: int = MINHASH_PERMUTATIONS, bands: int = MINHASH_BANDS,
+                 is_indexed: Optional[Callable[[str], bool]] = None):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.catalog = catalog
+        self.is_indexed = is_indexed
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        rng = np.random.RandomState(0)  # Fixed: signatures are persisted
+        self._a = rng.randint(1, _MINHASH_PRIME, size=num_perm).astype(np.uint64)
+        self._b = rng.randint(0, _MINHASH_PRIME, size=num_perm).astype(np.uint64)
+        self._lock = threading.RLock()  # Guards the pending state
+        # Registered papers not yet committed to the catalog
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._pending_keys: Dict[str, List[str]] = {}
+
+    def signature(self, text: str) -> Optional[np.ndarray]:
+        """MinHash of the word 3-grams of ``text``; None if it is too short."""
+        words = _TOKEN_RE.findall((text or "").lower())
+        if len(words) < MINHASH_MIN_WORDS:
+            return None
+        shingles = {" ".join(words[i:i + 3]) for i in range(len(words) - 2)}
+        hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64,
+                             count=len(shingles))
+        return ((hashes[:, None] * self._a + self._b) % _MINHASH_PRIME).min(axis=0).astype(np.uint32)
 
-class SBERTEmbeddings:
-    """Optimized embedding adapter using sentence-transformers with caching.
+    def band_keys(self, minhash: np.ndarray) -> List[str]:
+        r = self.rows
+        return [f"{i}:{minhash[i * r:(i + 1) * r].tobytes().hex()}" for i in range(self.bands)]
 
-    Implements the methods expected by the FAISS wrapper used in this
-    project: `embed_documents` and `embed_query`.
+    def _key_matches(self, key: str) -> List[str]:
+        found = list(self._pending_keys.get(key, ()))
+        if self.catalog is not None:
+            found.extend(pid for pid in self.catalog.find_by_key(key) if self._indexed(pid))
+        return found
+
+    def _indexed(self, paper_id: str) -> bool:
+        return self.is_indexed is None or self.is_indexed(paper_id)
+
+    def _paper(self, paper_id: str) -> Optional[Dict[str, Any]]:
+        if paper_id in self._pending:
+            return self._pending[paper_id]["paper"]
+        return self.catalog.get(paper_id) if self.catalog is not None else None
+
+    def _candidates(self, bands: List[str]) -> Iterator[Tuple[str, np.ndarray]]:
+        wanted = set(bands)
+        for paper_id, entry in self._pending.items():
+            if entry["minhash"] is not None and wanted.intersection(entry["bands"]):
+                yield paper_id, entry["minhash"]
+        if self.catalog is not None:
+            for paper_id, blob in self.catalog.lsh_candidates(bands):
+                if self._indexed(paper_id):
+                    yield paper_id, np.frombuffer(blob, dtype=np.uint32)
+
+    def find(self, paper: Dict[str, Any], text: str = "",
+             minhash: Optional[np.ndarray] = None) -> Optional[Tuple[str, str]]:
+        """Return ``(paper_id, reason)`` of an earlier copy of ``paper``, or None.
+
+        ``reason`` is ``"id"``, ``"title"`` or ``"abstract"``; ``text`` is
+        the abstract to compare (its MinHash may be passed instead).
+        """
+        if minhash is None:
+            minhash = self.signature(text)
+        with self._lock:
+            return self._find(paper, minhash)
+
+    def _find(self, paper: Dict[str, Any], minhash: Optional[np.ndarray]) -> Optional[Tuple[str, str]]:
+        keys = paper_keys(paper)
+        for key in keys:
+            for paper_id in self._key_matches(key):
+                if not key.startswith("title:"):
+                    return paper_id, "id"
+                other = self._paper(paper_id)
+                if other is not None and _same_work(paper, other):
+                    return paper_id, "title"
+        if minhash is not None:
+            for paper_id, other in self._candidates(self.band_keys(minhash)):
+                if len(other) == len(minhash) and float(np.mean(other == minhash)) >= self.threshold:
+                    return paper_id, "abstract"
+        return None
+
+    def register(self, paper_id: str, paper: Dict[str, Any], minhash: Optional[np.ndarray] = None) -> None:
+        """Make ``paper`` matchable before its catalog row is written."""
+        keys = paper_keys(paper)
+        entry = {
+            "paper": {k: paper.get(k) for k in ("title", "year", "authors")},
+            "keys": keys,
+            "minhash": minhash,
+            "bands": self.band_keys(minhash) if minhash is not None else [],
+        }
+        with self._lock:
+            self._pending[paper_id] = entry
+            for key in keys:
+                self._pending_keys.setdefault(key, []).append(paper_id)
+
+    def check(self, paper_id: str, paper: Dict[str, Any], text: str) -> Optional[Tuple[str, str]]:
+        """`find` an earlier copy of ``paper``; register it if there is none."""
+        minhash = self.signature(text)
+        with self._lock:  # Atomic, so two copies checked concurrently cannot both pass
+            match = self._find(paper, minhash)
+            if match is None:
+                self.register(paper_id, paper, minhash)
+        return match
+
+    def commit(self, paper_ids: Iterable[str]) -> None:
+        """Persist signatures of registered papers whose catalog rows now exist."""
+        if self.catalog is None:
+            return
+        paper_ids = list(paper_ids)
+        with self._lock:
+            signatures = [(paper_id, self._pending[paper_id]["minhash"], self._pending[paper_id]["bands"])
+                          for paper_id in paper_ids
+                          if paper_id in self._pending and self._pending[paper_id]["minhash"] is not None]
+            # Stored before the pending entries go, so a concurrent check always sees the paper
+            self.catalog.add_signatures(signatures)
+            self.discard(paper_ids)
+
+    def discard(self, paper_ids: Iterable[str]) -> None:
+        """Forget registered papers (committed, or whose ingestion failed)."""
+        with self._lock:
+            for paper_id in list(paper_ids):
+                entry = self._pending.pop(paper_id, None)
+                if entry is None:
+                    continue
+                for key in entry["keys"]:
+                    ids = self._pending_keys.get(key, [])
+                    if paper_id in ids:
+                        ids.remove(paper_id)
+                    if not ids:
+                        self._pending_keys.pop(key, None)
+
+
+def dedupe_papers(papers: List[Dict[str, Any]],
+                  threshold: Optional[float] = NEAR_DUPLICATE_THRESHOLD) -> List[Dict[str, Any]]:
+    """Drop cross-source duplicates from a fetched batch, keeping first copies.
+
+    Fields missing from a kept paper (abstract, year, DOI, ...) are filled
+    in from its duplicates. With ``threshold=None`` only exact titles are
+    deduplicated.
     """
+    unique: List[Dict[str, Any]] = []
+    if threshold is None:
+        seen = set()
+        for p in papers:
+            if p.get("title") not in seen:
+                seen.add(p.get("title"))
+                unique.append(p)
+        return unique
+    dedup = PaperDeduplicator(threshold=threshold)
+    for p in papers:
+        match = dedup.check(str(len(unique)), p, p.get("abstract") or "")
+        if match is None:
+            unique.append(dict(p))
+            continue
+        kept = unique[int(match[0])]
+        logger.debug(f"Duplicate of '{kept.get('title')}' ({match[1]}): '{p.get('title')}' from {p.get('source')}")
+        for key, value in p.items():
+            if value and not kept.get(key):
+                kept[key] = value
+    return unique
 
-    def __init__(self, model_name: str = "all-MiniLM-L6-v2"):
-        self.model = SentenceTransformer(model_name)
-        self._cache = {}  # Simple in-memory cache
 
-    def embed_documents(self, texts: List[str]) -> List[List[float]]:
-        if not texts:
-            return []
-        # Batch encoding for efficiency
-        emb = self.model.encode(texts, show_progress_bar=False, batch_size=32)
-        return emb.tolist()
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has in is it its of on or that the this to was were with we our".split()
+)
 
-    def embed_query(self, text: str) -> List[float]:
-        # Check cache first
-        cache_key = hash(text)
-        if cache_key in self._cache:
-            return self._cache[cache_key]
-        
-        emb = self.model.encode([text], show_progress_bar=False)[0]
-        result = emb.tolist()
-        
-        # Cache the result (limit cache size)
-        if len(self._cache) < 1000:
-            self._cache[cache_key] = result
-        
-        return result
 
-    def __call__(self, texts):
-        """Make the embeddings object callable.
+def tokenize(text: str) -> List[str]:
+    return [t for t in _TOKEN_RE.findall((text or "").lower()) if t not in _STOPWORDS]
 
-        - If passed a list of strings, return a list of vectors.
-        - If passed a single string, return a single vector.
-        This keeps compatibility with older/newer vectorstore expectations.
+
+# Words that phrase a search request rather than name its topic
+_QUERY_FILLER = frozenset(
+    "approach approaches based method methods model models new novel paper papers recent study studies "
+    "survey technique techniques toward towards using via".split()
+)
+_STEM_SUFFIXES = ("ization", "ational", "ations", "ation", "ency", "ence", "ment", "ness", "ity",
+                  "ing", "ers", "ent", "ed", "er", "ly", "s")
+
+
+def stem(word: str) -> str:
+    """Strip common English suffixes so inflections and derivations agree.
+
+    Crude on purpose: "efficiency", "efficient" and "efficiently" all become
+    "effici", "transformers" becomes "transform"; stems keep at least four
+    letters, so short names such as "bert" or "gpt" are left alone.
+    """
+    changed = True
+    while changed:
+        changed = False
+        for suffix in _STEM_SUFFIXES:
+            if word.endswith(suffix) and len(word) - len(suffix) >= 4:
+                word = word[:-len(suffix)]
+                changed = True
+                break
+    return word[:-1] if word.endswith("e") and len(word) > 4 else word
+
+
+def key_terms(query: str) -> Dict[str, List[str]]:
+    """Map the stems of a query's topic words to the words they came from."""
+    terms: Dict[str, List[str]] = {}
+    for word in tokenize(query):
+        if word not in _QUERY_FILLER:
+            terms.setdefault(stem(word), []).append(word)
+    return terms
+
+
+class InvertedIndex:
+    """Compact in-process BM25 index over chunk positions.
+
+    Positions are FAISS ids, so lexical and dense hits refer to the same
+    chunks. Each posting list is a pair of typed arrays (positions and
+    term frequencies) rather than Python objects, which keeps the index
+    small enough to sit next to the vector index.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, Any] = {}
+        self._doc_len = array("I")
+        self._total_len = 0
+
+    def __len__(self) -> int:
+        return len(self._doc_len)
+
+    def add(self, position: int, text: str) -> None:
+        # Positions are assigned densely; pad for any gap (e.g. empty chunks)
+        while len(self._doc_len) < position:
+            self._doc_len.append(0)
+        tokens = tokenize(text)
+        counts: Dict[str, int] = {}
+        for t in tokens:
+            counts[t] = counts.get(t, 0) + 1
+        for term, tf in counts.items():
+            plist = self._postings.get(term)
+            if plist is None:
+                plist = self._postings[term] = (array("I"), array("H"))
+            plist[0].append(position)
+            plist[1].append(min(tf, 65535))
+        self._doc_len.append(len(tokens))
+        self._total_len += len(tokens)
+
+    def document_share(self, term: str) -> float:
+        """Fraction of indexed chunks that contain ``term``."""
+        plist = self._postings.get(term)
+        return len(plist[0]) / len(self._doc_len) if plist is not None and self._doc_len else 0.0
+
+    def search(self, query: str, k: int, allowed: Optional[np.ndarray] = None) -> List[int]:
+        """Return up to ``k`` positions ranked by BM25 score.
+
+        ``allowed`` is an optional boolean mask over positions; other
+        positions are never returned.
         """
-        if texts is None:
+        n = len(self._doc_len)
+        terms = [t for t in set(tokenize(query)) if t in self._postings]
+        if not n or not terms:
             return []
-        if isinstance(texts, (list, tuple)):
-            return self.embed_documents(list(texts))
-        return self.embed_query(str(texts))
+        avgdl = self._total_len / n or 1.0
+        doc_len = np.frombuffer(self._doc_len, dtype=np.uint32)
+        positions, scores = [], []
+        for term in terms:
+            pos = np.frombuffer(self._postings[term][0], dtype=np.uint32)
+            tf = np.frombuffer(self._postings[term][1], dtype=np.uint16).astype(np.float32)
+            idf = np.log(1.0 + (n - len(pos) + 0.5) / (len(pos) + 0.5))
+            norm = self.k1 * (1.0 - self.b + self.b * doc_len[pos] / avgdl)
+            positions.append(pos)
+            scores.append(idf * tf * (self.k1 + 1.0) / (tf + norm))
+        uniq, inverse = np.unique(np.concatenate(positions), return_inverse=True)
+        totals = np.bincount(inverse, weights=np.concatenate(scores))
+        if allowed is not None:
+            keep = np.zeros(len(uniq), dtype=bool)
+            inside = uniq < len(allowed)
+            keep[inside] = allowed[uniq[inside]]
+            uniq, totals = uniq[keep], totals[keep]
+        k = min(k, len(uniq))
+        if k <= 0:
+            return []
+        top = np.argpartition(-totals, k - 1)[:k]
+        top = top[np.argsort(-totals[top])]
+        return [int(p) for p in uniq[top]]
+
+
+def reciprocal_rank_fusion(rankings: List[List[int]], k: int, rrf_k: int = RRF_K) -> List[int]:
+    """Fuse several ranked position lists into one top-``k`` list."""
+    fused: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, pos in enumerate(ranking):
+            fused[pos] = fused.get(pos, 0.0) + 1.0 / (rrf_k + rank + 1)
+    return sorted(fused, key=fused.get, reverse=True)[:k]
+
+
+class ChunkFilters:
+    """Per-position filter columns (year, source, paper) for the index.
+
+    One small integer per chunk and column, with sources and paper ids
+    dictionary-encoded (0 = unknown), so a filter turns into a boolean
+    mask over FAISS ids with a few vectorized comparisons. The mask is
+    handed to FAISS as an ID selector and applied inside the search.
+    Sessions are resolved to their papers (see `PaperCatalog`) before
+    masking, so a chunk shared by several sessions is stored once.
+    """
+
+    def __init__(self):
+        self._years = array("h")
+        self._sources = array("i")
+        self._papers = array("i")
+        self._codes: Dict[str, Dict[str, int]] = {"source": {}, "paper": {}}
+
+    def __len__(self) -> int:
+        return len(self._years)
+
+    def _code(self, column: str, value: Any) -> int:
+        if value in (None, ""):
+            return 0
+        codes = self._codes[column]
+        return codes.setdefault(str(value), len(codes) + 1)
+
+    def add(self, position: int, metadata: Dict[str, Any]) -> None:
+        while len(self._years) < position:
+            for col in (self._years, self._sources, self._papers):
+                col.append(0)
+        year = parse_year(metadata.get("year"))
+        self._years.append(year if year is not None and 0 < year < 32768 else 0)
+        self._sources.append(self._code("source", metadata.get("source")))
+        self._papers.append(self._code("paper", metadata.get("paper_id")))
+
+    def _isin(self, column: str, values: Any) -> np.ndarray:
+        if isinstance(values, str):
+            values = [values]
+        codes = [self._codes[column].get(str(v), -1) for v in values]
+        data = np.frombuffer(self._sources if column == "source" else self._papers, dtype=np.int32)
+        return np.isin(data, codes)
+
+    def mask(self, n: int, year_from: Optional[int] = None, year_to: Optional[int] = None,
+             sources: Any = None, papers: Optional[List[str]] = None) -> np.ndarray:
+        """Boolean mask over the first ``n`` positions matching all filters.
+
+        Chunks without a year never match a year bound; an unknown source
+        or paper id matches nothing. ``papers=[]`` matches nothing.
+        """
+        mask = np.ones(len(self._years), dtype=bool)
+        years = np.frombuffer(self._years, dtype=np.int16)
+        if year_from is not None:
+            mask &= years >= year_from
+        if year_to is not None:
+            mask &= (years <= year_to) & (years > 0)
+        if sources:
+            mask &= self._isin("source", sources)
+        if papers is not None:
+            mask &= self._isin("paper", papers)
+        out = np.zeros(n, dtype=bool)
+        out[:min(n, len(mask))] = mask[:n]
+        return out
+
+
+# Evidence formatting for LLM prompts (`RAGPipeline.search`)
+CHARS_PER_TOKEN = 4        # Rough token estimate, as in metrics.json
+MIN_PASSAGE_TOKENS = 30    # A passage cut shorter than this is dropped instead
+NO_EVIDENCE_TEXT = "No supporting passages found in the current corpus."
+
+
+def estimate_tokens(text: str) -> int:
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+class EvidencePacker:
+    """Formats ranked search results into a token budget.
+
+    Passages are taken in rank order and grouped under one citation
+    handle per paper ([P1], [P2], ...); title, short author list, year,
+    source and URL are printed once per paper instead of once per
+    passage, and passage whitespace is collapsed. A passage that does
+    not fit is cut at a word boundary when at least `MIN_PASSAGE_TOKENS`
+    fit, and skipped otherwise; without a budget every passage is kept
+    whole. This is the only evidence format the agents see (see
+    `RAGPipeline.search`). One packer can format several blocks
+    (`search_many`): handles stay unique and a paper already introduced
+    in an earlier block is only referred to by handle and title.
+    """
+
+    FOOTER_TOKENS = 20  # Reserved for the omitted-passages note
+
+    def __init__(self):
+        self.handles: Dict[Any, str] = {}
+
+    @staticmethod
+    def _paper_key(result: Dict[str, Any]) -> Any:
+        return result.get("paper_id") or (result.get("title"), result.get("url"))
+
+    @staticmethod
+    def _short_authors(authors: Any) -> str:
+        names = PaperCatalog._authors(authors)
+        if not names:
+            return "Unknown authors"
+        return f"{names[0]} et al." if len(names) > 2 else " & ".join(names)
+
+    def _header(self, result: Dict[str, Any], handle: str, introduced: bool) -> str:
+        title = result.get("title") or "Untitled"
+        if introduced:
+            return f"[{handle}] {title} (see above)"
+        header = (f"[{handle}] {title} — {self._short_authors(result.get('authors'))} "
+                  f"({result.get('year') or 'n.d.'}, {result.get('source') or 'N/A'})")
+        if result.get("scope") == "global":
+            header += " [outside the current session]"
+        if result.get("url"):
+            header += f" {result['url']}"
+        return header
+
+    @staticmethod
+    def _passage(result: Dict[str, Any], max_tokens: Optional[int] = None) -> str:
+        prefix = f"- p. {result['page']}: " if result.get("page") else "- "
+        text = " ".join((result.get("content") or "").split())
+        if max_tokens is not None:
+            limit = max_tokens * CHARS_PER_TOKEN - len(prefix) - 1
+            if len(text) > limit:
+                text = text[:max(limit, 0)].rsplit(" ", 1)[0] + "…"
+        return prefix + text
 
-METADATA_STORE_PATH = "papers_metadata.json"
+    def pack(self, results: List[Dict[str, Any]], token_budget: Optional[int] = None) -> str:
+        if not results:
+            return NO_EVIDENCE_TEXT
+        budget = float("inf") if token_budget is None else max(token_budget - self.FOOTER_TOKENS, MIN_PASSAGE_TOKENS)
+        groups: "OrderedDict[Any, List[str]]" = OrderedDict()
+        used = omitted = 0
+        for result in results:
+            key = self._paper_key(result)
+            header = None
+            if key not in groups:
+                introduced = key in self.handles
+                handle = self.handles.get(key) or f"P{len(self.handles) + 1}"
+                header = self._header(result, handle, introduced)
+            cost = estimate_tokens(header) + 1 if header else 0
+            passage = self._passage(result)
+            remaining = budget - used - cost
+            if estimate_tokens(passage) + 1 > remaining:
+                # Always keep (part of) the best passage, even on a tiny budget
+                if remaining < MIN_PASSAGE_TOKENS and groups:
+                    omitted += 1
+                    continue
+                passage = self._passage(result, max(remaining - 1, MIN_PASSAGE_TOKENS))
+            if header:
+                self.handles.setdefault(key, handle)
+                groups[key] = [header]
+            groups[key].append(passage)
+            used += cost + estimate_tokens(passage) + 1
+
+        text = "\n\n".join("\n".join(lines) for lines in groups.values())
+        if omitted:
+            text += f"\n\n(+{omitted} lower-ranked passages omitted to fit the {token_budget}-token budget)"
+        return text
 
 
 class RAGPipeline:
@@ -67,212 +2168,1279 @@ class RAGPipeline:
 
     Responsibilities:
     - Maintain a vector index of paper chunks with rich metadata
-    - Persist index and a lightweight metadata catalog across runs
+    - Persist index and a SQLite paper catalog (`PaperCatalog`) across runs
     - Provide both string and structured retrieval for tools/agents
-    - Offer basic in-memory query caching for efficiency
+    - Offer bounded, corpus-version-aware query result caching, for exact
+      queries and, if ``semantic_cache_threshold`` is set, rewordings of a
+      recent query
+
+    ``persistence`` selects how ``save()`` writes the index: "incremental"
+    (default) appends only the chunks added since the last save as a delta
+    segment, "full" rewrites the whole index as before.
+
+    ``index_mode`` selects the FAISS layout ("flat", "ivf", "hnsw" or
+    "auto", see `ANN_INDEX_PARAMS`). The index is rebuilt in place when it
+    is promoted or an IVF index needs retraining, so callers of
+    `similarity_search` are unaffected.
+
+    With ``lazy=True`` (default) construction only opens the catalog; the
+    embedding model and the index are loaded on first use, or ahead of
+    time via `warmup()`. Per-phase load times are kept in
+    ``startup_timings``.
+
+    With ``mmap_index=True`` (default) the persisted index and chunk texts
+    are memory-mapped instead of read into memory, so startup is quick and
+    processes serving the same index share it (see `SegmentedIndexStore`).
+    Searches pick up snapshots saved by another process (checked at most
+    every ``reload_interval`` seconds, see `reload`) without a restart.
+
+    ``session_id`` names the current research session. Papers ingested
+    (or re-used) while it is set are attached to that session in the
+    catalog, and ``sessions=session_id`` scopes a search to them over the
+    shared index.
+
+    One pipeline can be shared by many threads. Searches hold a shared
+    read lock only while they touch the index; writers (`add_papers`,
+    `add_paper`, `save`) are serialized and do their slow work (chunking,
+    embedding, index rebuilds, disk writes) outside the exclusive lock,
+    which is held only to append vectors and swap in a rebuilt index.
+    Searches therefore keep running while a batch is being ingested.
     """
 
-    def __init__(self):
+    def __init__(self, persistence: str = "incremental", index_mode: str = INDEX_MODE,
+                 index_params: Optional[Dict[str, Any]] = None, lazy: bool = True,
+                 embedding_backend: str = EMBEDDING_BACKEND, hybrid: bool = HYBRID_SEARCH,
+                 session_id: Optional[str] = None, mmap_index: bool = INDEX_MMAP,
+                 reload_interval: Optional[float] = INDEX_RELOAD_INTERVAL,
+                 semantic_cache_threshold: Optional[float] = SEMANTIC_CACHE_THRESHOLD,
+                 near_duplicate_threshold: Optional[float] = NEAR_DUPLICATE_THRESHOLD):
+        if persistence not in ("incremental", "full"):
+            raise ValueError(f"Unknown persistence mode: {persistence}")
+        if index_mode not in ("auto", "flat", "ivf", "hnsw"):
+            raise ValueError(f"Unknown index mode: {index_mode}")
         # Use a local SBERT model for embeddings to avoid external embed model
         # requirements (e.g., Ollama nomic-embed-text). This keeps the pipeline
         # runnable offline once the sentence-transformers model is cached.
         logger.info("Initializing RAG Pipeline")
-        self.embeddings = SBERTEmbeddings()
-        self.db = None
-        self.query_cache: Dict[str, List[Dict[str, Any]]] = {}
-        self.metadata: Dict[str, Dict[str, Any]] = {}
-        self._init_db()
-        self._load_metadata()
-        logger.info(f"RAG Pipeline initialized - {len(self.metadata)} papers in metadata store")
+        self.startup_timings: Dict[str, float] = {}
+        self.embeddings = SBERTEmbeddings(backend=embedding_backend)
+        self.persistence = persistence
+        self.index_mode = index_mode
+        self.index_params = {**ANN_INDEX_PARAMS, **(index_params or {})}
+        self.store = SegmentedIndexStore(self.embeddings, use_mmap=mmap_index)
+        self._needs_full_save = False  # Index layout changed in memory (rebuilt/compacted)
+        self._unsaved_chunks = False  # Chunks committed since the last save; blocks reload()
+        self._snapshot: Dict[str, Any] = {}  # Manifest of the snapshot the index reflects
+        self.reload_interval = reload_interval
+        self._last_reload_check = 0.0
+        self._db: Optional[FAISS] = None
+        self._ready = False
+        self._loading = False
+        self._load_lock = threading.RLock()
+        # Index/docstore/side-index access: shared by searches, exclusive for commits
+        self._rw_lock = ReadWriteLock()
+        # Serializes writers (ingestion, save); taken before ``_rw_lock``
+        self._write_lock = threading.RLock()
+        self._build_lock = threading.Lock()  # One lazy BM25/filter build at a time
+        # Chunks added since the last save(), written as one delta segment
+        self._pending_vectors: List[np.ndarray] = []
+        self._pending_docs: List[Document] = []
+        self.query_cache = QueryResultCache()
+        # Paraphrase-level reuse of recent results; None disables it
+        self.semantic_cache = (SemanticQueryCache(semantic_cache_threshold, generic_term=self._is_generic_term)
+                               if semantic_cache_threshold is not None else None)
+        # BM25 index over chunk positions; built on first hybrid search
+        self.hybrid = hybrid
+        self.lexical: Optional[InvertedIndex] = None
+        # Year/source/session columns over chunk positions; built on first filtered search
+        self.filters: Optional[ChunkFilters] = None
+        # Bumped on every change to the indexed corpus; tags cached results
+        self.corpus_version = 0
+        start = time.time()
+        self.catalog = PaperCatalog()
+        self.startup_timings["catalog"] = time.time() - start
+        # Cross-source duplicates are dropped before chunking; None disables it
+        self.dedup = (PaperDeduplicator(self.catalog, near_duplicate_threshold,
+                                        is_indexed=lambda paper_id: paper_id in self.paper_ids)
+                      if near_duplicate_threshold is not None else None)
+        # Fingerprints of everything already in the index (see add_papers)
+        self.chunk_ids: set = set()
+        self.paper_ids: set = set()
+        # Fingerprints reserved by the running ingestion but not yet committed;
+        # rolled back if it fails so a retry indexes them (see `_ingesting`)
+        self._uncommitted_chunks: set = set()
+        self._uncommitted_papers: set = set()
+        self.last_ingest_report: Dict[str, int] = {}
+        self.session_id = session_id
+        if not lazy:
+            self.warmup()
+        logger.info(f"RAG Pipeline initialized - {len(self.catalog)} papers in metadata catalog")
+
+    # --------------------
+    # Lazy loading
+    # --------------------
+    @property
+    def db(self) -> FAISS:
+        if not self._ready:
+            self._ensure_loaded()
+        return self._db
+
+    @db.setter
+    def db(self, value: FAISS) -> None:
+        self._db = value
+
+    @property
+    def is_ready(self) -> bool:
+        return self._ready
+
+    def _ensure_loaded(self) -> None:
+        """Load the embedding model, index and fingerprints exactly once.
+
+        Other threads block on the lock until loading finishes; the loading
+        thread itself re-enters freely (the index helpers read ``self.db``).
+        """
+        with self._load_lock:
+            if self._ready or self._loading:
+                return
+            self._loading = True
+            try:
+                start = time.time()
+                self.embeddings.load()
+                self.startup_timings["embedding_model"] = time.time() - start
+
+                start = time.time()
+                self._init_db()
+                self.startup_timings["index_load"] = time.time() - start
+
+                start = time.time()
+                self._load_fingerprints()
+                self.startup_timings["fingerprints"] = time.time() - start
+            finally:
+                self._loading = False
+            self._ready = True
+            phases = ", ".join(f"{k}={v:.2f}s" for k, v in self.startup_timings.items())
+            logger.info(f"RAG Pipeline ready - {self._db.index.ntotal} vectors ({phases})")
+
+    def warmup(self, background: bool = False) -> Optional[threading.Thread]:
+        """Load the model and index now instead of on first use.
+
+        With ``background=True`` loading runs in a daemon thread (returned
+        so callers can join it); searches and ingestion issued meanwhile
+        simply wait for it to finish.
+        """
+        if not background:
+            self._ensure_loaded()
+            return None
+
+        def _run() -> None:
+            try:
+                self._ensure_loaded()
+            except Exception as e:
+                logger.error(f"RAG warmup failed: {e}")
+
+        thread = threading.Thread(target=_run, name="rag-warmup", daemon=True)
+        thread.start()
+        return thread
 
     # --------------------
     # Persistence helpers
     # --------------------
     def _init_db(self) -> None:
-        if os.path.exists("faiss_index"):
+        if self.store.exists():
             logger.info("Loading existing FAISS index")
-            self.db = FAISS.load_local("faiss_index", self.embeddings, allow_dangerous_deserialization=True)
+            self.db, self._snapshot = self.store.load_snapshot()
         else:
             logger.info("Creating new FAISS index")
-            self.db = FAISS.from_texts(["Initial document"], self.embeddings)
-            self.db.save_local("faiss_index")
+            self.db = self._empty_db()
+            self._snapshot = self.store.write_base(self.db)
+        configure_search(self.db.index, self.index_params)
+        self._maybe_rebuild_index()
 
-    def _load_metadata(self) -> None:
-        if os.path.exists(METADATA_STORE_PATH):
-            try:
-                with open(METADATA_STORE_PATH, "r", encoding="utf-8") as f:
-                    data = json.load(f)
-                    if isinstance(data, dict):
-                        self.metadata = data
-            except Exception:
-                self.metadata = {}
-
-    def _save_metadata(self) -> None:
+    def _empty_db(self) -> FAISS:
+        dim = self.embeddings.model.get_sentence_embedding_dimension()
+        return FAISS(self.embeddings, faiss.IndexFlatL2(dim), InMemoryDocstore({}), {})
+
+    def _target_index_kind(self) -> str:
+        if self.index_mode != "auto":
+            return self.index_mode
+        current = index_kind(self.db.index)
+        if current != "flat":
+            return current  # Never demote an index that is already ANN
+        if self.db.index.ntotal >= self.index_params["promotion_threshold"]:
+            return self.index_params["auto_kind"]
+        return "flat"
+
+    def _maybe_rebuild_index(self) -> None:
+        """Promote/convert the index to the target layout, or retrain IVF.
+
+        The target is the kind from `_target_index_kind` combined with the
+        configured vector storage. An IVF index is retrained once the
+        corpus has grown enough that the ideal number of cells is at least
+        double the current one. Rebuilding keeps vector ids (and hence the
+        docstore mapping) intact. Callers hold the writer lock, so the new
+        index is built while searches continue on the old one and only
+        the swap is exclusive.
+        """
+        index = self.db.index
+        params = self.index_params
+        current = (index_kind(index), index_storage(index))
+        target = (self._target_index_kind(), params["storage"])
+        if current == target:
+            if target[0] != "ivf" or params.get("nlist"):
+                return
+            if _ivf_nlist(index.ntotal, params) < 2 * faiss.extract_index_ivf(index).nlist:
+                return
+            reason = "retraining IVF"
+        else:
+            if target[0] == "ivf" and _ivf_nlist(index.ntotal, params) < 2:
+                return  # Too few vectors to train IVF yet
+            if index.ntotal < _min_train_size(target[1], params):
+                return  # Too few vectors to train the quantizer yet
+            reason = f"converting {'/'.join(current)} -> {'/'.join(target)}"
+
+        start = time.time()
+        logger.info(f"Rebuilding FAISS index ({reason}) over {index.ntotal} vectors")
+        rebuilt = build_index(target[0], self._all_vectors(), params)
+        with self._rw_lock.write():
+            self.db.index = rebuilt
+        self._needs_full_save = True
+        logger.info(f"Index rebuilt in {time.time() - start:.2f}s")
+
+    def _unmap_index(self) -> None:
+        """Load the lists of a memory-mapped IVF index into memory before it is modified.
+
+        The copy is made while searches keep using the mapped lists; only
+        the swap takes the exclusive lock. Flat and HNSW indexes need no
+        help (FAISS copies them on the first add).
+        """
+        lists = mapped_invlists(self.db.index)
+        if lists is None:
+            return
+        start = time.time()
+        copy = copy_invlists(lists)
+        with self._rw_lock.write():
+            faiss.extract_index_ivf(self.db.index).replace_invlists(copy, True)
+            copy.this.disown()
+        logger.info(f"Loaded mapped IVF lists into memory in {time.time() - start:.2f}s")
+
+    def _doc_at(self, position: int) -> Optional[Document]:
+        return document_at(self.db, position)
+
+    def _all_vectors(self, positions: Optional[List[int]] = None) -> np.ndarray:
+        """Full-precision vectors of every indexed chunk (or ``positions``), in order.
+
+        Read straight from the index when it stores float32; otherwise
+        (quantized index) from the persistent embedding cache by chunk text.
+        """
+        index = self.db.index
+        if index_storage(index) == "float32":
+            vectors = reconstruct_all(index)
+            return vectors if positions is None else vectors[positions]
+        positions = range(index.ntotal) if positions is None else positions
+        texts = [self._doc_at(i).page_content for i in positions]
+        return self.embeddings.embed_documents_array(texts)
+
+    def _load_fingerprints(self) -> None:
+        """Rebuild the dedup sets from the persisted index.
+
+        Chunk fingerprints come from the id column of the mapped base
+        (chunks carry their fingerprint as docstore id) and paper
+        fingerprints from its per-paper records, so no per-chunk metadata
+        is built at startup. Not from the catalog: its rows are committed
+        on ingest, before the chunks are saved. Legacy pickled bases are
+        walked instead; chunks indexed before fingerprinting are hashed
+        from their text.
+        """
+        self._backfill_paper_ids()
+        docstore = self.db.docstore
+        if isinstance(docstore, MappedDocstore):
+            self.chunk_ids.update(docstore.chunk_fingerprints())
+            self.paper_ids.update(docstore.paper_fingerprints())
+            logger.debug(f"Loaded {len(self.chunk_ids)} chunk / {len(self.paper_ids)} paper fingerprints")
+            return
+        for doc_id, meta in docstore_metadata(docstore):
+            self.chunk_ids.add(meta.get("chunk_id") or chunk_fingerprint(docstore.search(doc_id).page_content))
+            if meta.get("paper_id"):
+                self.paper_ids.add(meta["paper_id"])
+        logger.debug(f"Loaded {len(self.chunk_ids)} chunk / {len(self.paper_ids)} paper fingerprints")
+
+    def _backfill_paper_ids(self) -> None:
+        """Give chunks indexed before paper IDs existed the ID of their paper.
+
+        Session filters resolve to paper IDs, so such chunks never matched
+        one. Their paper is found in the catalog under the ID the legacy
+        JSON migration used, or by normalized title; a paper missing from
+        the catalog gets a row there, so re-fetching it is recognized as a
+        duplicate and links it to the session under this ID. Metadata is
+        updated in memory (a mapped base holds one record per paper) and
+        written by the next full save.
+        """
+        docstore = self.db.docstore
+        if isinstance(docstore, MappedDocstore):
+            legacy = [meta for meta in docstore.chunks.papers if not meta.get("paper_id")]
+        else:
+            legacy = [doc.metadata for doc in docstore._dict.values()
+                      if isinstance(doc, Document) and doc.metadata is not None and not doc.metadata.get("paper_id")]
+        legacy = [meta for meta in legacy if meta.get("title")]  # Not the placeholder
+        if not legacy:
+            return
+        resolved: Dict[Tuple[str, str], str] = {}
+        new_rows = []
+        for meta in legacy:
+            key = (meta["title"], meta.get("url") or "")
+            if key not in resolved:
+                paper_id = paper_fingerprint(*key)
+                if self.catalog.get(paper_id) is None:
+                    by_title = self.catalog.find_by_key("title:" + normalize_title(meta["title"]))
+                    if by_title:
+                        paper_id = by_title[0]
+                    else:
+                        new_rows.append((paper_id, {k: v for k, v in meta.items() if k not in ("chunk_id", "page")}))
+                resolved[key] = paper_id
+            meta["paper_id"] = resolved[key]
+        self.catalog.upsert_many(new_rows)
+        logger.info(f"Assigned paper IDs to {len(resolved)} papers indexed by an earlier version "
+                    f"({len(new_rows)} added to the catalog)")
+
+    def reload(self) -> bool:
+        """Switch to a snapshot published by another process, if any.
+
+        If only delta segments were appended to the loaded base, they are
+        replayed onto the live index; otherwise (merged or rewritten base)
+        the new snapshot is loaded, memory-mapped, and swapped in. Searches
+        keep running and see either the old or the new corpus. Nothing is
+        done while this process is ingesting or has unsaved chunks.
+        Returns True if the index changed.
+        """
+        if not self._ready or self.store.version() == self._snapshot.get("version", 0):
+            return False
+        if not self._write_lock.acquire(blocking=False):
+            return False  # Ingesting here; the snapshot is checked again later
         try:
-            with open(METADATA_STORE_PATH, "w", encoding="utf-8") as f:
-                json.dump(self.metadata, f, ensure_ascii=False, indent=2)
-        except Exception:
-            # Metadata persistence failures should not break the pipeline
-            pass
+            # A rebuilt layout alone does not block: it holds the same chunks as the
+            # snapshot, and a reader (which never saves) would otherwise never reload
+            if self._unsaved_chunks:
+                logger.warning("A newer index snapshot exists but this process has unsaved chunks; not reloading")
+                return False
+            manifest = self.store.read_manifest()
+            loaded = self._snapshot
+            start = time.time()
+            new_segments = [name for name in manifest["segments"] if name not in loaded["segments"]]
+            appended = manifest["base"] == loaded["base"] and set(loaded["segments"]) <= set(manifest["segments"])
+            if appended:
+                try:
+                    for name in new_segments:
+                        vectors, docs, ids = self.store.read_segment(name)
+                        self._commit_chunks(docs, vectors, ids)
+                        for doc in docs:
+                            self.chunk_ids.add(doc.metadata.get("chunk_id") or chunk_fingerprint(doc.page_content))
+                            if doc.metadata.get("paper_id"):
+                                self.paper_ids.add(doc.metadata["paper_id"])
+                    how = f"replayed {len(new_segments)} segments"
+                except OSError:
+                    appended = False  # A segment was merged away meanwhile
+            if not appended:
+                db, manifest = self.store.load_snapshot()
+                configure_search(db.index, self.index_params)
+                with self._rw_lock.write():
+                    self.db = db
+                    self.lexical = None  # Positions changed; side indexes rebuild lazily
+                    self.filters = None
+                    self.corpus_version += 1
+                self.chunk_ids, self.paper_ids = set(), set()
+                self._load_fingerprints()
+                self._needs_full_save = False  # The rebuilt index was replaced
+                self._maybe_rebuild_index()
+                how = f"loaded base '{manifest['base']}'"
+            self._snapshot = manifest
+            logger.info(f"Reloaded index snapshot v{manifest.get('version', 0)} ({how}, "
+                        f"{self.db.index.ntotal} vectors) in {time.time() - start:.2f}s")
+            return True
+        finally:
+            self._write_lock.release()
+
+    def _absorb_published(self) -> int:
+        """Copy chunks other processes published since our snapshot into the index.
+
+        Called with the store locked, before a full base replaces every
+        published segment and base; otherwise chunks saved by another
+        writer meanwhile would be lost. Returns the number of chunks added.
+        """
+        if not self.store.exists() or self.store.version() == self._snapshot.get("version", 0):
+            return 0
+        published, manifest = self.store.load_snapshot()
+        ids = published.index_to_docstore_id
+        positions, docs, fingerprints = [], [], []
+        for pos in range(published.index.ntotal):
+            if ids.get(pos) in self.chunk_ids:
+                continue
+            doc = document_at(published, pos)
+            if doc is None or doc.page_content == PLACEHOLDER_TEXT:
+                continue
+            fingerprint = doc.metadata.get("chunk_id") or chunk_fingerprint(doc.page_content)
+            if fingerprint in self.chunk_ids or fingerprint in fingerprints:
+                continue
+            positions.append(pos)
+            docs.append(doc)
+            fingerprints.append(fingerprint)
+        if docs:
+            if index_storage(published.index) == "float32":
+                vectors = reconstruct_all(published.index)[positions]
+            else:
+                vectors = self.embeddings.embed_documents_array([d.page_content for d in docs])
+            self._commit_chunks(docs, vectors, [ids[pos] for pos in positions])
+            self.chunk_ids.update(fingerprints)
+            self.paper_ids.update(d.metadata["paper_id"] for d in docs if d.metadata.get("paper_id"))
+            logger.info(f"Added {len(docs)} chunks published by another process before a full save")
+        self._snapshot = manifest
+        return len(docs)
+
+    def _maybe_reload(self) -> None:
+        # Per search; looks at the manifest at most every ``reload_interval`` seconds
+        if self.reload_interval is None or not self._ready:
+            return
+        now = time.time()
+        if now - self._last_reload_check < self.reload_interval:
+            return
+        self._last_reload_check = now
+        try:
+            self.reload()
+        except Exception as e:
+            logger.error(f"Index reload failed: {e}")
 
     # --------------------
     # Indexing
     # --------------------
-    def add_paper(self, title: str, content: str, source: str = "Unknown", **extra_metadata: Any) -> None:
+    @staticmethod
+    def _new_report() -> Dict[str, int]:
+        """Empty ingestion report, as returned by the ``add_*`` methods."""
+        return {"papers_added": 0, "papers_skipped": 0, "near_duplicates": 0, "chunks_added": 0, "chunks_skipped": 0}
+
+    def _new_chunk_docs(self, paper_id: str, content: str, meta: Dict[str, Any],
+                        report: Dict[str, int]) -> List[Document]:
+        """Split content and return Documents for chunks not yet indexed."""
+        splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
+        chunks = splitter.split_text(content)
+        docs = []
+        for chunk in chunks:
+            chunk_id = chunk_fingerprint(chunk)
+            if chunk_id in self.chunk_ids:
+                report["chunks_skipped"] += 1
+                continue
+            self.chunk_ids.add(chunk_id)
+            self._uncommitted_chunks.add(chunk_id)
+            metadata = {**meta, "paper_id": paper_id, "chunk_id": chunk_id}
+            if self.session_id:
+                metadata["session_id"] = self.session_id  # Session that first indexed the chunk
+            docs.append(Document(page_content=chunk, metadata=metadata))
+        report["chunks_added"] += len(docs)
+        return docs
+
+    def _add_chunk_docs(self, docs: List[Document]) -> None:
+        """Embed ``docs`` and commit them to the index (writer lock held)."""
+        vectors = self.embeddings.embed_documents_array([d.page_content for d in docs])
+        self._commit_chunks(docs, vectors, [d.metadata["chunk_id"] for d in docs])
+        self._unsaved_chunks = True
+        if self.persistence == "incremental":
+            self._pending_vectors.append(vectors)
+            self._pending_docs.extend(docs)
+        self._maybe_rebuild_index()
+
+    def _commit_chunks(self, docs: List[Document], vectors: np.ndarray, ids: List[str]) -> None:
+        """Append embedded ``docs`` to the index and side indexes (writer lock held)."""
+        texts = [d.page_content for d in docs]
+        self._unmap_index()
+        with self._rw_lock.write():
+            first_position = self.db.index.ntotal
+            self.db.add_embeddings(
+                list(zip(texts, vectors.tolist())),
+                metadatas=[d.metadata for d in docs],
+                ids=ids,
+            )
+            if self.lexical is not None:
+                for offset, text in enumerate(texts):
+                    self.lexical.add(first_position + offset, text)
+            if self.filters is not None:
+                for offset, doc in enumerate(docs):
+                    self.filters.add(first_position + offset, doc.metadata)
+            self.corpus_version += 1
+        self._uncommitted_chunks.difference_update(ids)
+
+    @contextmanager
+    def _ingesting(self) -> Iterator[None]:
+        """Roll back uncommitted fingerprints if the ingestion in this block fails.
+
+        Chunk and paper fingerprints are reserved while papers are chunked
+        (so duplicates within one call are skipped) and confirmed once the
+        chunks are in the index and the paper's catalog row is written.
+        Without the rollback a failed embedding call would leave papers
+        marked as indexed, and a retry would skip them.
+        """
+        try:
+            yield
+        except BaseException:
+            self.chunk_ids -= self._uncommitted_chunks
+            self.paper_ids -= self._uncommitted_papers
+            if self.dedup is not None:
+                self.dedup.discard(self._uncommitted_papers)
+            raise
+        finally:
+            self._uncommitted_chunks.clear()
+            self._uncommitted_papers.clear()
+
+    def _attach_to_session(self, paper_ids: List[str]) -> None:
+        """Record ``paper_ids`` (new or already indexed) as used by the current session."""
+        if self.session_id and self.catalog.add_to_session(self.session_id, paper_ids):
+            self.corpus_version += 1  # Session-scoped results change
+
+    def add_paper(self, title: str, content: str, source: str = "Unknown", **extra_metadata: Any) -> Dict[str, int]:
         """Add a single paper (usually abstract + title) to the index.
 
-        Metadata is stored both at the document-chunk level and in a
-        lightweight catalog keyed by title for downstream citation lookup.
+        Metadata is stored both at the document-chunk level and in the
+        paper catalog keyed by paper ID for downstream citation lookup.
+        Re-adding a paper that is already indexed is a no-op.
         """
-        if not content or not content.strip():
-            logger.warning(f"Skipping paper with empty content: {title}")
-            return
+        with self._write_lock, self._ingesting():
+            report = self._new_report()
+            self._ensure_loaded()
+            if not content or not content.strip():
+                logger.warning(f"Skipping paper with empty content: {title}")
+                return report
 
-        logger.debug(f"Adding paper to index: '{title}' (source: {source})")
-        splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
-        chunks = splitter.split_text(content)
-        logger.debug(f"  Split into {len(chunks)} chunks")
+            paper_id = paper_fingerprint(title, content)
+            known = paper_id in self.paper_ids
+            if not known and self.dedup is not None:
+                match = self.dedup.check(paper_id, {"title": title, **extra_metadata}, content)
+                if match is not None:
+                    logger.info(f"Skipping '{title}': duplicate of indexed paper {match[0]} ({match[1]})")
+                    paper_id, known = match[0], True
+                    report["near_duplicates"] = 1
+            if known:
+                logger.debug(f"Paper already indexed, skipping: '{title}'")
+                report["papers_skipped"] = 1
+                self._attach_to_session([paper_id])
+                self.last_ingest_report = report
+                return report
 
-        base_meta: Dict[str, Any] = {"title": title, "source": source}
-        base_meta.update(extra_metadata)
+            logger.debug(f"Adding paper to index: '{title}' (source: {source})")
+            base_meta: Dict[str, Any] = {"title": title, "source": source}
+            base_meta.update(extra_metadata)
 
-        docs = [
-            Document(page_content=chunk, metadata=base_meta)
-            for chunk in chunks
-        ]
-        self.db.add_documents(docs)
+            docs = self._new_chunk_docs(paper_id, content, base_meta, report)
+            logger.debug(f"  {len(docs)} new chunks, {report['chunks_skipped']} duplicates skipped")
+            self.paper_ids.add(paper_id)
+            self._uncommitted_papers.add(paper_id)
+            if docs:
+                self._add_chunk_docs(docs)
+            report["papers_added"] = 1
 
-        # Update high-level metadata catalog (used for citations/summaries)
-        self.metadata[title] = base_meta
-        self._save_metadata()
+            # Update high-level metadata catalog (used for citations/summaries)
+            self.catalog.upsert(paper_id, base_meta)
+            self._uncommitted_papers.discard(paper_id)
+            if self.dedup is not None:
+                self.dedup.commit([paper_id])
+            self._attach_to_session([paper_id])
+            self.last_ingest_report = report
+            return report
 
-    def add_papers(self, papers: List[Dict[str, Any]]) -> None:
-        """Bulk-add papers with batch processing for efficiency."""
-        if not papers:
-            return
-        
-        logger.info(f"Batch processing {len(papers)} papers")
-        all_docs = []
-        
-        for p in papers:
-            title = p.get("title") or "Untitled"
-            abstract = p.get("abstract") or ""
-            source = p.get("source", "Unknown")
-            
-            if not abstract or not abstract.strip():
-                logger.debug(f"Skipping paper with empty abstract: {title}")
-                continue
-            
-            # Prepare metadata
-            meta = {
-                "title": title,
-                "source": source,
-                "authors": p.get("authors"),
-                "year": p.get("year"),
-                "url": p.get("url"),
-            }
-            
-            # Split into chunks
-            splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
-            chunks = splitter.split_text(abstract or title)
-            
-            # Create documents
-            for chunk in chunks:
-                all_docs.append(Document(page_content=chunk, metadata=meta))
-            
-            # Update metadata catalog
-            self.metadata[title] = meta
-        
-        # Batch add all documents at once for efficiency
-        if all_docs:
-            logger.info(f"Adding {len(all_docs)} document chunks to index")
-            self.db.add_documents(all_docs)
-            self._save_metadata()
+    def _page_chunk_docs(self, paper_id: str, pages: Iterable[Any], meta: Dict[str, Any],
+                         report: Dict[str, int]) -> Iterable[Document]:
+        """Lazily chunk ``(page_number, text)`` pairs; chunks never span pages."""
+        for page, text in pages:
+            if text and text.strip():
+                yield from self._new_chunk_docs(paper_id, text, {**meta, "page": page}, report)
+
+    def _prepare_paper(self, p: Dict[str, Any], report: Dict[str, int]) -> Optional[Any]:
+        """Fingerprint and chunk one paper dict (writer lock held).
+
+        Returns ``(paper_id, meta, new_docs)``, with ``meta`` None for a
+        paper that is already indexed, or None for a paper without an
+        abstract. A paper may carry full text as ``pages`` (an iterable of
+        ``(page_number, text)``, see `pdf_ingestion`) instead of an
+        abstract; its chunks are then produced lazily, keep their page
+        number, and the paper is identified by its ``paper_id``.
+        """
+        title = p.get("title") or "Untitled"
+        abstract = p.get("abstract") or ""
+        source = p.get("source", "Unknown")
+        pages = p.get("pages")
+
+        if pages is None and (not abstract or not abstract.strip()):
+            logger.debug(f"Skipping paper with empty abstract: {title}")
+            return None
+
+        paper_id = p.get("paper_id") or paper_fingerprint(title, abstract)
+        if paper_id in self.paper_ids:
+            logger.debug(f"Paper already indexed, skipping: '{title}'")
+            report["papers_skipped"] += 1
+            return paper_id, None, []
+        if self.dedup is not None:
+            # Full-text uploads are always indexed, but later abstracts of them are not
+            match = None
+            if pages is None:
+                match = self.dedup.check(paper_id, p, abstract)
+            else:
+                self.dedup.register(paper_id, p)
+            if match is not None:
+                logger.info(f"Skipping '{title}' from {source}: duplicate of indexed paper {match[0]} ({match[1]})")
+                report["papers_skipped"] += 1
+                report["near_duplicates"] += 1
+                return match[0], None, []
+
+        # Prepare metadata
+        meta = {
+            "title": title,
+            "source": source,
+            "authors": p.get("authors"),
+            "year": p.get("year"),
+            "url": p.get("url"),
+        }
+        meta.update({k: p[k] for k in ("doi", "arxiv_id") if p.get(k)})
+
+        # Split into chunks, keeping only ones not already indexed
+        if pages is not None:
+            meta.update({k: v for k, v in p.items() if k not in meta and k not in ("abstract", "pages", "paper_id")})
+            docs = self._page_chunk_docs(paper_id, pages, meta, report)
         else:
-            logger.warning("No valid documents to add")
+            docs = self._new_chunk_docs(paper_id, abstract, meta, report)
+        self.paper_ids.add(paper_id)
+        self._uncommitted_papers.add(paper_id)
+        report["papers_added"] += 1
+        return paper_id, meta, docs
+
+    def add_papers(self, papers: List[Dict[str, Any]]) -> Dict[str, int]:
+        """Bulk-add papers with batch processing for efficiency.
+
+        Papers and chunks whose fingerprints are already indexed (in this
+        or an earlier session) are skipped. Returns a report with counts
+        of added and skipped papers/chunks.
+        """
+        with self._write_lock, self._ingesting():
+            report = self._new_report()
+            if not papers:
+                return report
+            self._ensure_loaded()
+
+            logger.info(f"Batch processing {len(papers)} papers")
+            all_docs = []
+            catalog_rows = []
+            session_papers = []
+
+            for p in papers:
+                prepared = self._prepare_paper(p, report)
+                if prepared is None:
+                    continue
+                paper_id, meta, docs = prepared
+                session_papers.append(paper_id)
+                if meta is not None:
+                    all_docs.extend(docs)
+                    # Queue metadata catalog update
+                    catalog_rows.append((paper_id, meta))
+
+            # Batch add all documents at once for efficiency
+            if all_docs:
+                logger.info(f"Adding {len(all_docs)} document chunks to index")
+                self._add_chunk_docs(all_docs)
+            else:
+                logger.warning("No new documents to add")
+            self.catalog.upsert_many(catalog_rows)
+            self._uncommitted_papers.difference_update([pid for pid, _ in catalog_rows])
+            if self.dedup is not None:
+                self.dedup.commit(pid for pid, _ in catalog_rows)
+            self._attach_to_session(session_papers)
+
+            logger.info(
+                f"Ingestion report: {report['papers_added']} papers added, {report['papers_skipped']} already indexed "
+                f"({report['near_duplicates']} cross-source duplicates); "
+                f"{report['chunks_added']} chunks added, {report['chunks_skipped']} duplicate chunks skipped"
+            )
+            self.last_ingest_report = report
+            return report
+
+    def add_papers_stream(self, papers: Iterable[Dict[str, Any]], batch_size: int = STREAM_BATCH_SIZE,
+                          queue_batches: int = STREAM_QUEUE_BATCHES, save_every: Optional[int] = STREAM_SAVE_EVERY,
+                          progress: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, int]:
+        """Ingest an iterator of paper dicts in bounded memory.
+
+        The calling thread deduplicates and chunks papers and hands
+        fixed-size chunk batches to a worker thread that embeds them and
+        commits them to the index, so each batch is searchable as soon as
+        it is committed. The hand-off queue holds at most ``queue_batches``
+        batches: when embedding falls behind, reading the iterator pauses.
+        A paper's catalog row is written with the batch holding its last
+        chunk, and the index is saved every ``save_every`` batches and at
+        the end (``save_every=None`` leaves saving to the caller).
+
+        ``progress`` is called from the worker after every committed batch
+        with the running report plus ``batches``, ``chunks_committed`` and
+        ``elapsed_seconds``. Returns the same report as `add_papers`.
+        """
+        report = self._new_report()
+        start = time.time()
+        handoff: "queue.Queue[Any]" = queue.Queue(maxsize=max(1, queue_batches))
+        failure: List[BaseException] = []
+        committed = {"batches": 0, "chunks_committed": 0}
+
+        def _worker() -> None:
+            while True:
+                item = handoff.get()
+                if item is None:
+                    return
+                if failure:
+                    continue  # Drain so the producer never blocks on a dead worker
+                docs, rows = item
+                try:
+                    if docs:
+                        self._add_chunk_docs(docs)
+                    self.catalog.upsert_many([(pid, meta) for pid, meta in rows if meta is not None])
+                    self._uncommitted_papers.difference_update([pid for pid, meta in rows if meta is not None])
+                    if self.dedup is not None:
+                        self.dedup.commit(pid for pid, meta in rows if meta is not None)
+                    self._attach_to_session([pid for pid, _ in rows])
+                    committed["batches"] += 1
+                    committed["chunks_committed"] += len(docs)
+                    if save_every and committed["batches"] % save_every == 0:
+                        self._persist()
+                    if progress is not None:
+                        progress({**report, **committed, "elapsed_seconds": round(time.time() - start, 2)})
+                except BaseException as e:
+                    failure.append(e)
+
+        with self._write_lock, self._ingesting():
+            self._ensure_loaded()
+            worker = threading.Thread(target=_worker, name="rag-stream-ingest", daemon=True)
+            worker.start()
+            buffer: List[Document] = []
+            rows: List[Any] = []  # (chunks produced through this paper, paper_id, meta)
+            produced = emitted = 0
+
+            def _emit(docs: List[Document], final: bool = False) -> None:
+                nonlocal emitted, rows
+                emitted += len(docs)
+                ready = [(pid, meta) for end, pid, meta in rows if final or end <= emitted]
+                rows = [] if final else [r for r in rows if r[0] > emitted]
+                if docs or ready:
+                    handoff.put((docs, ready))
+
+            try:
+                for p in papers:
+                    if failure:
+                        break
+                    prepared = self._prepare_paper(p, report)
+                    if prepared is None:
+                        continue
+                    paper_id, meta, docs = prepared
+                    for doc in docs:  # May be lazy (full-text pages)
+                        buffer.append(doc)
+                        produced += 1
+                        if len(buffer) >= batch_size:
+                            _emit(buffer)
+                            buffer = []
+                    rows.append((produced, paper_id, meta))
+                if not failure:
+                    _emit(buffer, final=True)
+            finally:
+                handoff.put(None)
+                worker.join()
+            if failure:
+                raise failure[0]
+            if save_every:
+                self._persist()
+
+        logger.info(
+            f"Streaming ingestion: {report['papers_added']} papers added, {report['papers_skipped']} already indexed "
+            f"({report['near_duplicates']} cross-source duplicates); "
+            f"{report['chunks_added']} chunks in {committed['batches']} batches, "
+            f"{report['chunks_skipped']} duplicate chunks skipped in {time.time() - start:.2f}s"
+        )
+        self.last_ingest_report = report
+        return report
 
     # --------------------
     # Retrieval
     # --------------------
-    def similarity_search(self, query: str, k: int = 4) -> List[Dict[str, Any]]:
-        """Return structured search results for use by tools/agents.
+    def _search_ids(self, queries: np.ndarray, k: int, mask: Optional[np.ndarray] = None) -> Any:
+        """Search ``queries`` (n x d) and return ``(distances, positions)``.
 
-        Each result contains page_content and metadata including title,
-        source, authors, year, and url when available.
+        With ``rescore`` enabled on a quantized index, ``k * rescore_k_factor``
+        candidates are fetched and re-ranked by exact L2 distance using
+        full-precision vectors from the embedding cache. ``mask`` (one bool
+        per position) restricts the search to matching chunks.
         """
-        start_time = time.time()
-        cache_key = f"{query}::k={k}"
-        cache_hit = cache_key in self.query_cache
-        
-        if cache_hit:
-            logger.debug(f"Returning cached results for query: '{query[:50]}...'")
-            duration = time.time() - start_time
-            # Log to metrics if available
-            try:
-                from main import metrics
-                metrics.log_rag_operation("similarity_search", query, len(self.query_cache[cache_key]), duration, cache_hit=True)
-            except:
-                pass
-            return self.query_cache[cache_key]
-
-        logger.info(f"Performing similarity search - Query: '{query[:100]}...', k={k}")
-        docs = self.db.similarity_search(query, k=k)
-        logger.info(f"Found {len(docs)} results")
-        results: List[Dict[str, Any]] = []
-        for doc in docs:
-            meta = doc.metadata or {}
-            results.append(
-                {
-                    "content": doc.page_content,
-                    "title": meta.get("title", "Untitled"),
-                    "source": meta.get("source", "N/A"),
-                    "authors": meta.get("authors"),
-                    "year": meta.get("year"),
-                    "url": meta.get("url"),
-                }
-            )
+        index = self.db.index
+        queries = np.ascontiguousarray(queries, dtype=np.float32)
+        rescore = self.index_params["rescore"] and index_storage(index) != "float32"
+        fetch_k = min(k * self.index_params["rescore_k_factor"] if rescore else k, index.ntotal)
+        if mask is not None:
+            fetch_k = min(fetch_k, int(mask.sum()))
+        if fetch_k <= 0:
+            return np.zeros((len(queries), 0), dtype=np.float32), np.zeros((len(queries), 0), dtype=np.int64)
+        if mask is None:
+            D, I = index.search(queries, fetch_k)
+        else:
+            D, I = self._filtered_search(queries, fetch_k, mask)
+        if not rescore:
+            return D, I
+
+        candidates = sorted({int(i) for i in I.ravel() if i != -1})
+        exact = self.embeddings.embed_documents_array([self._doc_at(i).page_content for i in candidates])
+        row = {pos: r for r, pos in enumerate(candidates)}
+        out_D = np.full((len(queries), min(k, fetch_k)), np.inf, dtype=np.float32)
+        out_I = np.full(out_D.shape, -1, dtype=np.int64)
+        for qi in range(len(queries)):
+            cand = [int(i) for i in I[qi] if i != -1]
+            if not cand:
+                continue
+            vecs = exact[[row[i] for i in cand]]
+            dist = ((vecs - queries[qi]) ** 2).sum(axis=1)
+            order = np.argsort(dist)[:out_D.shape[1]]
+            out_D[qi, :len(order)] = dist[order]
+            out_I[qi, :len(order)] = np.asarray(cand)[order]
+        return out_D, out_I
+
+    def _filtered_search(self, queries: np.ndarray, k: int, mask: np.ndarray) -> Any:
+        """Index search restricted to positions set in ``mask``.
+
+        The mask is packed into a bitmap and passed to FAISS as an
+        `IDSelectorBitmap`, so excluded vectors are skipped during the scan
+        (flat), list traversal (IVF) or graph walk (HNSW) and a filtered
+        query costs about the same as an unfiltered one.
+        """
+        index = self.db.index
+        bitmap = np.packbits(mask, bitorder="little")  # Must outlive the search call
+        selector = faiss.IDSelectorBitmap(len(mask), faiss.swig_ptr(bitmap))
+        params = filtered_search_params(index, self.index_params, selector)
+        if params is not None:
+            return index.search(queries, k, params=params)
+
+        # No selector support: over-fetch in proportion to the selectivity
+        fetch_k = min(index.ntotal, 2 * k * index.ntotal // max(int(mask.sum()), 1))
+        D, I = index.search(queries, fetch_k)
+        out_D = np.full((len(queries), k), np.inf, dtype=np.float32)
+        out_I = np.full(out_D.shape, -1, dtype=np.int64)
+        for qi in range(len(queries)):
+            keep = np.flatnonzero((I[qi] != -1) & mask[np.maximum(I[qi], 0)])[:k]
+            out_D[qi, :len(keep)] = D[qi, keep]
+            out_I[qi, :len(keep)] = I[qi, keep]
+        return out_D, out_I
+
+    def _ensure_filters(self) -> ChunkFilters:
+        with self._build_lock:
+            if self.filters is None:
+                start = time.time()
+                filters = ChunkFilters()
+                for pos in range(self.db.index.ntotal):
+                    filters.add(pos, metadata_at(self.db, pos) or {})
+                self.filters = filters
+                logger.info(f"Built filter columns over {len(filters)} chunks in {time.time() - start:.2f}s")
+        return self.filters
+
+    def _filter_mask(self, filters: Dict[str, Any]) -> Optional[np.ndarray]:
+        """Boolean mask over index positions for ``filters``, or None if unfiltered."""
+        filters = {name: value for name, value in filters.items() if value is not None}
+        if not filters:
+            return None
+        sessions = filters.pop("sessions", None)
+        if sessions is not None:
+            if isinstance(sessions, str):
+                sessions = [sessions]
+            filters["papers"] = [pid for s in sessions for pid in self.catalog.session_papers(s)]
+        return self._ensure_filters().mask(self.db.index.ntotal, **filters)
+
+    def _ensure_lexical(self) -> InvertedIndex:
+        with self._build_lock:
+            if self.lexical is None:
+                start = time.time()
+                lexical = InvertedIndex()
+                for pos in range(self.db.index.ntotal):
+                    doc = self._doc_at(pos)
+                    lexical.add(pos, doc.page_content if doc is not None else "")
+                self.lexical = lexical
+                logger.info(f"Built BM25 index over {len(lexical)} chunks in {time.time() - start:.2f}s")
+        return self.lexical
+
+    def _is_generic_term(self, term: str) -> bool:
+        # Only consults a BM25 index that hybrid search already built; without
+        # one every differing key term keeps the semantic cache from answering
+        lexical = self.lexical
+        return lexical is not None and lexical.document_share(term) > SEMANTIC_CACHE_GENERIC_SHARE
 
-        self.query_cache[cache_key] = results
-        duration = time.time() - start_time
-        
+    def _search_positions(self, texts: List[str], vectors: np.ndarray, k: int,
+                          mask: Optional[np.ndarray] = None) -> List[List[int]]:
+        """Top-``k`` chunk positions per query (dense, or dense + BM25 fused)."""
+        if not self.hybrid:
+            _, I = self._search_ids(vectors, k, mask)
+            return [[int(i) for i in row if i != -1] for row in I]
+        fetch_k = max(k * HYBRID_CANDIDATES, 20)
+        _, I = self._search_ids(vectors, fetch_k, mask)
+        lexical = self._ensure_lexical()
+        return [
+            reciprocal_rank_fusion([[int(i) for i in row if i != -1], lexical.search(text, fetch_k, mask)], k)
+            for text, row in zip(texts, I)
+        ]
+
+    def _search_docs(self, texts: List[str], vectors: np.ndarray, k: int,
+                     filters: Optional[Dict[str, Any]] = None) -> List[List[Document]]:
+        mask = self._filter_mask(filters or {})
+        results = []
+        for positions in self._search_positions(texts, vectors, k, mask):
+            docs = [self._doc_at(p) for p in positions]
+            results.append([d for d in docs if d is not None])
+        return results
+
+    @staticmethod
+    def _log_rag_operation(operation: str, query: str, results_count: int, duration: float, cache_hit: bool) -> None:
         # Log to metrics if available
         try:
             from main import metrics
-            metrics.log_rag_operation("similarity_search", query, len(results), duration, cache_hit=False)
+            metrics.log_rag_operation(operation, query, results_count, duration, cache_hit=cache_hit)
         except:
             pass
-        
+
+    @staticmethod
+    def _result_from_doc(doc: Document) -> Dict[str, Any]:
+        meta = doc.metadata or {}
+        return {
+            "content": doc.page_content,
+            "title": meta.get("title", "Untitled"),
+            "source": meta.get("source", "N/A"),
+            "authors": meta.get("authors"),
+            "year": meta.get("year"),
+            "url": meta.get("url"),
+            "page": meta.get("page"),
+            "paper_id": meta.get("paper_id"),
+        }
+
+    def similarity_search(self, query: str, k: int = 4, year_from: Optional[int] = None,
+                          year_to: Optional[int] = None, sources: Any = None,
+                          sessions: Any = None, global_fallback: bool = False) -> List[Dict[str, Any]]:
+        """Return structured search results for use by tools/agents.
+
+        Each result contains page_content and metadata including title,
+        source, authors, year, and url when available.
+
+        ``year_from``/``year_to`` (inclusive), ``sources`` and ``sessions``
+        (a name or list of names) restrict the search to matching chunks.
+        Filtering happens inside the FAISS search, so up to ``k`` matching
+        results are returned without over-fetching. With
+        ``global_fallback``, a filtered query that finds nothing is re-run
+        over the whole corpus and its results are marked ``scope="global"``.
+        """
+        filters = {"year_from": year_from, "year_to": year_to, "sources": sources, "sessions": sessions}
+        return self._similarity_search_many([query], k, "similarity_search", filters, global_fallback)[0]
+
+    def similarity_search_many(self, queries: List[str], k: int = 4, year_from: Optional[int] = None,
+                               year_to: Optional[int] = None, sources: Any = None,
+                               sessions: Any = None, global_fallback: bool = False) -> List[List[Dict[str, Any]]]:
+        """Batched `similarity_search`: one result list per query, in order.
+
+        All uncached queries are embedded in a single ``model.encode`` call
+        and searched with one matrix query against the index. Filters apply
+        to every query.
+        """
+        filters = {"year_from": year_from, "year_to": year_to, "sources": sources, "sessions": sessions}
+        return self._similarity_search_many(list(queries), k, "similarity_search_many", filters, global_fallback)
+
+    def _similarity_search_many(self, queries: List[str], k: int, operation: str,
+                                filters: Optional[Dict[str, Any]] = None,
+                                global_fallback: bool = False) -> List[List[Dict[str, Any]]]:
+        start_time = time.time()
+        self._maybe_reload()
+        results: List[Optional[List[Dict[str, Any]]]] = [None] * len(queries)
+        misses: Dict[str, List[int]] = {}
+        version = self.corpus_version
+        filters = {name: value for name, value in (filters or {}).items() if value is not None}
+        suffix = f"::k={k}" + (f"::{json.dumps(filters, sort_keys=True)}" if filters else "")
+        for i, query in enumerate(queries):
+            cached = self.query_cache.get(query + suffix, version)
+            if cached is not None:
+                logger.debug(f"Returning cached results for query: '{query[:50]}...'")
+                results[i] = cached
+            else:
+                misses.setdefault(query, []).append(i)
+
+        pending: List[str] = []
+        if misses:
+            self._ensure_loaded()
+            pending = list(misses)
+            vectors = self.embeddings.embed_queries(pending)
+            if self.semantic_cache is not None:
+                unmatched = []
+                for row, query in enumerate(pending):
+                    hit = self.semantic_cache.get(vectors[row], suffix, self.corpus_version, query)
+                    if hit is None:
+                        unmatched.append(row)
+                        continue
+                    matched, found, similarity = hit
+                    logger.info(f"Reusing results of similar query '{matched[:50]}' (cosine {similarity:.3f}) "
+                                f"for '{query[:50]}'")
+                    self.query_cache.put(query + suffix, found, self.corpus_version)
+                    for i in misses[query]:
+                        results[i] = found
+                pending, vectors = [pending[row] for row in unmatched], vectors[unmatched]
+
+        if pending:
+            logger.info(f"Performing similarity search - {len(pending)} queries, first: '{pending[0][:100]}...', k={k}")
+            with self._rw_lock.read():
+                version = self.corpus_version  # Read before the index so results never outdate their tag
+                docs_per_query = self._search_docs(pending, vectors, k, filters)
+            for row, (query, docs) in enumerate(zip(pending, docs_per_query)):
+                found = [self._result_from_doc(doc) for doc in docs]
+                logger.info(f"Found {len(found)} results")
+                self.query_cache.put(query + suffix, found, version)
+                if self.semantic_cache is not None:
+                    self.semantic_cache.put(vectors[row], suffix, version, query, found)
+                for i in misses[query]:
+                    results[i] = found
+
+        duration = (time.time() - start_time) / max(len(queries), 1)
+        searched = set(pending)
+        for query, found in zip(queries, results):
+            self._log_rag_operation(operation, query, len(found), duration, cache_hit=query not in searched)
+
+        empty = [i for i, found in enumerate(results) if not found] if filters and global_fallback else []
+        if empty:
+            logger.info(f"No results for {len(empty)} filtered queries; falling back to the global corpus")
+            retry = self._similarity_search_many([queries[i] for i in empty], k, operation)
+            for i, found in zip(empty, retry):
+                results[i] = [{**r, "scope": "global"} for r in found]
         return results
 
-    def search(self, query: str, k: int = 4) -> str:
+    def search(self, query: str, k: int = 4, token_budget: Optional[int] = None, **filters: Any) -> str:
         """Human/LLM-friendly string view of retrieved evidence.
 
         This is what the RAG tool currently exposes to agents. It keeps
         explicit citation handles [P1], [P2], ... to encourage traceable
-        referencing in downstream reasoning.
+        referencing in downstream reasoning. ``filters`` are the keyword
+        filters of `similarity_search`.
+
+        Passages are formatted by `EvidencePacker`: one handle per paper,
+        paper details printed once and, with ``token_budget``, only the
+        most relevant passages that fit in about that many tokens.
+        """
+        return EvidencePacker().pack(self.similarity_search(query, k=k, **filters), token_budget)
+
+    def search_many(self, queries: List[str], k: int = 4, token_budget: Optional[int] = None,
+                    **filters: Any) -> List[str]:
+        """String view of `similarity_search_many`, one block per query.
+
+        Citation handles keep counting across queries so [P#] stays
+        unambiguous when the blocks are shown together. ``token_budget``
+        is the total for all blocks and is split evenly between them.
+        """
+        result_lists = self.similarity_search_many(queries, k=k, **filters)
+        packer = EvidencePacker()
+        per_query = token_budget // max(len(queries), 1) if token_budget is not None else None
+        return [packer.pack(results, per_query) for results in result_lists]
+
+    # --------------------
+    # Maintenance
+    # --------------------
+    def _live_positions(self, drop_orphans: bool) -> Any:
+        """Classify every index position; returns ``(keep, removed_counts)``.
+
+        A position is dropped when it is the legacy placeholder, has no
+        docstore entry, repeats a chunk fingerprint already kept, or (with
+        ``drop_orphans``) belongs to a paper missing from the catalog.
+        Chunks indexed before paper ids existed are matched by title.
+        """
+        removed = {"placeholder": 0, "missing": 0, "duplicates": 0, "orphans": 0}
+        paper_ids, titles = self.catalog.paper_ids(), self.catalog.titles()
+        if drop_orphans and not paper_ids:
+            logger.warning("Paper catalog is empty; not dropping orphaned chunks")
+            drop_orphans = False
+        seen: set = set()
+        keep: List[int] = []
+        for pos in range(self.db.index.ntotal):
+            doc = self._doc_at(pos)
+            if doc is None:
+                removed["missing"] += 1
+                continue
+            meta = doc.metadata or {}
+            if doc.page_content == PLACEHOLDER_TEXT and not meta:
+                removed["placeholder"] += 1
+                continue
+            fingerprint = meta.get("chunk_id") or chunk_fingerprint(doc.page_content)
+            if fingerprint in seen:
+                removed["duplicates"] += 1
+                continue
+            if drop_orphans and (meta["paper_id"] not in paper_ids if meta.get("paper_id")
+                                 else meta.get("title") not in titles):
+                removed["orphans"] += 1
+                continue
+            seen.add(fingerprint)
+            keep.append(pos)
+        return keep, removed
+
+    def compact(self, drop_orphans: bool = True, dry_run: bool = False) -> Dict[str, Any]:
+        """Rebuild the index with only live, unique chunks and swap it in.
+
+        Drops the legacy "Initial document" placeholder, positions without
+        a document, duplicate chunks and (``drop_orphans``) chunks of papers
+        no longer in the catalog; see `_live_positions`. Docstore entries
+        no index position refers to are dropped too. The compacted index
+        keeps the current layout (flat if too small to train it), is
+        written as a new base (superseded files are deleted) and then
+        replaces the in-memory index under the exclusive lock, so
+        searches see either the old or the new index. Returns a report
+        with removal counts and before/after sizes; ``dry_run`` only
+        reports.
         """
-        results = self.similarity_search(query, k=k)
-        lines = []
-        for idx, r in enumerate(results, start=1):
-            handle = f"P{idx}"
-            title = r.get("title", "Untitled")
-            source = r.get("source", "N/A")
-            authors = r.get("authors") or "Unknown authors"
-            year = r.get("year") or "n.d."
-            url = r.get("url") or ""
+        self._ensure_loaded()
+        start = time.time()
+        with self._write_lock:
+            self.store.wait_for_merge()  # Before locking the store: the merge needs the lock to finish
+            with self.store.locked():
+                if not dry_run:
+                    self._absorb_published()
+                index = self.db.index
+                keep, removed = self._live_positions(drop_orphans)
+                report: Dict[str, Any] = {
+                    "vectors_before": index.ntotal,
+                    "vectors_after": len(keep),
+                    **{f"removed_{k}": v for k, v in removed.items()},
+                    "removed_unreferenced_docs": len(
+                        {doc_id for doc_id, _ in docstore_metadata(self.db.docstore)}
+                        - set(self.db.index_to_docstore_id.values())),
+                    "index_memory_mb_before": round(index_memory_bytes(index) / 2 ** 20, 2),
+                    "disk_mb_before": round(self.store.disk_bytes() / 2 ** 20, 2),
+                }
+                if dry_run:
+                    return report
+                if len(keep) == index.ntotal and not report["removed_unreferenced_docs"]:
+                    logger.info("Index is already compact")
+                    return {**report, "index_memory_mb_after": report["index_memory_mb_before"],
+                            "disk_mb_after": report["disk_mb_before"], "seconds": round(time.time() - start, 2)}
+
+                kind, storage = index_kind(index), index_storage(index)
+                if (kind == "ivf" and _ivf_nlist(len(keep), self.index_params) < 2) \
+                        or len(keep) < _min_train_size(storage, self.index_params):
+                    kind, storage = "flat", "float32"  # Too small to train; may be promoted again later
+                vectors = self._all_vectors(keep) if keep else np.zeros((0, index.d), dtype=np.float32)
+                ids = [self.db.index_to_docstore_id[pos] for pos in keep]
+                self.store.write_base(FAISS(
+                    self.embeddings,
+                    build_index(kind, vectors, {**self.index_params, "storage": storage}),
+                    InMemoryDocstore({doc_id: self._doc_at(pos) for doc_id, pos in zip(ids, keep)}),
+                    dict(enumerate(ids)),
+                ))
+                compacted, self._snapshot = self.store.load_snapshot()  # Serve the new base mapped
+                configure_search(compacted.index, self.index_params)
+                with self._rw_lock.write():
+                    self.db = compacted
+                    self.lexical = None  # Positions changed; side indexes rebuild lazily
+                    self.filters = None
+                    self.corpus_version += 1
+                self._pending_vectors = []
+                self._pending_docs = []
+                self._needs_full_save = False
+                self._unsaved_chunks = False
+                self.chunk_ids, self.paper_ids = set(), set()
+                self._load_fingerprints()
+                self._maybe_rebuild_index()
+                if self._needs_full_save:
+                    self._persist()
 
-            header = f"[{handle}] {title} — {authors} ({year}, {source})"
-            if url:
-                header += f"\nURL: {url}"
+        report.update(
+            index_memory_mb_after=round(index_memory_bytes(self.db.index) / 2 ** 20, 2),
+            disk_mb_after=round(self.store.disk_bytes() / 2 ** 20, 2),
+            seconds=round(time.time() - start, 2),
+        )
+        logger.info(
+            f"Compacted index: {report['vectors_before']} -> {report['vectors_after']} vectors, "
+            f"disk {report['disk_mb_before']} -> {report['disk_mb_after']} MB in {report['seconds']}s"
+        )
+        return report
 
-            body = r.get("content", "")
-            lines.append(f"{header}\n---\n{body}")
+    # --------------------
+    # Stats
+    # --------------------
+    def _estimate_recall(self, sample: int, k: int) -> float:
+        vectors = self._all_vectors()
+        n = len(vectors)
+        rng = np.random.default_rng(0)
+        positions = rng.choice(n, size=min(sample, n), replace=False)
+        queries = vectors[positions]
+        exact = faiss.IndexFlatL2(vectors.shape[1])
+        exact.add(vectors)
+        k = min(k, n)
+        _, truth = exact.search(queries, k)
+        _, found = self._search_ids(queries, k)
+        hits = sum(len(set(t) & set(f[f != -1])) for t, f in zip(truth, found))
+        return hits / float(len(queries) * k)
 
-        if not lines:
-            return "No supporting passages found in the current corpus."
+    def stats(self, estimate_recall: bool = False, sample: int = 100, k: int = 10) -> Dict[str, Any]:
+        """Index layout, memory footprint and (optionally) recall@k.
+
+        Memory is compared against an uncompressed float32 flat index.
+        ``estimate_recall`` runs ``sample`` stored chunks as queries against
+        brute-force ground truth; this loads every vector and is meant for
+        offline inspection, not the request path.
+        """
+        self._ensure_loaded()
+        with self._rw_lock.read():
+            return self._stats(estimate_recall, sample, k)
 
-        return "\n\n".join(lines)
+    def _stats(self, estimate_recall: bool, sample: int, k: int) -> Dict[str, Any]:
+        index = self.db.index
+        n, d = index.ntotal, index.d
+        memory = index_memory_bytes(index)
+        raw = n * d * 4
+        stats: Dict[str, Any] = {
+            "index_kind": index_kind(index),
+            "storage": index_storage(index),
+            "mmap": self.store.use_mmap,
+            "snapshot_version": self._snapshot.get("version", 0),
+            "rescore": bool(self.index_params["rescore"]) and index_storage(index) != "float32",
+            "vectors": n,
+            "dim": d,
+            "index_memory_mb": round(memory / 2 ** 20, 2),
+            "float32_memory_mb": round(raw / 2 ** 20, 2),
+            "compression_ratio": round(raw / memory, 2) if memory else None,
+            "papers": len(self.catalog),
+            "embedding_cache_hits": self.embeddings.cache_hits,
+            "embedding_cache_misses": self.embeddings.cache_misses,
+            "query_cache": self.query_cache.stats(),
+            "semantic_cache": self.semantic_cache.stats() if self.semantic_cache is not None else None,
+            "startup_timings": {k: round(v, 3) for k, v in self.startup_timings.items()},
+        }
+        if estimate_recall and n:
+            stats[f"recall_at_{min(k, n)}"] = round(self._estimate_recall(sample, k), 4)
+        return stats
 
     def save(self) -> None:
-        self.db.save_local("faiss_index")
-        self._save_metadata()
+        """Persist the index (the catalog is committed on every upsert).
+
+        In incremental mode only the chunks added since the last save are
+        written (as one delta segment), so the cost scales with the batch
+        rather than the corpus. A rebuilt (promoted/retrained) index is
+        always written as a new full base. Saving holds the writer lock
+        only, so searches continue while the files are written.
+        """
+        if not self._ready:
+            return  # Nothing was loaded, so nothing can have changed
+        with self._write_lock:
+            self._persist()
+
+    def _persist(self) -> None:
+        """Body of `save()`; the caller holds (or acts for) the writer lock."""
+        if self.persistence == "incremental" and not self._needs_full_save:
+            if self._pending_docs:
+                vectors = np.concatenate(self._pending_vectors)
+                docs = self._pending_docs
+                with self.store.locked():
+                    current = self.store.version() == self._snapshot.get("version", 0)
+                    manifest = self.store.append(vectors, docs, [d.metadata["chunk_id"] for d in docs])
+                # Segments other processes published meanwhile are still missing
+                # here: keep the old version so `reload` picks them up later
+                self._snapshot = manifest if current else {
+                    **self._snapshot, "segments": self._snapshot["segments"] + manifest["segments"][-1:]}
+        else:
+            self._unmap_index()
+            with self.store.locked():
+                self._absorb_published()
+                self._snapshot = self.store.write_base(self.db)
+        self._pending_vectors = []
+        self._pending_docs = []
+        self._needs_full_save = False
+        self._unsaved_chunks = False
@@ -0,0 +1,198 @@
+"""stress_rag.py
+Concurrency stress test for a RAGPipeline shared between threads.
+
+Usage:
+  python stress_rag.py                                # 4 search threads during 20 batches of 50 papers
+  python stress_rag.py --readers 8 --batches 50 --batch-size 100
+  python stress_rag.py --index-mode hnsw --json stress_rag.json
+
+This script will:
+ - Build a fresh pipeline in a temporary working directory (your faiss_index/
+   and catalog are not touched)
+ - Ingest synthetic papers in batches from a writer thread, saving every few batches
+ - Run search threads (plain, year-filtered and batched) for the whole ingestion
+ - Fail on any exception, malformed or wrongly filtered result, or an index
+   that does not match the ingested corpus after a reload
+ - Report search latency percentiles while ingestion was running and how many
+   searches completed while an ingestion batch was in flight
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List
+
+import numpy as np
+
+from bench_embeddings import synthetic_corpus
+from rag_pipeline import RAGPipeline
+
+
+def make_papers(n: int, seed: int = 3) -> List[Dict]:
+    rng = random.Random(seed)
+    return [
+        {
+            "title": f"Synthetic paper {i}",
+            "abstract": text,
+            "authors": "Stress Test",
+            "year": rng.randint(2010, 2025),
+            "source": rng.choice(["arXiv", "PubMed", "Semantic Scholar"]),
+            "url": "",
+        }
+        for i, text in enumerate(synthetic_corpus(n, seed=seed))
+    ]
+
+
+def percentile(values: List[float], q: float) -> float:
+    return round(float(np.percentile(values, q)) * 1000, 2) if values else 0.0
+
+
+def main() -> int:
+    p = argparse.ArgumentParser(description="Parallel searches during ingestion on one shared RAGPipeline")
+    p.add_argument("--readers", type=int, default=4, help="Number of search threads")
+    p.add_argument("--batches", type=int, default=20, help="Number of ingestion batches")
+    p.add_argument("--batch-size", type=int, default=50, help="Papers per ingestion batch")
+    p.add_argument("--save-every", type=int, default=5, help="Call save() after every N batches")
+    p.add_argument("--index-mode", default="flat", choices=["flat", "ivf", "hnsw", "auto"])
+    p.add_argument("--k", type=int, default=5)
+    p.add_argument("--workdir", help="Working directory (default: a fresh temporary directory)")
+    p.add_argument("--keep", action="store_true", help="Keep the working directory afterwards")
+    p.add_argument("--json", help="Write results to this JSON file")
+    args = p.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    json_path = os.path.abspath(args.json) if args.json else None
+    workdir = args.workdir or tempfile.mkdtemp(prefix="rag_stress_")
+    os.makedirs(workdir, exist_ok=True)
+    cwd = os.getcwd()
+    os.chdir(workdir)  # Index, catalog and caches use relative paths
+    print(f"📁 Working directory: {workdir}")
+
+    # Per-search metrics normally go to main.py's tracker; count them here instead
+    searches_logged = [0]
+    RAGPipeline._log_rag_operation = staticmethod(
+        lambda *a, **kw: searches_logged.__setitem__(0, searches_logged[0] + 1))
+
+    papers = make_papers(args.batches * args.batch_size)
+    queries = [" ".join(p["abstract"].split()[:8]) for p in papers[:: max(1, len(papers) // 200)]]
+    errors: List[str] = []
+    latencies: List[float] = []
+    intervals: List[tuple] = []  # (start, end) of every search
+    batch_intervals: List[tuple] = []
+    ingesting = threading.Event()
+    done = threading.Event()
+    lock = threading.Lock()
+    result: Dict[str, Any] = {}  # Set before the try so a failed setup surfaces its own error
+
+    try:
+        rag = RAGPipeline(index_mode=args.index_mode, lazy=False, session_id="stress")
+
+        def reader(seed: int) -> None:
+            rng = random.Random(seed)
+            ingesting.wait()
+            while not done.is_set():
+                start = time.perf_counter()
+                try:
+                    choice = rng.random()
+                    if choice < 0.4:
+                        result_lists = [rag.similarity_search(rng.choice(queries), k=args.k)]
+                    elif choice < 0.7:
+                        year = rng.randint(2012, 2024)
+                        result_lists = [rag.similarity_search(rng.choice(queries), k=args.k, year_from=year)]
+                        if any((r["year"] or 0) < year for r in result_lists[0]):
+                            errors.append(f"year filter violated (year_from={year})")
+                    else:
+                        result_lists = rag.similarity_search_many(rng.sample(queries, 3), k=args.k)
+                    for r in (r for results in result_lists for r in results):
+                        if not isinstance(r.get("content"), str) or "title" not in r:
+                            errors.append(f"malformed result: {r!r:.120}")
+                except Exception as e:
+                    errors.append(f"search failed: {type(e).__name__}: {e}")
+                end = time.perf_counter()
+                with lock:
+                    latencies.append(end - start)
+                    intervals.append((start, end))
+
+        threads = [threading.Thread(target=reader, args=(i,), daemon=True) for i in range(args.readers)]
+        for t in threads:
+            t.start()
+
+        print(f"⚙️  Ingesting {len(papers)} papers in {args.batches} batches with {args.readers} search threads...")
+        ingest_start = time.perf_counter()
+        ingesting.set()
+        try:
+            for b in range(args.batches):
+                start = time.perf_counter()
+                rag.add_papers(papers[b * args.batch_size:(b + 1) * args.batch_size])
+                if (b + 1) % args.save_every == 0:
+                    rag.save()
+                batch_intervals.append((start, time.perf_counter()))
+            rag.save()
+        except Exception as e:
+            errors.append(f"ingestion failed: {type(e).__name__}: {e}")
+        ingest_s = time.perf_counter() - ingest_start
+        done.set()
+        for t in threads:
+            t.join(timeout=60)
+
+        mid_batch = sum(1 for s, e in intervals if any(bs <= s and e <= be for bs, be in batch_intervals))
+        expected = len(rag.paper_ids)
+        ntotal = rag.db.index.ntotal
+        rag.store.wait_for_merge()
+        reloaded = RAGPipeline(index_mode=args.index_mode, lazy=False)
+        if expected != len(papers):
+            errors.append(f"{expected} papers indexed, expected {len(papers)}")
+        if reloaded.db.index.ntotal != ntotal:
+            errors.append(f"reloaded index has {reloaded.db.index.ntotal} vectors, expected {ntotal}")
+        if reloaded.paper_ids != rag.paper_ids or reloaded.chunk_ids != rag.chunk_ids:
+            errors.append(f"reloaded index has {len(reloaded.paper_ids)} papers / {len(reloaded.chunk_ids)} chunks, "
+                          f"expected {len(rag.paper_ids)} / {len(rag.chunk_ids)}")
+
+        result = {
+            "papers": len(papers),
+            "vectors": ntotal,
+            "readers": args.readers,
+            "index_mode": args.index_mode,
+            "ingest_seconds": round(ingest_s, 2),
+            "longest_batch_ms": round(max(e - s for s, e in batch_intervals) * 1000, 2) if batch_intervals else 0.0,
+            "searches": len(latencies),
+            "searches_completed_mid_batch": mid_batch,
+            "search_p50_ms": percentile(latencies, 50),
+            "search_p95_ms": percentile(latencies, 95),
+            "search_p99_ms": percentile(latencies, 99),
+            "search_max_ms": round(max(latencies) * 1000, 2) if latencies else 0.0,
+            "errors": len(errors),
+        }
+    finally:
+        os.chdir(cwd)
+        if not args.keep and not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print("\n" + "=" * 70)
+    for key, value in result.items():
+        print(f"{key:<30}{value}")
+    print("=" * 70)
+    if json_path:
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump({**result, "error_samples": errors[:20]}, f, indent=2)
+        print(f"📊 Results written to {json_path}")
+
+    if errors:
+        print(f"❌ {len(errors)} errors, first: {errors[0]}")
+        return 1
+    if not mid_batch:
+        print("⚠️  No search completed while a batch was being ingested; try larger batches")
+    print("✅ No errors: searches stayed consistent during ingestion and the index reloads intact")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,456 @@
+"""test_rag_pipeline.py
+Regression tests for rag_pipeline.py.
+
+Usage:
+  python -m pytest -q test_rag_pipeline.py
+
+Every test runs in its own temporary directory (the pipeline keeps its index,
+catalog and caches in the working directory). Pipelines use a deterministic
+hashing embedder, so no model download is needed.
+"""
+
+from __future__ import annotations
+
+import multiprocessing
+import os
+import random
+import sys
+import threading
+import zlib
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import faiss
+import numpy as np
+import pytest
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+import rag_pipeline
+from rag_pipeline import (ANN_INDEX_PARAMS, EmbeddingCache, RAGPipeline, SBERTEmbeddings, SegmentedIndexStore,
+                          build_index)
+
+
+DIM = 8
+EMBED_DIM = 64
+WORDS = [f"term{i}" for i in range(400)]
+
+
+class HashingEncoder:
+    """Bag-of-words vectors: texts sharing most words get close embeddings."""
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return EMBED_DIM
+
+    def encode(self, texts, **_):
+        out = np.zeros((len(texts), EMBED_DIM), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for word in text.lower().split():
+                out[i, zlib.crc32(word.encode("utf-8")) % EMBED_DIM] += 1.0
+        return out / np.maximum(np.linalg.norm(out, axis=1, keepdims=True), 1e-9)
+
+
+class HashingEmbeddings(SBERTEmbeddings):
+    def __init__(self):
+        super().__init__(cache_dir=None)
+
+    def load(self) -> None:
+        if self._model is None:
+            self._model = HashingEncoder()
+
+
+@pytest.fixture
+def make_rag(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(RAGPipeline, "_log_rag_operation", staticmethod(lambda *a, **kw: None))
+
+    def make(**kwargs) -> RAGPipeline:
+        rag = RAGPipeline(lazy=True, **kwargs)
+        rag.embeddings = rag.store.embeddings = HashingEmbeddings()
+        rag.warmup()
+        return rag
+
+    return make
+
+
+def abstract(rng: random.Random, words: int = 60) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def test_embedding_cache_keys_with_trailing_nul_survive_reopen(tmp_path):
+    cache = EmbeddingCache("m", DIM, cache_dir=str(tmp_path))
+    keys = [b"\x01" * 19 + b"\x00", b"\x00" * 20, cache.key("text")]
+    vectors = np.arange(len(keys) * DIM, dtype=np.float32).reshape(len(keys), DIM)
+    cache.put_many(keys, vectors)
+
+    reopened = EmbeddingCache("m", DIM, cache_dir=str(tmp_path))
+    found = reopened.get_many(keys)
+    assert set(found) == set(keys)
+    for key, vector in zip(keys, vectors):
+        np.testing.assert_array_equal(found[key], vector)
+
+
+def test_embedding_cache_truncates_torn_record_before_appending(tmp_path):
+    cache = EmbeddingCache("m", DIM, cache_dir=str(tmp_path))
+    first = np.ones((1, DIM), dtype=np.float32)
+    cache.put_many([cache.key("a")], first)
+    with open(cache.path, "ab") as f:
+        f.write(b"\x07" * 11)  # Crash mid-append
+
+    cache = EmbeddingCache("m", DIM, cache_dir=str(tmp_path))
+    assert os.path.getsize(cache.path) == cache._record.itemsize
+    second = np.full((1, DIM), 2.0, dtype=np.float32)
+    cache.put_many([cache.key("b")], second)
+    np.testing.assert_array_equal(cache.get_many([cache.key("b")])[cache.key("b")], second[0])
+
+    reopened = EmbeddingCache("m", DIM, cache_dir=str(tmp_path))
+    assert len(reopened) == 2
+    found = reopened.get_many([reopened.key("a"), reopened.key("b")])
+    np.testing.assert_array_equal(found[reopened.key("a")], first[0])
+    np.testing.assert_array_equal(found[reopened.key("b")], second[0])
+
+
+def test_embedding_cache_append_realigns_after_torn_record_in_process(tmp_path):
+    cache = EmbeddingCache("m", DIM, cache_dir=str(tmp_path))
+    cache.put_many([cache.key("a")], np.ones((1, DIM), dtype=np.float32))
+    with open(cache.path, "ab") as f:
+        f.write(b"\x07" * 5)  # Another writer died mid-append
+    vector = np.full((1, DIM), 3.0, dtype=np.float32)
+    cache.put_many([cache.key("c")], vector)
+    np.testing.assert_array_equal(cache.get_many([cache.key("c")])[cache.key("c")], vector[0])
+
+
+def _append_and_read_back(cache_dir: str, writer: int) -> bool:
+    cache = EmbeddingCache("m", DIM, cache_dir=cache_dir)
+    keys = []
+    for batch in range(200):
+        batch_keys = [cache.key(f"{writer}-{batch}-{i}") for i in range(3)]
+        cache.put_many(batch_keys, np.full((3, DIM), writer * 1000 + batch, dtype=np.float32))
+        keys += batch_keys
+    found = cache.get_many(keys)
+    return [float(found[key][0]) for key in keys] == [writer * 1000 + b for b in range(200) for _ in range(3)]
+
+
+def test_embedding_cache_processes_appending_to_one_file_read_back_their_own_vectors(tmp_path):
+    with ProcessPoolExecutor(4, mp_context=multiprocessing.get_context("fork")) as pool:
+        assert all(pool.map(_append_and_read_back, [str(tmp_path)] * 4, range(4)))
+    assert len(EmbeddingCache("m", DIM, cache_dir=str(tmp_path))) == 4 * 200 * 3
+
+
+def test_stream_ingestion_drops_cross_source_duplicates_across_threads(make_rag):
+    rng = random.Random(4)
+    originals = [
+        {"title": f"Study number {i} of sparse attention", "abstract": abstract(rng), "authors": f"Author{i} Lee",
+         "year": 2020, "source": "arXiv", "url": f"https://arxiv.org/abs/2001.{i:05d}v1"}
+        for i in range(300)
+    ]
+    copies = []
+    for i, p in enumerate(originals[::3]):
+        if i % 3 == 0:  # Same arXiv paper seen by Semantic Scholar
+            copies.append({**p, "title": p["title"].upper() + ".", "abstract": p["abstract"] + " extra",
+                           "source": "Semantic Scholar", "url": "", "arxiv_id": p["url"].rsplit("/", 1)[1]})
+        elif i % 3 == 1:  # Reformatted title, re-typed abstract
+            copies.append({**p, "title": f"{p['title']} (v2)", "abstract": p["abstract"].replace(" ", "  "),
+                           "source": "PubMed", "url": ""})
+        else:  # Abstract near-duplicate under another title
+            words = p["abstract"].split()
+            copies.append({**p, "title": f"Preprint {i}", "abstract": " ".join(words[:-2]), "source": "PubMed",
+                           "url": "", "authors": "Someone Else"})
+    papers = []
+    for i, p in enumerate(originals):  # Copies arrive shortly after their originals
+        papers.append(p)
+        if i % 3 == 0 and i >= 6:
+            papers.append(copies[i // 3 - 2])
+    papers.extend(copies[-2:])
+
+    rag = make_rag(index_mode="flat")
+    # Switch threads often so the producer's duplicate checks overlap the worker's commits
+    previous = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        report = rag.add_papers_stream(papers, batch_size=16, queue_batches=2, save_every=None)
+    finally:
+        sys.setswitchinterval(previous)
+
+    assert report["papers_added"] == len(originals)
+    assert report["near_duplicates"] == len(copies)
+    assert len(rag.catalog) == len(originals)
+    assert rag.db.index.ntotal == report["chunks_added"]
+
+
+def test_searches_during_ingestion_stay_consistent(make_rag):
+    rng = random.Random(9)
+    papers = [{"title": f"Paper {i}", "abstract": abstract(rng), "year": 2010 + i % 15, "source": "arXiv"}
+              for i in range(240)]
+    queries = [" ".join(p["abstract"].split()[:8]) for p in papers[::12]]
+    rag = make_rag(index_mode="flat")
+    rag.add_papers(papers[:20])
+    errors = []
+    searches = [0]
+    done = threading.Event()
+
+    def reader(seed: int) -> None:
+        rng = random.Random(seed)
+        while not done.is_set():
+            try:
+                year = rng.randint(2012, 2024)
+                results = rag.similarity_search(rng.choice(queries), k=5, year_from=year)
+                if any((r["year"] or 0) < year for r in results):
+                    errors.append(f"year filter violated (year_from={year})")
+                for results in [results] + rag.similarity_search_many(rng.sample(queries, 3), k=5):
+                    if not results or any(not isinstance(r.get("content"), str) for r in results):
+                        errors.append(f"malformed results: {results!r:.120}")
+            except Exception as e:
+                errors.append(f"{type(e).__name__}: {e}")
+            searches[0] += 1
+
+    threads = [threading.Thread(target=reader, args=(i,), daemon=True) for i in range(3)]
+    previous = sys.getswitchinterval()
+    sys.setswitchinterval(1e-5)
+    try:
+        for t in threads:
+            t.start()
+        for start in range(20, len(papers), 20):
+            rag.add_papers(papers[start:start + 20])
+            if start % 60 == 0:
+                rag.save()
+    finally:
+        done.set()
+        for t in threads:
+            t.join(timeout=60)
+        sys.setswitchinterval(previous)
+
+    assert errors == []
+    assert searches[0] > 0
+    assert len(rag.paper_ids) == len(papers)
+    rag.save()
+    rag.store.wait_for_merge()
+    assert make_rag(index_mode="flat").chunk_ids == rag.chunk_ids
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_failed_ingestion_can_be_retried(make_rag, stream):
+    rng = random.Random(2)
+    papers = [{"title": f"Retry paper {i}", "abstract": abstract(rng, 200), "year": 2021, "source": "arXiv"}
+              for i in range(6)]
+    rag = make_rag(index_mode="flat")
+    embed = rag.embeddings.embed_documents_array
+    calls = []
+
+    def flaky(texts):
+        calls.append(len(texts))
+        if len(calls) == (2 if stream else 1):  # Stream: fail after the first batch is committed
+            raise RuntimeError("embedding backend unavailable")
+        return embed(texts)
+
+    rag.embeddings.embed_documents_array = flaky
+    ingest = (lambda: rag.add_papers_stream(papers, batch_size=4, save_every=None)) if stream \
+        else (lambda: rag.add_papers(papers))
+    with pytest.raises(RuntimeError):
+        ingest()
+    if not stream:  # A failed add_papers commits nothing
+        assert rag.db.index.ntotal == 0 and not rag.paper_ids and not rag.chunk_ids
+
+    report = ingest()
+    assert report["papers_added"] == len(papers)
+    assert report["papers_skipped"] == 0
+    assert len(rag.catalog) == len(papers)
+    texts = {rag._doc_at(i).page_content for i in range(rag.db.index.ntotal)}
+    assert len(texts) == rag.db.index.ntotal == len(rag.chunk_ids)
+
+
+def test_semantic_cache_answers_a_paraphrase_but_not_another_topic(make_rag):
+    rng = random.Random(5)
+    papers = [{"title": f"Paper {i}", "abstract": abstract(rng), "year": 2022, "source": "arXiv"} for i in range(20)]
+    papers[2]["abstract"] += " lightweight transformer efficiency"
+    papers[3]["abstract"] += " sparse attention bert"
+    papers[7]["abstract"] += " sparse attention gpt"
+    # Hashing embeddings put this paraphrase pair at cosine 1/3 and the BERT/GPT pair at 3/4
+    rag = make_rag(index_mode="flat", semantic_cache_threshold=0.3)
+    rag.add_papers(papers)
+
+    first = rag.similarity_search("lightweight transformer efficiency", k=3)
+    assert rag.similarity_search("efficient lightweight transformers", k=3) == first
+    assert rag.semantic_cache.hits == 1
+
+    rag.similarity_search("efficient sparse attention in bert", k=3)
+    gpt = rag.similarity_search("efficient sparse attention in gpt", k=3)
+    assert rag.semantic_cache.hits == 1
+    assert gpt[0]["title"] == "Paper 7"
+
+
+def test_semantic_cache_lets_only_corpus_wide_terms_differ(make_rag):
+    rng = random.Random(8)
+    papers = [{"title": f"Paper {i}", "abstract": abstract(rng) + " neural", "year": 2022, "source": "arXiv"}
+              for i in range(20)]
+    papers[3]["abstract"] += " sparse attention bert"
+    rag = make_rag(index_mode="flat", semantic_cache_threshold=0.3)
+    rag.add_papers(papers)
+
+    rag.similarity_search("sparse attention bert", k=3)
+    rag.similarity_search("sparse attention bert pruning", k=3)
+    assert rag.semantic_cache.hits == 0  # No BM25 index yet, so no term counts as generic
+    rag._ensure_lexical()
+    rag.similarity_search("neural sparse attention bert", k=3)
+    assert rag.semantic_cache.hits == 1
+
+
+def test_reader_that_rebuilt_its_index_still_reloads(make_rag):
+    rng = random.Random(6)
+    papers = [{"title": f"Reload paper {i}", "abstract": abstract(rng), "year": 2023, "source": "arXiv"}
+              for i in range(12)]
+    writer = make_rag(index_mode="flat")
+    writer.add_papers(papers[:6])
+    writer.save()
+
+    reader = make_rag(index_mode="hnsw")  # Converts the flat snapshot in memory, never saves
+    assert reader._needs_full_save
+    writer.add_papers(papers[6:])
+    writer.save()
+
+    assert reader.reload()
+    assert reader.db.index.ntotal == writer.db.index.ntotal
+    assert len(reader.paper_ids) == len(papers)
+
+
+def test_fingerprints_load_without_walking_the_docstore(make_rag, monkeypatch):
+    rng = random.Random(7)
+    papers = [{"title": f"Startup paper {i}", "abstract": abstract(rng, 150), "year": 2024, "source": "arXiv"}
+              for i in range(10)]
+    rag = make_rag(index_mode="flat")
+    rag.add_papers(papers[:6])
+    rag.save()
+    rag.add_papers(papers[6:])  # Saved as a delta segment, replayed on load
+    rag.save()
+
+    def walk(docstore):
+        raise AssertionError("docstore metadata walked at startup")
+
+    monkeypatch.setattr(rag_pipeline, "docstore_metadata", walk)
+    loaded = make_rag(index_mode="flat")
+    assert loaded.chunk_ids == rag.chunk_ids
+    assert loaded.paper_ids == rag.paper_ids and len(loaded.paper_ids) == len(papers)
+    assert loaded.add_papers(papers)["papers_added"] == 0
+
+
+def test_reading_ivf_vectors_leaves_the_live_index_unmodified(make_rag):
+    rng = random.Random(8)
+    papers = [{"title": f"IVF paper {i}", "abstract": abstract(rng), "year": 2024, "source": "arXiv"}
+              for i in range(200)]
+    rag = make_rag(index_mode="ivf")
+    rag.add_papers(papers)
+    ivf = faiss.extract_index_ivf(rag.db.index)
+    assert ivf.direct_map.type == faiss.DirectMap.NoMap
+
+    stats = rag.stats(estimate_recall=True, sample=20)  # Reads every vector under the shared lock
+    assert ivf.direct_map.type == faiss.DirectMap.NoMap
+    assert stats["index_kind"] == "ivf" and stats["recall_at_10"] > 0
+    expected = rag.embeddings.embed_documents_array([rag._doc_at(i).page_content for i in range(5)])
+    np.testing.assert_allclose(rag._all_vectors()[:5], expected, rtol=1e-5, atol=1e-6)
+
+
+@pytest.mark.parametrize("kind", ["flat", "ivf", "hnsw"])
+def test_build_index_honours_pq_nbits(kind):
+    vectors = np.random.default_rng(0).random((2000, 16), dtype=np.float32)
+    index = build_index(kind, vectors, {**ANN_INDEX_PARAMS, "storage": "pq", "pq_m": 4, "pq_nbits": 6})
+    inner = index.storage if kind == "hnsw" else faiss.extract_index_ivf(index) if kind == "ivf" else index
+    assert faiss.downcast_index(inner).pq.nbits == 6
+
+
+def test_search_uses_one_citation_format_with_or_without_a_budget(make_rag):
+    rng = random.Random(9)
+    papers = [{"title": f"Format paper {i}", "abstract": abstract(rng, 150), "authors": "A. One, B. Two, C. Three",
+               "year": 2021, "source": "arXiv", "url": f"https://example.org/{i}"} for i in range(8)]
+    rag = make_rag(index_mode="flat")
+    rag.add_papers(papers)
+    query = papers[2]["abstract"][:80]
+
+    unpacked = rag.search(query, k=4)
+    assert unpacked == rag.search(query, k=4, token_budget=10 ** 6)
+    assert unpacked.startswith("[P1] Format paper 2 — A. One et al. (2021, arXiv) https://example.org/2\n- ")
+    blocks = rag.search_many([query, query], k=4)
+    assert "(see above)" in blocks[1] and blocks[0] == unpacked
+
+
+@pytest.mark.parametrize("full_save", ["persistence", "compact"])
+def test_full_save_keeps_chunks_another_writer_published(make_rag, full_save):
+    rng = random.Random(10)
+    papers = [{"title": f"Shared paper {i}", "abstract": abstract(rng, 40), "year": 2022, "source": "arXiv"}
+              for i in range(20)]
+    a = make_rag(index_mode="flat")
+    b = make_rag(index_mode="flat", persistence="full" if full_save == "persistence" else "incremental")
+    a.add_papers(papers[:10])
+    a.save()
+    b.add_papers(papers[10:])
+    b.save()  # persistence="full" rewrites the base; a's segment must not be dropped
+    expected = {p["title"] for p in papers}
+    if full_save == "compact":
+        orphan = next(pid for pid in b.paper_ids if b.catalog.get(pid)["title"] == "Shared paper 19")
+        with b.catalog._conn:
+            b.catalog._conn.execute("DELETE FROM papers WHERE paper_id = ?", (orphan,))
+        assert b.compact()["vectors_after"] == 19  # Rewrites the base without the orphan
+        expected.discard("Shared paper 19")
+
+    loaded = make_rag(index_mode="flat")
+    assert {loaded._doc_at(i).metadata["title"] for i in range(loaded.db.index.ntotal)} == expected
+    assert loaded.db.index.ntotal == len(expected)
+
+
+def test_concurrent_appends_from_two_stores_keep_every_segment(tmp_path):
+    path = str(tmp_path / "index")
+    stores = [SegmentedIndexStore(None, path=path, merge_threshold=10 ** 6) for _ in range(2)]
+
+    def write(worker: int) -> None:
+        for i in range(25):
+            doc_id = f"{worker}-{i}"
+            stores[worker].append(np.zeros((1, DIM), dtype=np.float32),
+                                  [Document(page_content=doc_id, metadata={})], [doc_id])
+
+    previous = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        with ThreadPoolExecutor(2) as pool:
+            list(pool.map(write, range(2)))
+    finally:
+        sys.setswitchinterval(previous)
+
+    manifest = stores[0].read_manifest()
+    assert len(set(manifest["segments"])) == len(manifest["segments"]) == 50
+    assert manifest["version"] == 50
+    ids = {stores[0].read_segment(name)[2][0] for name in manifest["segments"]}
+    assert len(ids) == 50
+
+
+def test_papers_lost_before_save_can_be_ingested_again(make_rag):
+    rng = random.Random(11)
+    papers = [{"title": f"Unsaved paper {i}", "abstract": abstract(rng, 40), "year": 2022, "source": "arXiv"}
+              for i in range(10)]
+    rag = make_rag(index_mode="flat")
+    rag.add_papers(papers[:5])
+    rag.save()
+    rag.add_papers(papers[5:])  # Catalog rows are committed, the chunks never saved (crash)
+
+    reopened = make_rag(index_mode="flat")
+    assert reopened.db.index.ntotal == 5
+    report = reopened.add_papers(papers)
+    assert (report["papers_added"], report["papers_skipped"]) == (5, 5)
+
+
+def test_session_search_finds_chunks_of_a_legacy_index(make_rag, tmp_path):
+    rng = random.Random(12)
+    papers = [{"title": f"Legacy paper {i}", "abstract": abstract(rng, 40), "authors": "Ada Lee", "year": 2019,
+               "source": "arXiv", "url": f"https://arxiv.org/abs/1901.{i:05d}"} for i in range(10)]
+    embeddings = HashingEmbeddings()
+    legacy = FAISS(embeddings, faiss.IndexFlatL2(EMBED_DIM), InMemoryDocstore({}), {})
+    texts = [p["abstract"] for p in papers]  # Earlier versions: no paper_id / chunk_id in metadata
+    legacy.add_embeddings(list(zip(texts, embeddings.embed_documents_array(texts).tolist())),
+                          metadatas=[{k: p[k] for k in ("title", "source", "authors", "year", "url")} for p in papers],
+                          ids=[f"uuid-{i}" for i in range(len(papers))])
+    legacy.save_local(str(tmp_path / "faiss_index"))
+
+    rag = make_rag(index_mode="flat", session_id="s2")
+    report = rag.add_papers(papers)  # The agents fetch the same papers again in a new session
+    assert report["papers_skipped"] == len(papers) and report["chunks_added"] == 0
+    found = rag.similarity_search(papers[3]["abstract"], k=4, sessions="s2")
+    assert len(found) == 4 and found[0]["title"] == "Legacy paper 3"
+    assert not rag.similarity_search(papers[3]["abstract"], k=4, sessions="s1")
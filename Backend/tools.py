@@ -1,7 +1,25 @@
 # tools.py
 from crewai.tools import tool
 from langchain_community.tools import DuckDuckGoSearchRun
-from typing import Optional
+from typing import Any, Dict, List, Optional, Tuple
+
+GLOBAL_PREFIX = "global:"
+# Evidence returned per tool call, in estimated tokens (OllamaLLM cuts
+# prompts at 4000 characters, so full-length passages would be dropped)
+EVIDENCE_TOKEN_BUDGET = 700
+
+
+def _split_queries(text: str) -> List[str]:
+    """Split a tool input into sub-queries, one per non-empty line."""
+    return [line.strip(" -*\t") for line in (text or "").splitlines() if line.strip(" -*\t")]
+
+
+def _split_scope(text: str) -> Tuple[bool, str]:
+    """Strip an optional leading "global:" opt-in; returns (global, rest)."""
+    stripped = (text or "").lstrip()
+    if stripped.lower().startswith(GLOBAL_PREFIX):
+        return True, stripped[len(GLOBAL_PREFIX):].lstrip()
+    return False, text
 
 
 # Placeholder for dynamic RAG tool
@@ -10,15 +28,43 @@ class RAGTool:
 
     The actual RAGPipeline object is injected in main.py so this
     module stays importable without side effects.
+
+    Searches are scoped to the papers of the current research session
+    (``rag.session_id``) so passages from earlier, unrelated reviews in
+    the shared index do not leak in. Prefixing the input with "global:"
+    searches the whole corpus; with ``global_fallback`` a session search
+    that finds nothing is retried globally.
+
+    Results are packed into ``token_budget`` estimated tokens (see
+    `RAGPipeline.search`); None returns every passage in full.
     """
 
-    def __init__(self):
+    def __init__(self, global_fallback: bool = False, token_budget: Optional[int] = EVIDENCE_TOKEN_BUDGET):
         self.rag = None  # Set externally in main.py
+        self.global_fallback = global_fallback
+        self.token_budget = token_budget
+
+    def scope_filters(self, use_global: bool = False) -> Dict[str, Any]:
+        """Search keyword arguments for the session (or global) scope."""
+        if use_global or self.rag is None or not getattr(self.rag, "session_id", None):
+            return {}
+        return {"sessions": self.rag.session_id, "global_fallback": self.global_fallback}
 
     def run(self, query: str) -> str:
         if self.rag is None:
             return "RAG not initialized. No local corpus is available."
-        return self.rag.search(query)
+        use_global, query = _split_scope(query)
+        queries = _split_queries(query)
+        if len(queries) > 1:
+            return self.run_many(queries, use_global)
+        return self.rag.search(query, token_budget=self.token_budget, **self.scope_filters(use_global))
+
+    def run_many(self, queries: List[str], use_global: bool = False) -> str:
+        """Search several sub-queries in one batched embedding + index call."""
+        if self.rag is None:
+            return "RAG not initialized. No local corpus is available."
+        blocks = self.rag.search_many(queries, token_budget=self.token_budget, **self.scope_filters(use_global))
+        return "\n\n".join(f"### Query: {q}\n{block}" for q, block in zip(queries, blocks))
 
 
 class CitationVerifier:
@@ -33,6 +79,17 @@ class CitationVerifier:
     and must surface uncertainty when evidence is weak or absent.
     """
 
+    NO_EVIDENCE = (
+        "⚠️ Unable to find strong supporting evidence for this claim in the current corpus.\n"
+        "Use cautious language, mark this as uncertain, and avoid inventing citations."
+    )
+    HEADER = (
+        "Below are the most relevant passages from the indexed literature. "
+        "Only treat the claim as strongly supported if at least one passage "
+        "directly states or numerically supports it. If not, mark it as "
+        "partially supported or unsupported and explain the gap.\n"
+    )
+
     def __init__(self, rag_tool: Optional[RAGTool] = None):
         self._rag_tool = rag_tool
 
@@ -40,20 +97,32 @@ class CitationVerifier:
         if self._rag_tool is None or self._rag_tool.rag is None:
             return "Citation verifier unavailable: RAG corpus not initialized."
 
-        evidence = self._rag_tool.rag.search(claim, k=6)
+        use_global, claim = _split_scope(claim)
+        claims = _split_queries(claim)
+        if len(claims) > 1:
+            return self.run_many(claims, use_global)
+
+        evidence = self._rag_tool.rag.search(claim, k=6, token_budget=self._rag_tool.token_budget,
+                                             **self._rag_tool.scope_filters(use_global))
         if "No supporting passages found" in evidence:
-            return (
-                "⚠️ Unable to find strong supporting evidence for this claim in the current corpus.\n"
-                "Use cautious language, mark this as uncertain, and avoid inventing citations."
-            )
+            return self.NO_EVIDENCE
+
+        return self.HEADER + "\n" + evidence
+
+    def run_many(self, claims: List[str], use_global: bool = False) -> str:
+        """Retrieve evidence for several claims with one batched search."""
+        if self._rag_tool is None or self._rag_tool.rag is None:
+            return "Citation verifier unavailable: RAG corpus not initialized."
 
-        header = (
-            "Below are the most relevant passages from the indexed literature. "
-            "Only treat the claim as strongly supported if at least one passage "
-            "directly states or numerically supports it. If not, mark it as "
-            "partially supported or unsupported and explain the gap.\n"
-        )
-        return header + "\n" + evidence
+        filters = self._rag_tool.scope_filters(use_global)
+        sections = []
+        evidence_blocks = self._rag_tool.rag.search_many(claims, k=6, token_budget=self._rag_tool.token_budget,
+                                                         **filters)
+        for claim, evidence in zip(claims, evidence_blocks):
+            if "No supporting passages found" in evidence:
+                evidence = self.NO_EVIDENCE
+            sections.append(f"### Claim: {claim}\n{evidence}")
+        return self.HEADER + "\n" + "\n\n".join(sections)
 
 
 # External tools (fallback, e.g., for metadata lookups beyond local corpus)
@@ -68,6 +137,9 @@ citation_verifier = CitationVerifier(rag_tool)
 def rag_tool_instance(query: str) -> str:
     """Search the locally indexed academic literature using semantic similarity.
     Always use this before answering, and cite passages using their [P#] handles.
+    To search several sub-queries at once, put each one on its own line.
+    Only papers retrieved for the current research session are searched; start the
+    input with "global:" to search every previously indexed paper as well.
     
     Args:
         query: The search query string
@@ -81,6 +153,8 @@ def rag_tool_instance(query: str) -> str:
 def citation_verifier_tool(claim: str) -> str:
     """Retrieve evidence passages related to a specific factual claim from the local corpus.
     Use it to check whether a claim is strongly supported, partially supported, or unsupported.
+    To check several claims at once, put each claim on its own line.
+    Start the input with "global:" to look beyond the current session's papers.
     
     Args:
         claim: The factual claim to verify